@@ -1,6 +1,11 @@
 from functools import reduce 
-from datetime import datetime, timedelta 
+from datetime import datetime, timedelta
+from habit import period_ordinal
+import parallel
+import vectorized
+import instrument
 
+@instrument.timed("analytics.get_all_habits")
 def get_all_habits(storage):
     """
     Get all habits
@@ -14,6 +19,7 @@ def get_all_habits(storage):
 
     return storage.get_all_habits()
 
+@instrument.timed("analytics.get_habits_by_periodicity")
 def get_habits_by_periodicity(storage, periodicity):
     """
     Get all habits with a specific periodicity
@@ -28,12 +34,15 @@ def get_habits_by_periodicity(storage, periodicity):
 
     return list(filter(lambda habit: habit.periodicity == periodicity, storage.get_all_habits()))
 
-def get_longest_streak_habit(storage):
+@instrument.timed("analytics.get_longest_streak_habit")
+def get_longest_streak_habit(storage, executor=None):
     """
-    Get the habit with the longest streak
+    Get the habit with the longest streak ever recorded
 
     Args:
         storage: the storage instance
+        executor: optional concurrent.futures executor, e.g. a ProcessPoolExecutor,
+            that computes the streaks of chunks of habits in parallel
 
     Returns:
         the habit with the longest streak and the streak leangth
@@ -42,13 +51,17 @@ def get_longest_streak_habit(storage):
     habits = storage.get_all_habits()
     if not habits:
         return None, 0
+
+    if executor is not None:
+        return parallel.longest_streak_habit(habits, executor)
     
     # map habits to (habit, streak) tuples
-    habit_streak = list(map(lambda habit: (habit, habit.get_current_streak()), habits))
+    habit_streak = list(map(lambda habit: (habit, habit.get_longest_streak()), habits))
 
     # find the habit with the longest streak
     return reduce(lambda x, y: x if x[1] > y[1] else y, habit_streak)
 
+@instrument.timed("analytics.get_streak_for_habit")
 def get_streak_for_habit(habit):
     """
     Get the current streak for a specific habit
@@ -62,12 +75,49 @@ def get_streak_for_habit(habit):
 
     return habit.get_current_streak()
 
-def get_completion_rate(storage, days=30):
+@instrument.timed("analytics.get_longest_streak_for_habit")
+def get_longest_streak_for_habit(habit):
+    """
+    Get the longest streak ever recorded for a specific habit
+
+    Args:
+        habit to be checked
+
+    Returns:
+        longest streak for the habit
+    """
+
+    return habit.get_longest_streak()
+
+@instrument.timed("analytics.get_streak_runs_for_habit")
+def get_streak_runs_for_habit(habit):
+    """
+    Get the length of every streak of a specific habit
+
+    Args:
+        habit to be checked
+
+    Returns:
+        list of streak lengths, oldest first
+    """
+
+    return habit.get_streak_runs()
+
+@instrument.timed("analytics.get_completion_rate")
+def get_completion_rate(storage, days=30, use_numpy=False, executor=None):
     """
     Calculate the completion rate for all habits over a specifed time period
 
+    the completed periods are counted from each habit's rollup with two binary
+    searches, so the cost does not grow with the completion history
+
     Args:
         storage instance
+        days: number of days to look back
+        use_numpy: use the vectorized NumPy engine instead of the rollups when
+            NumPy is installed
+        executor: optional concurrent.futures executor, e.g. a ProcessPoolExecutor,
+            that computes the rates of chunks of habits in parallel
 
     Returns:
         Dictionary that maps habit names to completion rates (0-100%)
@@ -76,6 +126,11 @@ def get_completion_rate(storage, days=30):
     habits = storage.get_all_habits()
     today = datetime.now()
 
+    if executor is not None:
+        return parallel.completion_rates(habits, days, executor, today=today)
+    if use_numpy and vectorized.HAS_NUMPY:
+        return vectorized.completion_rates(habits, days, today)
+
     result = {}
 
     for habit in habits:
@@ -85,19 +140,10 @@ def get_completion_rate(storage, days=30):
         else: # weekly
             total_periods = days // 7
 
-        # count completed periods
-        completed_periods = 0 
-        current_date = today
-
-        for _ in range(total_periods):
-            if habit.is_complete_for_period(current_date):
-                completed_periods += 1
-
-            # move to the previous period
-            if habit.periodicity == 'daily':
-                current_date -= timedelta(days=1)
-            else: # weekly
-                current_date -= timedelta(days=7)
+        # count completed periods, the window ends with the current period
+        current = period_ordinal(today, habit.periodicity)
+        periods = habit.get_rollup().periods(habit.periodicity)
+        completed_periods = periods.completed_between(current - total_periods + 1, current + 1)
                 
         # calculate completion rate
         if total_periods > 0:
@@ -109,6 +155,194 @@ def get_completion_rate(storage, days=30):
 
     return result
 
+@instrument.timed("analytics.get_all_streaks")
+def get_all_streaks(storage, use_numpy=False, executor=None):
+    """
+    Get the current and longest streak of every habit
+
+    Args:
+        storage instance
+        use_numpy: use the vectorized NumPy engine when NumPy is installed. it
+            recomputes every streak, so it only beats the cached streaks of
+            habits whose completions all changed
+        executor: optional concurrent.futures executor, e.g. a ProcessPoolExecutor,
+            that computes the streaks of chunks of habits in parallel
+
+    Returns:
+        Dictionary that maps habit names to (current streak, longest streak)
+    """
+
+    habits = storage.get_all_habits()
+
+    if executor is not None:
+        return parallel.streaks(habits, executor)
+
+    if use_numpy and vectorized.HAS_NUMPY:
+        return vectorized.streaks(habits)
+
+    return {habit.name: (habit.get_current_streak(), habit.get_longest_streak()) for habit in habits}
+
+@instrument.timed("analytics.get_completion_histogram")
+def get_completion_histogram(storage, periods=4, use_numpy=False):
+    """
+    Count the completions of every habit in each of the most recent periods
+
+    Args:
+        storage instance
+        periods: number of periods to count, including the current one
+        use_numpy: use the vectorized NumPy engine instead of the rollups when
+            NumPy is installed
+
+    Returns:
+        Dictionary that maps habit names to lists of counts, oldest period first
+    """
+
+    habits = storage.get_all_habits()
+    today = datetime.now()
+
+    if use_numpy and vectorized.HAS_NUMPY:
+        return vectorized.completion_histograms(habits, periods, today)
+
+    result = {}
+    for habit in habits:
+        first = period_ordinal(today, habit.periodicity) - periods + 1
+        rollup = habit.get_rollup().periods(habit.periodicity)
+        result[habit.name] = [rollup.completions_between(ordinal, ordinal + 1) for ordinal in range(first, first + periods)]
+
+    return result
+
+def get_window_ordinals(start, end, periodicity):
+    """
+    Get the range of period ordinals that overlap a time window
+
+    Args:
+        start: start of the window (inclusive)
+        end: end of the window (exclusive)
+        periodicity: 'daily' or 'weekly'
+
+    Returns:
+        tuple of (first ordinal, end ordinal), the end is exclusive
+    """
+    return period_ordinal(start, periodicity), period_ordinal(end - timedelta(microseconds=1), periodicity) + 1
+
+@instrument.timed("analytics.get_window_stats_for_habit")
+def get_window_stats_for_habit(habit, start, end):
+    """
+    Get the completion statistics of a habit for a time window
+
+    every period that overlaps the window counts as a whole, so a weekly habit
+    gets one period per week the window touches. counts come from the prefix
+    sums of the habit's rollup and take two binary searches
+
+    Args:
+        habit: habit to be checked
+        start: start of the window (inclusive)
+        end: end of the window (exclusive)
+
+    Returns:
+        dictionary with the completions, completed periods, total periods,
+        completion rate (0-100%) and longest streak inside the window
+    """
+    first, last = get_window_ordinals(start, end, habit.periodicity)
+    periods = habit.get_rollup().periods(habit.periodicity)
+    completed = periods.completed_between(first, last)
+    total = last - first
+    return {
+        'completions': periods.completions_between(first, last),
+        'completed_periods': completed,
+        'total_periods': total,
+        'completion_rate': completed / total * 100 if total > 0 else 0,
+        # a window without completions has no streak to look for
+        'longest_streak': habit.get_longest_streak_between(first, last) if completed else 0,
+    }
+
+def _combine_window_stats(stats):
+    """
+    add up the window statistics of several habits
+
+    Args:
+        stats: iterable of dictionaries from get_window_stats_for_habit
+
+    Returns:
+        dictionary with the summed counts, overall rate and longest streak
+    """
+    combined = {'completions': 0, 'completed_periods': 0, 'total_periods': 0, 'longest_streak': 0}
+    for habit_stats in stats:
+        combined['completions'] += habit_stats['completions']
+        combined['completed_periods'] += habit_stats['completed_periods']
+        combined['total_periods'] += habit_stats['total_periods']
+        combined['longest_streak'] = max(combined['longest_streak'], habit_stats['longest_streak'])
+
+    total = combined['total_periods']
+    combined['completion_rate'] = combined['completed_periods'] / total * 100 if total > 0 else 0
+    return combined
+
+def _month_windows(start, end):
+    """
+    split a time window at month boundaries
+
+    Args:
+        start: start of the window (inclusive)
+        end: end of the window (exclusive)
+
+    Returns:
+        list of (month key 'YYYY-MM', window start, window end) tuples
+    """
+    windows = []
+    window_start = start
+    while window_start < end:
+        year, month = window_start.year, window_start.month
+        next_month = datetime(year + month // 12, month % 12 + 1, 1)
+        window_end = min(next_month, end)
+        windows.append((f"{year:04d}-{month:02d}", window_start, window_end))
+        window_start = window_end
+    return windows
+
+@instrument.timed("analytics.get_window_stats")
+def get_window_stats(storage, start, end, group_by='habit'):
+    """
+    Get completion statistics for an arbitrary time window
+
+    Args:
+        storage instance
+        start: start of the window (inclusive)
+        end: end of the window (exclusive)
+        group_by: 'habit' for one entry per habit name, 'periodicity' for one
+            entry per periodicity or 'month' for one entry per calendar month
+            ('YYYY-MM') with all habits combined. a weekly period that spans
+            two months counts in both
+
+    Returns:
+        Dictionary that maps the groups to dictionaries with the completions,
+        completed periods, total periods, completion rate (0-100%) and longest streak
+    """
+    if end <= start:
+        raise ValueError("The window must end after it starts")
+
+    habits = storage.get_all_habits()
+
+    if group_by == 'habit':
+        return {habit.name: get_window_stats_for_habit(habit, start, end) for habit in habits}
+
+    if group_by == 'periodicity':
+        return {
+            periodicity: _combine_window_stats(
+                get_window_stats_for_habit(habit, start, end) for habit in habits if habit.periodicity == periodicity
+            )
+            for periodicity in ['daily', 'weekly']
+        }
+
+    if group_by == 'month':
+        return {
+            month: _combine_window_stats(
+                get_window_stats_for_habit(habit, month_start, month_end) for habit in habits
+            )
+            for month, month_start, month_end in _month_windows(start, end)
+        }
+
+    raise ValueError(f"Unknown grouping '{group_by}', expected 'habit', 'periodicity' or 'month'")
+
+@instrument.timed("analytics.get_habits_completed_today")
 def get_habits_completed_today(storage):
     """
     get all habits completed today
@@ -119,9 +353,10 @@ def get_habits_completed_today(storage):
     Returns:
         list of habits done today
     """
-    today = datetime.now()
-    return list(filter(lambda habit: habit.is_complete_for_period(today), storage.get_all_habits()))
+    completed_ids = storage.get_completed_habit_ids(datetime.now())
+    return list(filter(lambda habit: habit.id in completed_ids, storage.get_all_habits()))
 
+@instrument.timed("analytics.get_habits_to_complete_today")
 def get_habits_to_complete_today(storage):
     """
     Get all habits that need to be comleted today
@@ -134,12 +369,13 @@ def get_habits_to_complete_today(storage):
     """
     today = datetime.now()
     all_habits = storage.get_all_habits()
+    completed_ids = storage.get_completed_habit_ids(today)
 
     # filter daily habits and weekly habits that are due today
     return list(filter(
         lambda habit: (
             habit.periodicity == 'daily' or 
             (habit.periodicity == 'weekly' and today.weekday() == 0) # monday
-        ) and not habit.is_complete_for_period(today),
+        ) and habit.id not in completed_ids,
         all_habits
     ))
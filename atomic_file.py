@@ -0,0 +1,48 @@
+import contextlib
+import os
+import tempfile
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w", sync=True):
+    """
+    Write a file through a temporary file that replaces it once complete
+
+    a crash while writing never leaves a half written file at path, readers
+    see either the old or the new contents. every write gets its own temporary
+    file, so processes writing the same file at once do not clash
+
+    Args:
+        path: path of the file
+        mode: 'w' for text or 'wb' for bytes
+        sync: flush the contents to disk before the file is replaced, false for
+            files that can be rebuilt like caches
+
+    Returns:
+        context manager that gives the open temporary file
+    """
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory or ".")
+    try:
+        with open(fd, mode) as f:
+            yield f
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+def file_signature(path):
+    """
+    Get the size and modification time that identify a version of a file
+
+    Args:
+        path: path of the file
+
+    Returns:
+        tuple of (size in bytes, modification time in nanoseconds)
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
@@ -0,0 +1,231 @@
+import argparse
+import contextlib
+import json
+import shlex
+import sys
+from habit import Habit, habit_summary
+import analytics
+import bulk
+
+class BatchArgumentParser(argparse.ArgumentParser):
+    """An argument parser that raises ValueError instead of exiting, so one bad operation does not stop a batch"""
+
+    def error(self, message):
+        """report a parse error to the caller"""
+        raise ValueError(message)
+
+def build_parser():
+    """
+    Build the parser for a single batch operation
+
+    Returns:
+        the argument parser
+    """
+    parser = BatchArgumentParser(prog="main.py", description="Run habit tracker operations without the menu")
+    operations = parser.add_subparsers(dest="operation", required=True)
+
+    list_parser = operations.add_parser("list", help="list habits")
+    list_parser.add_argument("--periodicity", choices=["daily", "weekly"], help="only list habits with this periodicity")
+
+    add_parser = operations.add_parser("add", help="add a habit")
+    add_parser.add_argument("name", help="name of the habit")
+    add_parser.add_argument("--periodicity", choices=["daily", "weekly"], default="daily", help="how often to complete it")
+    add_parser.add_argument("--description", default="", help="description of the habit")
+
+    complete_parser = operations.add_parser("complete", help="complete a habit")
+    complete_parser.add_argument("habit", help="ID or name of the habit")
+
+    show_parser = operations.add_parser("show", help="show a habit with its recent completions")
+    show_parser.add_argument("habit", help="ID or name of the habit")
+
+    delete_parser = operations.add_parser("delete", help="delete a habit")
+    delete_parser.add_argument("habit", help="ID or name of the habit")
+
+    stats_parser = operations.add_parser("stats", help="completion rates and streaks of all habits")
+    stats_parser.add_argument("--days", type=int, default=30, help="days to look back for completion rates")
+
+    import_parser = operations.add_parser("import", help="import completions from a CSV or JSON Lines file")
+    import_parser.add_argument("path", help="file to import")
+    import_parser.add_argument("--format", choices=["csv", "jsonl"], help="file format, taken from the extension by default")
+    import_parser.add_argument("--skip-invalid", action="store_true", help="skip invalid records instead of stopping")
+
+    export_parser = operations.add_parser("export", help="export completions to a CSV or JSON Lines file")
+    export_parser.add_argument("path", help="file to write")
+    export_parser.add_argument("--format", choices=["csv", "jsonl"], help="file format, taken from the extension by default")
+
+    return parser
+
+def find_habit(storage, reference):
+    """
+    Find a habit by ID first and by name second
+
+    Args:
+        storage: the storage instance
+        reference: ID or name of the habit
+
+    Returns:
+        the habit
+    """
+    habit = storage.get_habit(reference) or storage.get_habit_by_name(reference)
+    if habit is None:
+        raise LookupError(f"Habit '{reference}' not found")
+    return habit
+
+def run_operation(storage, args):
+    """
+    Run one parsed operation against the storage
+
+    Args:
+        storage: the loaded storage instance
+        args: parsed arguments from the parser of build_parser
+
+    Returns:
+        JSON friendly result of the operation
+    """
+    if args.operation == "list":
+        if args.periodicity:
+            habits = analytics.get_habits_by_periodicity(storage, args.periodicity)
+        else:
+            habits = analytics.get_all_habits(storage)
+        return [habit_summary(habit) for habit in habits]
+
+    if args.operation == "add":
+        habit = Habit(args.name, args.description, args.periodicity)
+        storage.add_habit(habit)
+        return habit_summary(habit)
+
+    if args.operation == "complete":
+        habit = find_habit(storage, args.habit)
+        return {'id': habit.id, 'completed_at': storage.complete_habit(habit).isoformat()}
+
+    if args.operation == "show":
+        habit = find_habit(storage, args.habit)
+        summary = habit_summary(habit)
+        summary['completions'] = habit.get_completion_counts()[0]
+        summary['recent_completions'] = [completion.isoformat() for completion in reversed(habit.completions[-5:])]
+        return summary
+
+    if args.operation == "delete":
+        habit = find_habit(storage, args.habit)
+        storage.remove_habit(habit.id)
+        return {'id': habit.id, 'deleted': True}
+
+    if args.operation == "stats":
+        habit, streak = analytics.get_longest_streak_habit(storage)
+        return {
+            'completion_rates': analytics.get_completion_rate(storage, args.days),
+            'streaks': {
+                name: {'current_streak': current, 'longest_streak': longest}
+                for name, (current, longest) in analytics.get_all_streaks(storage).items()
+            },
+            'longest_streak_habit': {'name': habit.name if habit else None, 'streak': streak},
+        }
+
+    if args.operation == "import":
+        return bulk.import_completions(
+            storage, bulk.read_records(args.path, args.format), skip_invalid=args.skip_invalid
+        )
+
+    if args.operation == "export":
+        return {'exported': bulk.export_completions(storage, args.path, args.format)}
+
+    raise ValueError(f"Unknown operation '{args.operation}'")
+
+def iter_operations(lines):
+    """
+    Pick the operations out of lines
+
+    every line holds one operation in shell syntax, e.g. complete "Read Book".
+    blank lines and lines starting with # are skipped. the lines are split by
+    run_batch, so a line with broken quoting only fails its own operation
+
+    Args:
+        lines: iterable of lines
+
+    Returns:
+        generator of operation lines
+    """
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+def run_batch(storage, operations, output=None):
+    """
+    Run operations one after another and write one JSON result line per operation
+
+    a failing operation is reported with its error and does not stop the batch.
+    messages the operations print go to stderr so the output stays valid JSON
+
+    Args:
+        storage: the loaded storage instance
+        operations: iterable of argument lists or of operations in shell
+            syntax, e.g. from iter_operations
+        output: stream for the JSON lines, stdout by default
+
+    Returns:
+        int: number of failed operations
+    """
+    output = output or sys.stdout
+    parser = build_parser()
+    failed = 0
+
+    for operation in operations:
+        # split on whitespace first, so a line with broken quoting is still reported by its name
+        argv = operation.split() if isinstance(operation, str) else operation
+        try:
+            if isinstance(operation, str):
+                argv = shlex.split(operation)
+            args = parser.parse_args(argv)
+            with contextlib.redirect_stdout(sys.stderr):
+                result = {'operation': args.operation, 'ok': True, 'result': run_operation(storage, args)}
+        except (ValueError, LookupError, OSError) as error:
+            failed += 1
+            result = {'operation': argv[0] if argv else None, 'ok': False, 'error': str(error)}
+        output.write(json.dumps(result) + "\n")
+
+    return failed
+
+def run_command(storage, argv, stdin=None, output=None):
+    """
+    Run the operations given on the command line and persist their changes once
+
+    argv is either a single operation, e.g. ['complete', 'Read Book'], or
+    'batch' followed by -e OPERATION options and/or a file with one operation
+    per line ('-' for stdin). without either, operations are read from stdin
+
+    Args:
+        storage: storage instance in write-behind mode without a timer, so all
+            changes are written together when the storage is closed
+        argv: the command line arguments
+        stdin: stream to read operations from, sys.stdin by default
+        output: stream for the JSON lines, stdout by default
+
+    Returns:
+        int: exit status, 0 if every operation succeeded
+    """
+    if argv and argv[0] == "batch":
+        parser = argparse.ArgumentParser(prog="main.py batch", description="Run many operations in one process")
+        parser.add_argument("-e", dest="operations", action="append", default=[], metavar="OPERATION",
+                            help="an operation in shell syntax, may be repeated")
+        parser.add_argument("file", nargs="?", help="file with one operation per line, '-' for stdin")
+        args = parser.parse_args(argv[1:])
+        operations = args.operations
+    else:
+        args = None
+        operations = [argv]
+
+    storage.load()
+    try:
+        failed = run_batch(storage, operations, output)
+        if args is not None and (args.file or not args.operations):
+            if args.file in [None, "-"]:
+                failed += run_batch(storage, iter_operations(stdin or sys.stdin), output)
+            else:
+                with open(args.file, "r") as f:
+                    failed += run_batch(storage, iter_operations(f), output)
+    finally:
+        # the single write of the whole batch
+        storage.close()
+
+    return 1 if failed else 0
@@ -0,0 +1,293 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from habit import Habit
+from retention import archive_completions, get_horizon
+from storage import Storage, create_storage
+import analytics
+
+def generate_habits(habit_count=100, years=3, density=0.7, seed=0):
+    """
+    Generate habits with synthetic completion histories
+
+    Args:
+        habit_count: number of habits to create, half daily and half weekly
+        years: how many years of history each habit gets
+        density: chance that a habit was completed in any given period
+        seed: seed for the random generator so runs are comparable
+
+    Returns:
+        list of habits
+    """
+    rng = random.Random(seed)
+    today = datetime.now()
+    habits = []
+
+    for i in range(habit_count):
+        periodicity = "daily" if i % 2 == 0 else "weekly"
+        habit = Habit(f"Habit {i}", f"Synthetic {periodicity} habit", periodicity)
+        habit.created_at = today - timedelta(days=int(365 * years))
+
+        step = 1 if periodicity == "daily" else 7
+        completions = []
+        for days_ago in range(0, int(365 * years), step):
+            if rng.random() < density:
+                completions.append(today - timedelta(days=days_ago, seconds=rng.randrange(3600)))
+        habit.completions = completions
+        habits.append(habit)
+
+    return habits
+
+def measure(name, func, repeat=5, items=1):
+    """
+    Time a function and record its peak memory
+
+    Args:
+        name: name of the benchmark
+        func: function without arguments to run
+        repeat: number of timed runs, the best one is reported
+        items: number of items processed per run, used for throughput
+
+    Returns:
+        dictionary with the benchmark results
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    # measure memory in a separate run so tracing does not skew the timings
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    return {
+        'name': name,
+        'best_seconds': best,
+        'mean_seconds': sum(timings) / len(timings),
+        'items': items,
+        'items_per_second': items / best if best > 0 else None,
+        'peak_memory_bytes': peak,
+    }
+
+def run_benchmarks(habit_count=100, years=3, density=0.7, repeat=5, workers=None):
+    """
+    Run every benchmark on a freshly generated dataset
+
+    Args:
+        habit_count: number of habits to create
+        years: how many years of history each habit gets
+        density: chance that a habit was completed in any given period
+        repeat: number of timed runs per benchmark
+        workers: number of processes for the process pool benchmarks, None to skip them
+
+    Returns:
+        list of benchmark results
+    """
+    habits = generate_habits(habit_count, years, density)
+    completion_count = sum(len(habit.completions) for habit in habits)
+    data_dir = tempfile.mkdtemp(prefix="habit_bench_")
+    results = []
+
+    try:
+        storage = Storage(data_dir)
+        storage._set_habits(habits)
+        today = datetime.now()
+        sample_dates = [today - timedelta(days=days_ago) for days_ago in range(0, int(365 * years), 30)]
+
+        # habit hot paths, clearing the streak cache to time a full computation
+        def current_streak_cold():
+            for habit in habits:
+                habit._streak_cache = None
+                habit.get_current_streak()
+
+        def current_streak_warm():
+            for habit in habits:
+                habit.get_current_streak()
+
+        def period_checks():
+            for habit in habits:
+                for date in sample_dates:
+                    habit.is_complete_for_period(date)
+
+        results.append(measure("habit.get_current_streak (cold)", current_streak_cold, repeat, len(habits)))
+        results.append(measure("habit.get_current_streak (cached)", current_streak_warm, repeat, len(habits)))
+        results.append(measure("habit.is_complete_for_period", period_checks, repeat, len(habits) * len(sample_dates)))
+
+        # the same streaks with all but the last 90 days archived into per-period counts
+        archived_habits = [Habit.from_dict(habit.to_dict()) for habit in habits]
+        horizon = get_horizon(90)
+        for habit in archived_habits:
+            archive_completions(habit, horizon)
+
+        def archived_streak_cold():
+            for habit in archived_habits:
+                habit._streak_cache = None
+                habit.get_current_streak()
+
+        results.append(measure("habit.get_current_streak (cold, archived)", archived_streak_cold, repeat, len(habits)))
+
+        # storage
+        results.append(measure("storage.save", storage.save, repeat, completion_count))
+
+        def load():
+            Storage(data_dir).load()
+
+        def lazy_load():
+            Storage(data_dir, lazy=True).load()
+
+        results.append(measure("storage.load", load, repeat, completion_count))
+        results.append(measure("storage.load (lazy)", lazy_load, repeat, completion_count))
+
+        binary_storage = Storage(data_dir, snapshot_format="binary")
+        binary_storage._set_habits(habits)
+
+        def binary_load():
+            Storage(data_dir, snapshot_format="binary").load()
+
+        results.append(measure("storage.save (binary)", binary_storage.save, repeat, completion_count))
+        results.append(measure("storage.load (binary)", binary_load, repeat, completion_count))
+
+        # the first load writes habits.cache, the measured ones read it
+        Storage(data_dir, state_cache=True).load()
+
+        def cached_load():
+            Storage(data_dir, state_cache=True).load()
+
+        def lazy_cached_load():
+            Storage(data_dir, lazy=True, state_cache=True).load()
+
+        results.append(measure("storage.load (state cache)", cached_load, repeat, completion_count))
+        results.append(measure("storage.load (lazy, state cache)", lazy_cached_load, repeat, completion_count))
+
+        # persisting one new completion, the single JSON file is rewritten as a
+        # whole while the directory backend only rewrites the completed habit
+        for backend in ["json", "directory"]:
+            backend_storage = create_storage(backend, os.path.join(data_dir, backend))
+            # copies, so the extra completions do not change the other benchmarks
+            backend_storage._set_habits(Habit.from_dict(habit.to_dict()) for habit in habits)
+            backend_storage.save()
+            completed = backend_storage.get_all_habits()[0]
+            next_completion = [datetime(2100, 1, 1)]
+
+            def write_completion():
+                next_completion[0] += timedelta(minutes=1)
+                backend_storage.add_completions({completed: [next_completion[0]]})
+
+            results.append(measure(f"storage.add_completions (one, {backend})", write_completion, repeat))
+
+        # analytics on a lazily loaded storage answered from saved rollups
+        rollup_storage = Storage(data_dir, persist_rollups=True)
+        rollup_storage._set_habits(habits)
+        rollup_storage.save()
+
+        def lazy_rollup_rates():
+            lazy_storage = Storage(data_dir, lazy=True, persist_rollups=True)
+            lazy_storage.load()
+            analytics.get_completion_rate(lazy_storage, 365)
+
+        results.append(measure("storage.load + completion rate (lazy, rollups)", lazy_rollup_rates, repeat, len(habits)))
+
+        # analytics
+        analytics_calls = [
+            ("analytics.get_all_habits", lambda: analytics.get_all_habits(storage)),
+            ("analytics.get_habits_by_periodicity", lambda: analytics.get_habits_by_periodicity(storage, "daily")),
+            ("analytics.get_longest_streak_habit", lambda: analytics.get_longest_streak_habit(storage)),
+            ("analytics.get_streak_for_habit", lambda: [analytics.get_streak_for_habit(habit) for habit in habits]),
+            ("analytics.get_longest_streak_for_habit", lambda: [analytics.get_longest_streak_for_habit(habit) for habit in habits]),
+            ("analytics.get_streak_runs_for_habit", lambda: [analytics.get_streak_runs_for_habit(habit) for habit in habits]),
+            ("analytics.get_completion_rate", lambda: analytics.get_completion_rate(storage, 365)),
+            ("analytics.get_completion_rate (numpy)", lambda: analytics.get_completion_rate(storage, 365, use_numpy=True)),
+            ("analytics.get_all_streaks", lambda: analytics.get_all_streaks(storage)),
+            ("analytics.get_all_streaks (numpy)", lambda: analytics.get_all_streaks(storage, use_numpy=True)),
+            ("analytics.get_completion_histogram", lambda: analytics.get_completion_histogram(storage, 52)),
+            ("analytics.get_completion_histogram (numpy)", lambda: analytics.get_completion_histogram(storage, 52, use_numpy=True)),
+            ("analytics.get_window_stats", lambda: analytics.get_window_stats(storage, today - timedelta(days=365), today)),
+            ("analytics.get_window_stats (by month)", lambda: analytics.get_window_stats(storage, today - timedelta(days=365), today, 'month')),
+            ("analytics.get_habits_completed_today", lambda: analytics.get_habits_completed_today(storage)),
+            ("analytics.get_habits_to_complete_today", lambda: analytics.get_habits_to_complete_today(storage)),
+        ]
+        for name, func in analytics_calls:
+            results.append(measure(name, func, repeat, len(habits)))
+
+        if workers:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pool_calls = [
+                    ("analytics.get_longest_streak_habit (pool)", lambda: analytics.get_longest_streak_habit(storage, executor)),
+                    ("analytics.get_completion_rate (pool)", lambda: analytics.get_completion_rate(storage, 365, executor=executor)),
+                    ("analytics.get_all_streaks (pool)", lambda: analytics.get_all_streaks(storage, executor=executor)),
+                ]
+                for name, func in pool_calls:
+                    results.append(measure(name, func, repeat, len(habits)))
+    finally:
+        shutil.rmtree(data_dir)
+
+    return results
+
+def get_commit():
+    """get the current git commit, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results):
+    """print the benchmark results as a table"""
+    print(f"{'benchmark':<48} {'best ms':>10} {'items/s':>14} {'peak KiB':>10}")
+    for result in results:
+        rate = result['items_per_second']
+        rate_text = f"{rate:,.0f}" if rate is not None else "-"
+        print(
+            f"{result['name']:<48} {result['best_seconds'] * 1000:>10.2f} "
+            f"{rate_text:>14} {result['peak_memory_bytes'] / 1024:>10.1f}"
+        )
+
+def main(argv=None):
+    """run the benchmarks from the command line"""
+    parser = argparse.ArgumentParser(description="Benchmark the habit tracker hot paths")
+    parser.add_argument("--habits", type=int, default=100, help="number of habits to generate")
+    parser.add_argument("--years", type=float, default=3, help="years of history per habit")
+    parser.add_argument("--density", type=float, default=0.7, help="chance of a completion per period")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--workers", type=int, help="also benchmark analytics in a process pool of this size")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.habits, args.years, args.density, args.repeat, args.workers)
+    print_results(results)
+
+    if args.json:
+        report = {
+            'commit': get_commit(),
+            'python': sys.version.split()[0],
+            'created_at': datetime.now().isoformat(),
+            'parameters': {
+                'habits': args.habits,
+                'years': args.years,
+                'density': args.density,
+                'repeat': args.repeat,
+                'workers': args.workers,
+            },
+            'results': results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import argparse
+import csv
+import json
+import os
+from datetime import datetime
+from itertools import islice
+from habit import Habit
+from storage import create_storage, normalize_name
+
+# backends that rewrite whole files, so an import only writes at the end
+SNAPSHOT_BACKENDS = {"json", "directory"}
+
+FIELDS = ['habit_id', 'habit_name', 'description', 'periodicity', 'timestamp']
+
+def detect_format(path, fmt=None):
+    """
+    Work out the file format from an explicit choice or the file extension
+
+    Args:
+        path: path of the file
+        fmt: 'csv' or 'jsonl', or None to use the extension
+
+    Returns:
+        str: 'csv' or 'jsonl'
+    """
+    if fmt is None:
+        fmt = "csv" if path.lower().endswith(".csv") else "jsonl"
+    if fmt not in ["csv", "jsonl"]:
+        raise ValueError(f"Unknown format '{fmt}', expected 'csv' or 'jsonl'")
+    return fmt
+
+def read_records(path, fmt=None):
+    """
+    Read completion records from a CSV or JSON Lines file one at a time
+
+    Args:
+        path: path of the file
+        fmt: 'csv' or 'jsonl', or None to use the file extension
+
+    Returns:
+        generator of dictionaries, one per record
+    """
+    fmt = detect_format(path, fmt)
+    with open(path, "r", newline="") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # reported as an invalid record by validate_records
+                    yield None
+
+def validate_records(records, skip_invalid=False, stats=None):
+    """
+    Check and normalize completion records
+
+    every record needs a timestamp and a habit_id or habit_name. timestamps
+    with a time zone are converted to local time, like datetime.now()
+
+    Args:
+        records: iterable of record dictionaries
+        skip_invalid: skip invalid records instead of raising ValueError
+        stats: optional dictionary in which skipped records are counted
+
+    Returns:
+        generator of normalized record dictionaries with a datetime timestamp
+    """
+    for number, record in enumerate(records, 1):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("expected an object")
+            habit_id = (record.get('habit_id') or '').strip()
+            habit_name = (record.get('habit_name') or '').strip()
+            if not habit_id and not habit_name:
+                raise ValueError("missing habit_id or habit_name")
+
+            periodicity = (record.get('periodicity') or 'daily').strip().lower()
+            if periodicity not in ['daily', 'weekly']:
+                raise ValueError("periodicity must be 'daily' or 'weekly'")
+
+            timestamp = datetime.fromisoformat((record.get('timestamp') or '').strip())
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone().replace(tzinfo=None)
+        except (ValueError, TypeError, AttributeError) as error:
+            if not skip_invalid:
+                raise ValueError(f"Invalid record {number}: {error}")
+            if stats is not None:
+                stats['skipped'] = stats.get('skipped', 0) + 1
+            continue
+
+        yield {
+            'habit_id': habit_id,
+            'habit_name': habit_name or habit_id,
+            'description': (record.get('description') or '').strip(),
+            'periodicity': periodicity,
+            'timestamp': timestamp,
+        }
+
+def batched(iterable, size):
+    """
+    Group an iterable into lists of at most size items
+
+    Args:
+        iterable: the items to group
+        size: maximum number of items per batch
+
+    Returns:
+        generator of lists
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def find_habit(storage, new_habits, new_names, record):
+    """
+    Find the habit a record belongs to, by ID first and by name second
+
+    Args:
+        storage: the storage instance
+        new_habits: habits created for the current batch, by ID
+        new_names: habits created for the current batch, by normalized name
+        record: a normalized record dictionary
+
+    Returns:
+        the habit, or None if it does not exist yet
+    """
+    habit_id = record['habit_id']
+    if habit_id:
+        habit = storage.get_habit(habit_id) or new_habits.get(habit_id)
+        if habit is not None:
+            return habit
+
+    habit = storage.get_habit_by_name(record['habit_name'])
+    if habit is None:
+        habit = new_names.get(normalize_name(record['habit_name']))
+    return habit
+
+def import_completions(storage, records, batch_size=1000, skip_invalid=False):
+    """
+    Import completion records into a storage batch by batch
+
+    habits are matched by ID first and by name second, and created from the
+    first record that mentions them if they do not exist yet
+
+    Args:
+        storage: the loaded storage instance
+        records: iterable of record dictionaries, e.g. from read_records
+        batch_size: number of records added to the storage at once, each
+            batch is one write unless the storage is in write-behind mode
+        skip_invalid: skip invalid records instead of raising ValueError
+
+    Returns:
+        dictionary with the number of records read, completions imported,
+        habits created and records skipped
+    """
+    stats = {'records': 0, 'imported': 0, 'habits_created': 0, 'skipped': 0}
+
+    for batch in batched(validate_records(records, skip_invalid, stats), batch_size):
+        new_habits = {}
+        new_names = {}
+        completions_by_habit = {}
+
+        for record in batch:
+            habit = find_habit(storage, new_habits, new_names, record)
+            if habit is None:
+                habit = Habit(record['habit_name'], record['description'], record['periodicity'])
+                if record['habit_id']:
+                    habit.id = record['habit_id']
+                habit.created_at = record['timestamp']
+                new_habits[habit.id] = habit
+                new_names.setdefault(normalize_name(habit.name), habit)
+            completions_by_habit.setdefault(habit, []).append(record['timestamp'])
+
+        stats['records'] += len(batch)
+        stats['habits_created'] += len(new_habits)
+        stats['imported'] += storage.add_completions(completions_by_habit, new_habits.values())
+
+    return stats
+
+def iter_completion_records(storage):
+    """
+    Generate one record per completion of every habit
+
+    Args:
+        storage: the loaded storage instance
+
+    Returns:
+        generator of record dictionaries with ISO timestamps
+    """
+    for habit in storage.get_all_habits():
+        for completion in habit.completions:
+            yield {
+                'habit_id': habit.id,
+                'habit_name': habit.name,
+                'description': habit.description,
+                'periodicity': habit.periodicity,
+                'timestamp': completion.isoformat(),
+            }
+
+def export_completions(storage, path, fmt=None):
+    """
+    Write every completion to a CSV or JSON Lines file one record at a time
+
+    Args:
+        storage: the loaded storage instance
+        path: path of the file to write
+        fmt: 'csv' or 'jsonl', or None to use the file extension
+
+    Returns:
+        int: number of records written
+    """
+    fmt = detect_format(path, fmt)
+    count = 0
+    with open(path, "w", newline="") as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            for record in iter_completion_records(storage):
+                writer.writerow(record)
+                count += 1
+        else:
+            for record in iter_completion_records(storage):
+                f.write(json.dumps(record) + "\n")
+                count += 1
+    return count
+
+def main(argv=None):
+    """run bulk import or export from the command line"""
+    parser = argparse.ArgumentParser(description="Bulk import and export of habit completions")
+    parser.add_argument("command", choices=["import", "export"], help="what to do")
+    parser.add_argument("path", help="CSV or JSON Lines file")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="file format, taken from the extension by default")
+    parser.add_argument("--data-dir", default="data", help="directory where habit data is stored")
+    parser.add_argument("--backend", default=os.environ.get("HABIT_STORAGE", "json"), help="storage backend")
+    parser.add_argument("--batch-size", type=int, default=1000, help="records written per batch")
+    parser.add_argument("--skip-invalid", action="store_true", help="skip invalid records instead of stopping")
+    args = parser.parse_args(argv)
+
+    options = {}
+    if args.backend in SNAPSHOT_BACKENDS:
+        # written once when the storage is closed instead of once per batch
+        options = {'write_behind': True, 'flush_interval': None, 'flush_batch': None}
+    storage = create_storage(args.backend, args.data_dir, **options)
+    storage.load()
+    try:
+        if args.command == "import":
+            result = import_completions(
+                storage, read_records(args.path, args.format), args.batch_size, args.skip_invalid
+            )
+        else:
+            result = {'exported': export_completions(storage, args.path, args.format)}
+    finally:
+        storage.close()
+    print(json.dumps(result))
+
+if __name__ == "__main__":
+    main()
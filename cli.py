@@ -1,7 +1,9 @@
 import sys
 from habit import Habit
 from storage import Storage
-import analytics
+# analytics (and NumPy, when it is installed) is imported when the analytics
+# menu is first opened, so it does not slow down the start of the menu
+analytics = None
 
 class HabitTrackerCLI:
     """
@@ -11,9 +13,14 @@ class HabitTrackerCLI:
         storage: the storage instance
     """
 
-    def __init__(self):
-        """Intitialize the CLI"""
-        self.storage = Storage()
+    def __init__(self, storage=None):
+        """
+        Intitialize the CLI
+
+        Args:
+            storage: the storage instance to use, a JSON storage in 'data' by default
+        """
+        self.storage = storage if storage is not None else Storage()
         self.storage.load()
 
         # create predefined habits if none exist
@@ -87,54 +94,58 @@ class HabitTrackerCLI:
 
     def complete_habit(self):
         """Complete a habit"""
+        habit = self.select_habit("complete")
+        if habit is not None:
+            self.storage.complete_habit(habit)
+
+    def select_habit(self, action):
+        """
+        Ask the user to pick a habit by number or by name
+
+        the chosen habit is looked up again by ID, so a habit deleted in the
+        meantime is reported instead of acting on a stale list entry
+
+        Args:
+            action: what will be done with the habit, used in the prompt
+
+        Returns:
+            the chosen habit, or None if the user cancelled
+        """
         self.view_all_habits()
 
         habits = self.storage.get_all_habits()
         if not habits:
-            return
+            return None
         
         while True:
-            choice = input("\nEnter the number of the habit to complete (0 to cancel): ")
+            choice = input(f"\nEnter the number or name of the habit to {action} (0 to cancel): ")
 
             if choice == '0':
-                return
+                return None
             
             try:
                 index = int(choice) - 1
                 if 0 <= index < len(habits):
-                    habit = habits[index]
-                    habit.complete()
-                    self.storage.save()
-                    break
+                    habit = self.storage.get_habit(habits[index].id)
                 else:
                     print("Invalid habit number.")
+                    continue
             except ValueError:
-                print("Please enter a valid number")
+                habit = self.storage.get_habit_by_name(choice)
+                if habit is None:
+                    print("Please enter a valid number or habit name")
+                    continue
+
+            if habit is None:
+                print("That habit no longer exists")
+                continue
+            return habit
 
     def view_habit_details(self):
         """View details of a specific habit"""
-        self.view_all_habits()
-
-        habits = self.storage.get_all_habits()
-        if not habits:
-            return
-        
-        while True:
-            choice = input("\nEnter the number of the habit to view (0 to cancel): ")
-
-            if choice == '0':
-                return
-            
-            try:
-                index = int(choice) - 1
-                if 0 <= index < len(habits):
-                    habit = habits[index]
-                    self.display_habit_details(habit)
-                    break
-                else:
-                    print("Invalid habit number")
-            except ValueError:
-                print("Please enter a valid number")
+        habit = self.select_habit("view")
+        if habit is not None:
+            self.display_habit_details(habit)
 
     def display_habit_details(self, habit):
         """
@@ -147,7 +158,9 @@ class HabitTrackerCLI:
         print(f"Description: {habit.description}")
         print(f"Periodicity: {habit.periodicity}")
         print(f"Created at: {habit.created_at.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"Current streak: {habit.get_current_streak()} {habit.periodicity} periods")
+        current_streak, longest_streak, _ = habit.get_streaks()
+        print(f"Current streak: {current_streak} {habit.periodicity} periods")
+        print(f"Longest streak: {longest_streak} {habit.periodicity} periods")
         print(f"Completed today: {'Yes' if habit.is_complete_for_period() else 'No'}")
 
         # display recent completions
@@ -158,35 +171,19 @@ class HabitTrackerCLI:
 
     def delete_habit(self):
         """Delete a habit"""
-        self.view_all_habits()
-
-        habits = self.storage.get_all_habits()
-        if not habits:
+        habit = self.select_habit("delete")
+        if habit is None:
             return
-        
-        while True:
-            choice = input("\nEnter the number of the habit to delete (0 to cancel): ")
-
-            if choice == '0':
-                return
-            
-            try:
-                index = int(choice) - 1
-                if 0 <= index < len(habits):
-                    habit = habits[index]
-                    confirm = input(f"Are you sure you want to delete '{habit.name}'? (y/n): ")
 
-                    if confirm.lower() == 'y':
-                        self.storage.remove_habit(habit.id)
-                        print(f"Habit '{habit.name}' deleted successfully")
-                    break
-                else:
-                    print("Invalid habit number")
-            except ValueError:
-                print("Please enter a valid number")
+        confirm = input(f"Are you sure you want to delete '{habit.name}'? (y/n): ")
+        if confirm.lower() == 'y':
+            self.storage.remove_habit(habit.id)
+            print(f"Habit '{habit.name}' deleted successfully")
 
     def show_analytics(self):
         """Show analytics menu"""
+        global analytics
+        import analytics
         while True:
             print("\n===== Analytics =====")
             print("1. View all habits")
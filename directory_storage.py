@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+from snapshot import SNAPSHOT_FILES, read_habits, write_habits
+from storage import Storage, synchronized
+import instrument
+
+# habit IDs like these are used as file names as they are, any other ID
+# (e.g. imported from another tracker) is hashed into a name with a ~
+HABIT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$")
+
+class DirectoryStorage(Storage):
+    """
+    A storage that keeps every habit in its own file.
+
+    data/habits/ holds one snapshot file per habit, named after its ID or a
+    hash of it, in the JSON or binary snapshot format. a write only rewrites the habits that
+    are dirty and deletes the files of removed habits, so completing a habit
+    costs the same no matter how many other habits there are.
+
+    Attributes:
+        data_dir: Directory where habit data is stored
+        habits: dictionary mapping habit IDs to habit objects, ordered by creation
+    """
+
+    def __init__(self, data_dir="data", **options):
+        """
+        Intitialize the directory storage.
+
+        Args:
+            data_dir: directory where habit data is stored
+            options: further Storage options, e.g. lazy, write_behind or
+                snapshot_format. state_cache and persist_rollups only apply to
+                single snapshot files and are ignored
+        """
+        super().__init__(data_dir, **options)
+        self.state_cache = False
+        self.persist_rollups = False
+
+        habits_dir = self._habits_dir()
+        if not os.path.exists(habits_dir):
+            os.makedirs(habits_dir)
+
+    def _habits_dir(self):
+        """path of the directory with the habit files"""
+        return os.path.join(self.data_dir, "habits")
+
+    def _habit_path(self, habit_id):
+        """
+        get the file of a habit
+
+        Args:
+            habit_id: ID of the habit
+
+        Returns:
+            str: path of the habit file
+        """
+        name = habit_id
+        if not HABIT_ID_PATTERN.match(habit_id):
+            # cannot clash with an ID used as it is, those never contain a ~
+            name = "~" + hashlib.sha1(habit_id.encode("utf-8")).hexdigest()
+        extension = os.path.splitext(SNAPSHOT_FILES[self.snapshot_format])[1]
+        return os.path.join(self._habits_dir(), name + extension)
+
+    @instrument.timed("directory_storage.write")
+    def _write_changes(self, changes):
+        """
+        Write the files of the habits that changed
+
+        Args:
+            changes: list of (kind, habit, timestamp) tuples, oldest first
+        """
+        instrument.count("storage.changes_written", len(changes))
+        with self._locked():
+            # a merge or a full save can leave any habit dirty, otherwise only the changed ones are
+            if self._sync() or any(kind == 'all' for kind, _, _ in changes):
+                habits = list(self.habits.values())
+                removed = self._synced_ids.difference(self.habits)
+            else:
+                habits = [habit for _, habit, _ in changes if habit.id in self.habits]
+                removed = {habit.id for _, habit, _ in changes if habit.id not in self.habits}
+
+            generation = self._next_generation()
+            # retention only looks at the habits being written, the others are archived on their next write
+            self._write_archives(habits)
+            for habit_id in removed:
+                try:
+                    os.remove(self._habit_path(habit_id))
+                except FileNotFoundError:
+                    pass
+                self._synced_ids.discard(habit_id)
+
+            written = 0
+            for habit in habits:
+                if habit.dirty:
+                    write_habits(self._habit_path(habit.id), [habit], self.snapshot_format)
+                    habit.mark_clean()
+                    self._synced_ids.add(habit.id)
+                    written += 1
+            instrument.count("directory_storage.habits_written", written)
+            # only after every write succeeded, otherwise the next write merges
+            # and rewrites whatever is still dirty
+            self.generation = generation
+
+    @synchronized
+    @instrument.timed("directory_storage.load")
+    def load(self):
+        """Load every habit file, in the order the habits were created"""
+        # read before the files, a write in between then only causes a needless merge
+        generation = self._read_generation()
+        extension = os.path.splitext(SNAPSHOT_FILES[self.snapshot_format])[1]
+        habits = []
+        for name in os.listdir(self._habits_dir()):
+            if not name.endswith(extension):
+                continue
+            try:
+                habits.extend(read_habits(os.path.join(self._habits_dir(), name), self.snapshot_format, self.lazy))
+            except FileNotFoundError:
+                # deleted by another process since the directory was listed
+                pass
+
+        habits.sort(key=lambda habit: habit.created_at)
+        self._set_habits(habits)
+        self._attach_archives()
+        self._mark_synced(generation)
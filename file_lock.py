@@ -0,0 +1,100 @@
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # windows has no fcntl, byte range locks of msvcrt are used instead
+    fcntl = None
+    import msvcrt
+
+# seconds between attempts to take a lock held by another process
+POLL_INTERVAL = 0.01
+
+class FileLock:
+    """
+    An exclusive lock on a file that is shared by processes and threads
+
+    the lock is reentrant, so a thread holding it can take it again (e.g. a
+    compaction during a write). threads of one process wait for each other
+    before the file itself is locked, since file locks are held per process
+
+    Attributes:
+        path: path of the lock file, created if it does not exist
+        timeout: seconds to wait for the lock before giving up, None to wait forever
+    """
+
+    def __init__(self, path, timeout=10.0):
+        """
+        Initialize the lock, it is not taken yet
+
+        Args:
+            path: path of the lock file
+            timeout: seconds to wait for the lock, None to wait forever
+        """
+        self.path = path
+        self.timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._file = None
+        self._depth = 0
+
+    def acquire(self):
+        """
+        Take the lock, waiting while another process or thread holds it
+
+        Raises:
+            TimeoutError: if the lock could not be taken within the timeout
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        if not self._thread_lock.acquire(timeout=-1 if self.timeout is None else self.timeout):
+            raise TimeoutError(f"Could not lock {self.path} within {self.timeout} seconds")
+        try:
+            if self._depth == 0:
+                self._file = self._lock_file(deadline)
+            self._depth += 1
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        """Release the lock once for every acquire"""
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                self._unlock_file(self._file)
+            finally:
+                self._file.close()
+                self._file = None
+        self._thread_lock.release()
+
+    def _lock_file(self, deadline):
+        """open the lock file and lock it, polling until the deadline"""
+        f = open(self.path, "a+b")
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                return f
+            except OSError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    f.close()
+                    raise TimeoutError(f"Could not lock {self.path} within {self.timeout} seconds")
+                time.sleep(POLL_INTERVAL)
+
+    def _unlock_file(self, f):
+        """unlock an open lock file"""
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -1,5 +1,284 @@
+from array import array
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
 import uuid
+from rollup import HabitRollup
+import instrument
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+MICROSECONDS_PER_DAY = 24 * 60 * 60 * 1000000
+
+def to_timestamp(date):
+    """
+    convert a date to an integer timestamp
+
+    Args:
+        date: the date to convert
+
+    Returns:
+        int: microseconds since 1970-01-01
+    """
+    return (date - EPOCH) // timedelta(microseconds=1)
+
+def from_timestamp(timestamp):
+    """
+    convert an integer timestamp back to a date
+
+    Args:
+        timestamp: microseconds since 1970-01-01
+
+    Returns:
+        datetime: the date
+    """
+    return EPOCH + timedelta(microseconds=timestamp)
+
+def get_period_bounds(date, periodicity):
+    """
+    find the start and end of the period a date falls in
+
+    Args:
+        date: the date to check
+        periodicity: 'daily' or 'weekly'
+
+    Returns:
+        tuple of (period start, period end), the end is exclusive
+    """
+    if periodicity == 'daily':
+        period_start = datetime(date.year, date.month, date.day)
+        period_end = period_start + timedelta(days=1)
+    else: # weekly
+        # find the start of the week (monday)
+        days_since_monday = date.weekday()
+        period_start = datetime(date.year, date.month, date.day) - timedelta(days=days_since_monday)
+        period_end = period_start + timedelta(days=7)
+    return period_start, period_end
+
+def period_ordinal(date, periodicity):
+    """
+    number the period a date falls in so that consecutive periods differ by one
+
+    Args:
+        date: the date to convert
+        periodicity: 'daily' or 'weekly'
+
+    Returns:
+        int: the day number for daily habits, the week number for weekly habits
+    """
+    if periodicity == 'daily':
+        return date.toordinal()
+    # day 1 of the ordinal calendar is a monday, so weeks start on mondays
+    return (date.toordinal() - 1) // 7
+
+def timestamp_ordinal(timestamp, periodicity):
+    """
+    number the period an integer timestamp falls in, see period_ordinal
+
+    Args:
+        timestamp: microseconds since 1970-01-01
+        periodicity: 'daily' or 'weekly'
+
+    Returns:
+        int: the day number for daily habits, the week number for weekly habits
+    """
+    day = EPOCH_ORDINAL + timestamp // MICROSECONDS_PER_DAY
+    if periodicity == 'daily':
+        return day
+    return (day - 1) // 7
+
+def get_period_runs(ordinals):
+    """
+    group period ordinals into runs of consecutive periods in a single pass
+
+    Args:
+        ordinals: period ordinals in ascending order, repeats allowed
+
+    Returns:
+        list of (first_ordinal, length) tuples, oldest run first
+    """
+    runs = []
+    start = previous = None
+
+    for ordinal in ordinals:
+        if ordinal == previous:
+            continue
+        if previous is None or ordinal != previous + 1:
+            if previous is not None:
+                runs.append((start, previous - start + 1))
+            start = ordinal
+        previous = ordinal
+
+    if previous is not None:
+        runs.append((start, previous - start + 1))
+    return runs
+
+def get_run_length_at(runs, ordinal):
+    """
+    get how far into a run of consecutive periods an ordinal is
+
+    Args:
+        runs: (first_ordinal, length) pairs, oldest run first
+        ordinal: the period ordinal to look up
+
+    Returns:
+        int: periods from the start of the covering run up to the ordinal, 0 if no run covers it
+    """
+    # runs are ordered, so walk back only past runs that lie in the future
+    for start, length in reversed(runs):
+        if start <= ordinal < start + length:
+            return ordinal - start + 1
+        if start + length <= ordinal:
+            break
+    return 0
+
+def summarize_streaks(ordinals, current):
+    """
+    compute the current streak, the longest streak and all run lengths
+
+    Args:
+        ordinals: period ordinals in ascending order, repeats allowed
+        current: ordinal of the current period
+
+    Returns:
+        tuple of (current streak, longest streak, list of run lengths)
+    """
+    runs = get_period_runs(ordinals)
+    lengths = [length for _, length in runs]
+    return get_run_length_at(runs, current), max(lengths, default=0), lengths
+
+class Completions:
+    """
+    sorted and deduplicated collection of habit completion dates
+
+    dates are kept as int64 timestamps (see to_timestamp) in an array, which
+    takes 8 bytes per completion instead of a full datetime object, and are
+    converted back to datetimes only when read. keeping them in order lets
+    period checks use a binary search instead of scanning every completion
+
+    attributes:
+        stamps: array of completion timestamps in ascending order
+        version: counter bumped whenever a date is added
+    """
+
+    __slots__ = ('stamps', 'version')
+
+    def __init__(self, dates=()):
+        """
+        Initialize the collection
+
+        Args:
+            dates: iterable of completion dates in any order
+        """
+        self.stamps = array('q', sorted(set(map(to_timestamp, dates))))
+        self.version = 0
+
+    @classmethod
+    def from_timestamps(cls, stamps):
+        """
+        create the collection straight from integer timestamps
+
+        Args:
+            stamps: iterable of timestamps in any order
+
+        Returns:
+            Completions: the new collection
+        """
+        completions = cls()
+        completions.stamps = array('q', sorted(set(stamps)))
+        return completions
+
+    def append(self, date):
+        """
+        add a completion date, keeping the collection sorted
+
+        Args:
+            date: the completion date to add
+        """
+        stamp = to_timestamp(date)
+        index = bisect_left(self.stamps, stamp)
+        if index == len(self.stamps) or self.stamps[index] != stamp:
+            self.stamps.insert(index, stamp)
+            self.version += 1
+
+    def extend(self, dates):
+        """
+        add several completion dates at once
+
+        Args:
+            dates: iterable of completion dates in any order
+        """
+        new_stamps = sorted(set(map(to_timestamp, dates)))
+        if not new_stamps:
+            return
+
+        if not self.stamps or new_stamps[0] > self.stamps[-1]:
+            # appending newer dates, which is the common case for imports
+            self.stamps.extend(new_stamps)
+        else:
+            self.stamps = array('q', sorted(set(self.stamps).union(new_stamps)))
+        self.version += 1
+
+    def merge(self, other):
+        """
+        add every completion of another collection
+
+        Args:
+            other: the Completions to merge in
+        """
+        if other.stamps == self.stamps:
+            return
+        stamps = array('q', sorted(set(self.stamps).union(other.stamps)))
+        if stamps != self.stamps:
+            self.stamps = stamps
+            self.version += 1
+
+    def any_between(self, start, end):
+        """
+        check if any completion falls within a time range
+
+        Args:
+            start: start of the range (inclusive)
+            end: end of the range (exclusive)
+
+        Returns:
+            bool: true if there is a completion in [start, end)
+        """
+        index = bisect_left(self.stamps, to_timestamp(start))
+        return index < len(self.stamps) and self.stamps[index] < to_timestamp(end)
+
+    def count_between(self, start, end):
+        """
+        count the completions within a time range
+
+        Args:
+            start: start of the range (inclusive)
+            end: end of the range (exclusive)
+
+        Returns:
+            int: number of completions in [start, end)
+        """
+        first = bisect_left(self.stamps, to_timestamp(start))
+        return max(0, bisect_left(self.stamps, to_timestamp(end)) - first)
+
+    def __len__(self):
+        return len(self.stamps)
+
+    def __iter__(self):
+        return map(from_timestamp, self.stamps)
+
+    def __reversed__(self):
+        return map(from_timestamp, reversed(self.stamps))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [from_timestamp(stamp) for stamp in self.stamps[index]]
+        return from_timestamp(self.stamps[index])
+
+    def __contains__(self, date):
+        stamp = to_timestamp(date)
+        index = bisect_left(self.stamps, stamp)
+        return index < len(self.stamps) and self.stamps[index] == stamp
+
 
 class Habit:
     """
@@ -11,9 +290,22 @@ class Habit:
         description: description of the habit
         periodicity: how often the habit should be completed i.e. daily or weekly
         created_at: date of habit creation
-        completions: list of habit completion dates
+        completions: sorted collection of habit completion dates
+        archive: aggregates of completions older than the retention horizon,
+            None if nothing was archived, see retention.py
+        dirty: true if the habit changed since a storage last loaded or wrote it
     """
 
+    # slots keep the per-habit footprint small for large numbers of habits
+    __slots__ = (
+        'id', 'name', 'description', 'periodicity', 'created_at',
+        '_completions', '_completion_loader', '_streak_cache', '_rollup',
+        '_edited', '_saved_version', '_archive',
+    )
+
+    # assigning one of these marks the habit dirty
+    SAVED_FIELDS = frozenset(['id', 'name', 'description', 'periodicity', 'created_at', 'completions', 'archive'])
+
     def __init__(self, name, description, periodicity):
         """
         Intitalize a new habit
@@ -28,16 +320,224 @@ class Habit:
         self.description = description
         self.periodicity = periodicity.lower()
         self.created_at = datetime.now()
-        self.completions = []
+        self.completions = Completions()
+        self._streak_cache = None
+        self._rollup = None
+        self._completion_loader = None
+        self._saved_version = None
+        self._archive = None
 
         # validate periodicity
         if self.periodicity not in ['daily', 'weekly']:
             raise ValueError("Periodicity must be 'daily' or 'weekly'")
+
+    def __setattr__(self, name, value):
+        if name in Habit.SAVED_FIELDS:
+            object.__setattr__(self, '_edited', True)
+        object.__setattr__(self, name, value)
+
+    @property
+    def dirty(self):
+        """true if a field was assigned or a completion added since the last mark_clean"""
+        if self._edited:
+            return True
+        # completions that were never loaded cannot have changed
+        return self._completion_loader is None and self._completions.version != self._saved_version
+
+    def mark_clean(self):
+        """Remember the habit as saved, called by storages after loading or writing it"""
+        self._edited = False
+        # lazily loaded completions start at version 0 once they are materialized
+        self._saved_version = self._completions.version if self._completion_loader is None else 0
+
+    @property
+    def completions(self):
+        """sorted collection of completion dates"""
+        if self._completion_loader is not None:
+            # first access of lazily loaded completions, the caches stay valid
+            instrument.count("habit.completions_loaded")
+            dates = self._completion_loader()
+            self._completion_loader = None
+            self._completions = dates if isinstance(dates, Completions) else Completions(dates)
+        return self._completions
+
+    @completions.setter
+    def completions(self, dates):
+        # keep completions sorted no matter how they are assigned
+        self._completion_loader = None
+        self._completions = dates if isinstance(dates, Completions) else Completions(dates)
+        # the caches describe the previous completions
+        self._streak_cache = None
+        self._rollup = None
+
+    @property
+    def archive(self):
+        """aggregates of the archived completions, or None"""
+        return self._archive
+
+    @archive.setter
+    def archive(self, archive):
+        self._archive = archive
+        # the caches include the archived periods
+        self._streak_cache = None
+        self._rollup = None
+
+    def get_unarchived_stamps(self):
+        """
+        get the completion timestamps that are not part of the archive
+
+        completions before the archive horizon are already counted by the
+        archive, e.g. when a merge brought them back, so they are skipped
+
+        Returns:
+            array of timestamps in ascending order
+        """
+        stamps = self.completions.stamps
+        if self._archive is None or not stamps or stamps[0] >= self._archive.horizon_stamp:
+            return stamps
+        return stamps[bisect_left(stamps, self._archive.horizon_stamp):]
+
+    @property
+    def completions_loaded(self):
+        """true once the completions have been materialized"""
+        return self._completion_loader is None
+
+    def defer_completions(self, loader):
+        """
+        load the completions only when they are first accessed
+
+        Args:
+            loader: function without arguments that returns the completion dates
+                or a Completions collection
+        """
+        self._completion_loader = loader
+        self._streak_cache = None
+        self._rollup = None
         
     def complete(self):
         """Mark the habit as complete for the current time"""
-        self.completions.append(datetime.now())
+        timestamp = datetime.now()
+        rollup = self._rollup if self._is_rollup_valid() else None
+        cache = self._streak_cache if self._is_streak_cache_valid() else None
+        version = self.completions.version
+
+        self.completions.append(timestamp)
+        if self.completions.version != version:
+            if cache is not None:
+                self._update_streak_cache(cache, timestamp)
+            if rollup is not None:
+                rollup.add(timestamp.toordinal())
+                rollup.version = self.completions.version
+
         print(f"Habit '{self.name}' marked as complete")
+        return timestamp
+
+    def _is_streak_cache_valid(self):
+        """check that the streak cache matches the current completions"""
+        cache = self._streak_cache
+        return (
+            cache is not None
+            and cache['version'] == self.completions.version
+            and cache['periodicity'] == self.periodicity
+        )
+
+    def _get_streak_cache(self):
+        """
+        get the memoized streak data, rebuilding it if completions changed
+
+        the cache does not depend on the current date, so it stays valid when
+        the day or week rolls over and only the lookup of the current run changes
+
+        Returns:
+            dictionary with the runs, longest streak and completion counts
+        """
+        if not self._is_streak_cache_valid():
+            instrument.count("habit.streak_cache_rebuilds")
+            runs = [list(run) for run in get_period_runs(self.get_period_ordinals())]
+            total_completions = len(self.get_unarchived_stamps())
+            if self._archive is not None:
+                archived_runs = [list(run) for run in self._archive.get_runs(self.periodicity)]
+                # the horizon is a monday, so a run can only continue into the next period
+                if archived_runs and runs and archived_runs[-1][0] + archived_runs[-1][1] == runs[0][0]:
+                    archived_runs[-1][1] += runs.pop(0)[1]
+                runs = archived_runs + runs
+                total_completions += self._archive.completion_count
+            self._streak_cache = {
+                'version': self.completions.version,
+                'periodicity': self.periodicity,
+                'runs': runs,
+                'longest': max((length for _, length in runs), default=0),
+                'completed_periods': sum(length for _, length in runs),
+                'total_completions': total_completions,
+            }
+        return self._streak_cache
+
+    def _update_streak_cache(self, cache, timestamp):
+        """
+        fold a single new completion into the streak cache
+
+        Args:
+            cache: the streak cache, valid before the completion was added
+            timestamp: the new completion date
+        """
+        ordinal = period_ordinal(timestamp, self.periodicity)
+        runs = cache['runs']
+
+        if runs and runs[-1][0] <= ordinal < runs[-1][0] + runs[-1][1]:
+            # period was already complete
+            pass
+        elif runs and ordinal == runs[-1][0] + runs[-1][1]:
+            runs[-1][1] += 1
+            cache['completed_periods'] += 1
+        elif not runs or ordinal > runs[-1][0] + runs[-1][1]:
+            runs.append([ordinal, 1])
+            cache['completed_periods'] += 1
+        else:
+            # completion lands before the latest run (e.g. clock moved back)
+            self._streak_cache = None
+            return
+
+        cache['longest'] = max(cache['longest'], runs[-1][1])
+        cache['total_completions'] += 1
+        cache['version'] = self.completions.version
+
+    def _is_rollup_valid(self):
+        """check that the rollup matches the current completions"""
+        rollup = self._rollup
+        if rollup is None:
+            return False
+        if self._completion_loader is not None:
+            # completions that are not loaded yet are still as they were saved
+            return rollup.version == 0
+        return rollup.version == self._completions.version
+
+    def get_rollup(self):
+        """
+        get the per-day and per-week completion counts, rebuilding them if completions changed
+
+        a rollup attached with set_rollup answers without loading lazy completions
+
+        Returns:
+            HabitRollup: the rollup
+        """
+        if not self._is_rollup_valid():
+            instrument.count("habit.rollup_rebuilds")
+            completions = self.completions
+            days = (timestamp_ordinal(stamp, 'daily') for stamp in self.get_unarchived_stamps())
+            self._rollup = HabitRollup.from_days(days, completions.version)
+            if self._archive is not None:
+                self._rollup = HabitRollup.concat(self._archive.rollup, self._rollup, completions.version)
+        return self._rollup
+
+    def set_rollup(self, rollup):
+        """
+        use a saved rollup for the completions as they were loaded
+
+        Args:
+            rollup: HabitRollup for the saved completions
+        """
+        rollup.version = 0
+        self._rollup = rollup
 
     def is_complete_for_period(self, date=None):
         """
@@ -51,24 +551,29 @@ class Habit:
         """
         if date is None:
             date = datetime.now()
+        # looked up in the rollup, which is kept up to date by complete()
+        return period_ordinal(date, self.periodicity) in self.get_rollup().periods(self.periodicity)
 
-        # find the start of the current period
-        if self.periodicity == 'daily':
-            period_start = datetime(date.year, date.month, date.day)
-            period_end = period_start + timedelta(days=1)
-        else: # weekly
-            # find the start of the week (monday)
-            days_since_monday = date.weekday()
-            period_start = datetime(date.year, date.month, date.day) - timedelta(days=days_since_monday)
-            period_end = period_start + timedelta(days=7)
-
-        # check if any completion falls within the current period
-        for completion in self.completions:
-            if period_start <= completion < period_end:
-                return True
-            
-        return False
-    
+    def get_period_ordinals(self):
+        """
+        get the period ordinal of every completion that is not archived
+
+        Returns:
+            generator of period ordinals in ascending order
+        """
+        periodicity = self.periodicity
+        return (timestamp_ordinal(stamp, periodicity) for stamp in self.get_unarchived_stamps())
+
+    def get_streaks(self):
+        """
+        get the current streak, longest streak and run lengths
+
+        Returns:
+            tuple of (current streak, longest streak, list of run lengths)
+        """
+        return self.get_current_streak(), self.get_longest_streak(), self.get_streak_runs()
+
+    @instrument.timed("habit.get_current_streak")
     def get_current_streak(self):
         """
         Calculate the current streak for this habit
@@ -76,29 +581,73 @@ class Habit:
         Returns:
             the number of consecutive periods the habit has been completed for
         """
-        if not self.completions:
-            return 0
-        
+        current = period_ordinal(datetime.now(), self.periodicity)
+        return get_run_length_at(self._get_streak_cache()['runs'], current)
+
+    def get_longest_streak(self):
+        """
+        Calculate the longest streak this habit has ever had
+
+        Returns:
+            the highest number of consecutive periods the habit was completed for
+        """
+        return self._get_streak_cache()['longest']
 
-        # start from today and go backwards
-        today = datetime.now()
-        streak = 0
-        current_date = today
+    def get_streak_runs(self):
+        """
+        get the length of every run of consecutive completed periods
 
-        while True:
-            # check if the habit is complete for the current period
-            if not self.is_complete_for_period(current_date):
+        Returns:
+            list of run lengths, oldest run first
+        """
+        return [length for _, length in self._get_streak_cache()['runs']]
+
+    def get_longest_streak_between(self, start, end):
+        """
+        get the longest run of consecutive completed periods inside a range of periods
+
+        runs that cross the edges of the range only count the part inside it
+
+        Args:
+            start: first period ordinal of the range (inclusive)
+            end: last period ordinal of the range (exclusive)
+
+        Returns:
+            int: the longest streak within the range
+        """
+        runs = self._get_streak_cache()['runs']
+        # the last run starting at or before the range may reach into it,
+        # [start, inf] sorts after every [start, length] run
+        index = max(bisect_right(runs, [start, float('inf')]) - 1, 0)
+        longest = 0
+        for i in range(index, len(runs)):
+            run_start, length = runs[i]
+            if run_start >= end:
                 break
+            longest = max(longest, min(run_start + length, end) - max(run_start, start))
+        return longest
 
-            streak += 1
+    def get_last_completed_period(self):
+        """
+        get the ordinal of the latest completed period
 
-            # move to the previous period
-            if self.periodicity == 'daily':
-                current_date -= timedelta(days=1)
-            else: # weekly
-                current_date -= timedelta(days=7)
+        Returns:
+            int: period ordinal (see period_ordinal), or None if never completed
+        """
+        runs = self._get_streak_cache()['runs']
+        if not runs:
+            return None
+        return runs[-1][0] + runs[-1][1] - 1
 
-        return streak
+    def get_completion_counts(self):
+        """
+        get the running completion totals
+
+        Returns:
+            tuple of (number of completions, number of completed periods)
+        """
+        cache = self._get_streak_cache()
+        return cache['total_completions'], cache['completed_periods']
     
     def to_dict(self):
         """
@@ -117,12 +666,13 @@ class Habit:
         }
     
     @classmethod
-    def from_dict(cls, data):
+    def from_dict(cls, data, lazy=False):
         """
         create a habit from a dictionary
 
         Args:
             data: dictionary representation of the habit
+            lazy: if true, completion dates are only parsed on first access
 
         Returns:
             Habit: a new habit instance
@@ -130,10 +680,35 @@ class Habit:
         habit = cls(data['name'], data['description'], data['periodicity'])
         habit.id = data['id']
         habit.created_at = datetime.fromisoformat(data['created_at'])
-        habit.completions = [datetime.fromisoformat(completion) for completion in data['completions']]
+
+        raw_completions = data['completions']
+        if lazy:
+            habit.defer_completions(lambda: map(datetime.fromisoformat, raw_completions))
+        else:
+            habit.completions = Completions(datetime.fromisoformat(completion) for completion in raw_completions)
         return habit
     
     def __str__(self):
         """string represetation of the habit"""
         return f"{self.name} ({self.periodicity}): {self.description}"
-    
+
+def habit_summary(habit):
+    """
+    Convert a habit to a JSON friendly summary without its completion history
+
+    Args:
+        habit: the habit to convert
+
+    Returns:
+        dictionary with the habit's fields, status and streaks
+    """
+    return {
+        'id': habit.id,
+        'name': habit.name,
+        'description': habit.description,
+        'periodicity': habit.periodicity,
+        'created_at': habit.created_at.isoformat(),
+        'completed': habit.is_complete_for_period(),
+        'current_streak': habit.get_current_streak(),
+        'longest_streak': habit.get_longest_streak(),
+    }
@@ -0,0 +1,253 @@
+import argparse
+import atexit
+import json
+import os
+import random
+import sys
+import time
+from array import array
+from functools import wraps
+
+# latency samples kept per operation, older calls are reservoir sampled
+MAX_SAMPLES = 10000
+
+class OperationStats:
+    """
+    call count, total time and latency samples of one operation
+
+    attributes:
+        calls: number of calls
+        total: total seconds spent in the operation, nested calls included
+        samples: array of call durations in seconds, at most MAX_SAMPLES
+    """
+
+    __slots__ = ('calls', 'total', 'samples')
+
+    def __init__(self):
+        """Initialize empty stats"""
+        self.calls = 0
+        self.total = 0.0
+        self.samples = array('d')
+
+    def add(self, seconds):
+        """
+        record one call
+
+        Args:
+            seconds: duration of the call
+        """
+        self.calls += 1
+        self.total += seconds
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(seconds)
+        else:
+            # every call has the same chance to be kept
+            index = random.randrange(self.calls)
+            if index < MAX_SAMPLES:
+                self.samples[index] = seconds
+
+    def percentile(self, fraction):
+        """
+        get a latency percentile
+
+        Args:
+            fraction: the percentile as a fraction, e.g. 0.99
+
+        Returns:
+            float: the duration in seconds, 0 without calls
+        """
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+_enabled = False
+_operations = {}
+_counters = {}
+_profiler = None
+
+def enable(profile=False):
+    """
+    Start recording timers and counters
+
+    Args:
+        profile: also capture a cProfile profile of everything that runs
+    """
+    global _enabled, _profiler
+    _enabled = True
+    if profile and _profiler is None:
+        # profiling modules are only imported when needed to keep startup fast
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+def disable():
+    """Stop recording, the recorded data is kept"""
+    global _enabled
+    _enabled = False
+    if _profiler is not None:
+        _profiler.disable()
+
+def is_enabled():
+    """true while timers and counters are recorded"""
+    return _enabled
+
+def reset():
+    """Forget all recorded timers, counters and the profile"""
+    global _profiler
+    _operations.clear()
+    _counters.clear()
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler = None
+
+def record(name, seconds):
+    """
+    Record the duration of one call of an operation
+
+    Args:
+        name: name of the operation
+        seconds: duration of the call
+    """
+    stats = _operations.get(name)
+    if stats is None:
+        stats = _operations[name] = OperationStats()
+    stats.add(seconds)
+
+def count(name, amount=1):
+    """
+    Increase a counter while recording is enabled
+
+    Args:
+        name: name of the counter
+        amount: how much to add
+    """
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def timed(name):
+    """
+    Decorator that times every call of a function while recording is enabled
+
+    when recording is off the only cost is a check of a global flag
+
+    Args:
+        name: name of the operation in the report, e.g. 'storage.load'
+
+    Returns:
+        the decorator
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def get_report():
+    """
+    Summarize the recorded timers and counters
+
+    Returns:
+        dictionary with 'operations', a list of dictionaries with the name, calls,
+        total, p50 and p99 seconds of every operation ordered by total time,
+        and 'counters', a dictionary of counter values
+    """
+    operations = [
+        {
+            'name': name,
+            'calls': stats.calls,
+            'total_seconds': stats.total,
+            'p50_seconds': stats.percentile(0.5),
+            'p99_seconds': stats.percentile(0.99),
+        }
+        for name, stats in _operations.items()
+    ]
+    operations.sort(key=lambda operation: operation['total_seconds'], reverse=True)
+    return {'operations': operations, 'counters': dict(sorted(_counters.items()))}
+
+def print_report(report, file=None):
+    """
+    Print a report as a table
+
+    Args:
+        report: dictionary from get_report
+        file: stream to print to, stdout by default
+    """
+    file = file or sys.stdout
+    print(f"{'operation':<44} {'calls':>10} {'total ms':>12} {'p50 ms':>10} {'p99 ms':>10}", file=file)
+    for operation in report['operations']:
+        print(
+            f"{operation['name']:<44} {operation['calls']:>10} {operation['total_seconds'] * 1000:>12.2f} "
+            f"{operation['p50_seconds'] * 1000:>10.3f} {operation['p99_seconds'] * 1000:>10.3f}",
+            file=file
+        )
+    if report['counters']:
+        print(file=file)
+        print(f"{'counter':<44} {'value':>10}", file=file)
+        for name, value in report['counters'].items():
+            print(f"{name:<44} {value:>10}", file=file)
+
+def save_report(path, profile_path=None):
+    """
+    Write the report as JSON and the cProfile profile, if one was captured
+
+    Args:
+        path: path of the JSON report
+        profile_path: path of the profile, the report path with a .prof extension by default
+    """
+    with open(path, "w") as f:
+        json.dump(get_report(), f, indent=2)
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(profile_path or os.path.splitext(path)[0] + ".prof")
+
+def enable_from_environment():
+    """
+    Enable recording when the HABIT_PROFILE environment variable is set
+
+    HABIT_PROFILE=1 records timers and counters, HABIT_PROFILE=cprofile also
+    captures a cProfile profile. the report is written on exit to the file in
+    HABIT_PROFILE_OUTPUT (habit_profile.json by default)
+    """
+    setting = os.environ.get("HABIT_PROFILE", "").strip().lower()
+    if setting in ["", "0", "false", "off"]:
+        return
+    enable(profile=setting == "cprofile")
+
+    path = os.environ.get("HABIT_PROFILE_OUTPUT", "habit_profile.json")
+    pid = os.getpid()
+
+    def save_on_exit():
+        # worker processes inherit the setting but must not overwrite the report
+        if os.getpid() == pid:
+            save_report(path)
+
+    atexit.register(save_on_exit)
+
+def main(argv=None):
+    """print a saved report from the command line"""
+    parser = argparse.ArgumentParser(description="Print a habit tracker profiling report")
+    parser.add_argument("report", nargs="?", default="habit_profile.json", help="JSON report written on exit")
+    parser.add_argument("--cprofile", metavar="PATH", help="also print the top functions of a cProfile profile")
+    parser.add_argument("--top", type=int, default=20, help="number of cProfile functions to print")
+    args = parser.parse_args(argv)
+
+    with open(args.report, "r") as f:
+        print_report(json.load(f))
+    if args.cprofile:
+        import pstats
+        print()
+        pstats.Stats(args.cprofile).sort_stats("cumulative").print_stats(args.top)
+
+if __name__ == "__main__":
+    main()
+else:
+    # every entry point that imports the instrumented modules honours HABIT_PROFILE
+    enable_from_environment()
@@ -0,0 +1,223 @@
+import json
+import os
+from datetime import datetime
+from habit import Habit
+from storage import Storage, synchronized
+import instrument
+
+class JournalStorage(Storage):
+    """
+    A storage that appends every change to a journal instead of rewriting all habits.
+
+    habits.json (or habits.bin) holds a snapshot of all habits and habits.journal holds one JSON
+    event per line for every change made since that snapshot. Once the journal
+    reaches compact_every events it is folded into a new snapshot.
+
+    with locking, appends and compactions hold habits.lock. events other
+    processes appended since this storage last read the journal are replayed
+    before writing, so a compaction never drops them
+
+    Attributes:
+        data_dir: Directory where habit data is stored
+        habits: dictionary mapping habit IDs to habit objects
+        compact_every: number of journal events that triggers a compaction
+        journal_events: number of events currently in the journal
+        journal_offset: bytes of the journal this storage has read or written
+    """
+
+    writes_imported_dates = True
+
+    def __init__(self, data_dir="data", compact_every=1000, **options):
+        """
+        Intitialize the journal storage.
+
+        Args:
+            data_dir: directory where habit data is stored
+            compact_every: number of journal events that triggers a compaction
+            options: further Storage options, e.g. lazy or write_behind
+        """
+        super().__init__(data_dir, **options)
+        self.compact_every = compact_every
+        self.journal_events = 0
+        self.journal_offset = 0
+
+    def _journal_path(self):
+        """path of the journal file"""
+        return os.path.join(self.data_dir, "habits.journal")
+
+    def _event(self, kind, habit, timestamp):
+        """
+        Build the journal event for a change
+
+        Args:
+            kind: 'added', 'removed', 'completed' or 'imported'
+            habit: the habit that changed
+            timestamp: the completion date for 'completed' changes, a list of
+                dates for 'imported' changes
+
+        Returns:
+            dictionary describing the change
+        """
+        if kind == 'added':
+            return {'event': 'created', 'habit': habit.to_dict()}
+        if kind == 'removed':
+            return {'event': 'deleted', 'id': habit.id}
+        if kind == 'imported':
+            return {'event': 'imported', 'id': habit.id, 'timestamps': [date.isoformat() for date in timestamp]}
+        return {'event': 'completed', 'id': habit.id, 'timestamp': timestamp.isoformat()}
+
+    @instrument.timed("journal_storage.write")
+    def _write_changes(self, changes):
+        """
+        Append a batch of changes to the journal in a single write
+
+        Args:
+            changes: list of (kind, habit, timestamp) tuples, oldest first
+        """
+        instrument.count("storage.changes_written", len(changes))
+        with self._locked():
+            # a full save folds everything into a new snapshot
+            if any(kind == 'all' for kind, _, _ in changes):
+                self.compact()
+                return
+
+            self._sync()
+            lines = "".join(json.dumps(self._event(*change)) + "\n" for change in changes)
+            with open(self._journal_path(), "ab") as f:
+                f.write(lines.encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+                self.journal_offset = f.tell()
+            # only the changed habits, marking every habit would make each append O(habits)
+            for kind, habit, _ in changes:
+                if kind == 'removed':
+                    self._synced_ids.discard(habit.id)
+                else:
+                    self._synced_ids.add(habit.id)
+                    habit.mark_clean()
+
+            self.journal_events += len(changes)
+            if self.journal_events >= self.compact_every:
+                self.compact()
+
+    def _sync(self):
+        """
+        Merge in what other processes wrote since this storage last read or wrote the data directory
+
+        Returns:
+            bool: true if there was anything to merge
+        """
+        # another process compacted the journal into a new snapshot
+        if super()._sync():
+            return True
+        if not self.locking:
+            return False
+
+        # or only appended events to it
+        try:
+            with open(self._journal_path(), "rb") as f:
+                f.seek(self.journal_offset)
+                events, _ = self._replay(f)
+                self.journal_offset = f.tell()
+        except FileNotFoundError:
+            return False
+        self.journal_events += events
+        return events > 0
+
+    def _merge(self, other):
+        """
+        Merge the habits of another storage of the same data directory into this one
+
+        Args:
+            other: journal storage loaded from the data directory
+        """
+        super()._merge(other)
+        self.journal_offset = other.journal_offset
+        self.journal_events = other.journal_events
+
+    def _apply_event(self, event):
+        """
+        Apply a journal event to the habits in memory
+
+        events are applied idempotently, so replaying a journal that was already
+        folded into the snapshot (e.g. after a crash during compaction) is harmless
+
+        Args:
+            event: dictionary describing the change
+        """
+        if event['event'] == 'created':
+            self._synced_ids.add(event['habit']['id'])
+            if event['habit']['id'] not in self.habits:
+                self._index_habit(Habit.from_dict(event['habit']))
+        elif event['event'] == 'completed':
+            habit = self.get_habit(event['id'])
+            if habit is not None:
+                habit.completions.append(datetime.fromisoformat(event['timestamp']))
+        elif event['event'] == 'imported':
+            habit = self.get_habit(event['id'])
+            if habit is not None:
+                habit.completions.extend(map(datetime.fromisoformat, event['timestamps']))
+        elif event['event'] == 'deleted':
+            self._synced_ids.discard(event['id'])
+            habit = self.get_habit(event['id'])
+            if habit is not None:
+                self._unindex_habit(habit)
+
+    def _replay(self, f):
+        """
+        Apply the events of a journal from its current position
+
+        Args:
+            f: the journal opened for binary reading
+
+        Returns:
+            tuple: (number of events applied, true if a line could not be read)
+        """
+        events = 0
+        damaged = False
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # a crash mid-append can leave a partial last line
+                damaged = True
+                continue
+            self._apply_event(event)
+            events += 1
+        return events, damaged
+
+    @synchronized
+    @instrument.timed("journal_storage.compact")
+    def compact(self):
+        """Fold the journal into a new snapshot of all habits"""
+        with self._locked():
+            self._sync()
+            # the snapshot is replaced atomically before the journal is cleared
+            self._write_snapshot()
+            open(self._journal_path(), "w").close()
+            self.journal_events = 0
+            self.journal_offset = 0
+
+    @synchronized
+    @instrument.timed("journal_storage.load")
+    def load(self):
+        """Load the latest snapshot and replay the journal on top of it"""
+        # no other process may append or compact in between
+        with self._locked():
+            super().load()
+            self.journal_events = 0
+            self.journal_offset = 0
+            damaged = False
+
+            try:
+                with open(self._journal_path(), "rb") as f:
+                    self.journal_events, damaged = self._replay(f)
+                    self.journal_offset = f.tell()
+            except FileNotFoundError:
+                # no journal yet, the snapshot is up to date
+                pass
+            self._mark_synced(self.generation)
+
+            # rewrite a clean snapshot so new events are not appended to a partial line
+            if damaged:
+                self.compact()
@@ -0,0 +1,133 @@
+import codecs
+import json
+import mmap
+
+WHITESPACE = " \t\r\n"
+# characters that may follow a complete number or literal
+DELIMITERS = WHITESPACE + ",]"
+
+def iter_json_array(read, chunk_size=65536):
+    """
+    Parse a top-level JSON array one element at a time
+
+    only the element being parsed is held in memory, plus at most one chunk of
+    text after it. when an element does not fit in the buffer, reads grow with
+    the buffer so large elements are still parsed in linear time
+
+    Args:
+        read: function that takes a number of characters and returns up to that
+            many characters of text, or an empty string at the end
+        chunk_size: number of characters to read at a time
+
+    Returns:
+        generator of the decoded array elements
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    exhausted = False
+    state = 'start'  # then 'value', 'first_value' or 'separator'
+
+    def at_end():
+        """check that only whitespace follows the closing bracket at the current position"""
+        nonlocal position
+        position += 1
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE:
+                position += 1
+            if position < len(buffer):
+                raise ValueError("Unexpected data after JSON array")
+            if exhausted:
+                return
+            fill(chunk_size)
+
+    def fill(size):
+        """read more text, keeping everything from the current position"""
+        nonlocal buffer, position, exhausted
+        chunk = read(size)
+        if not chunk:
+            exhausted = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    while True:
+        while position < len(buffer) and buffer[position] in WHITESPACE:
+            position += 1
+        if position >= len(buffer):
+            if exhausted:
+                raise ValueError("Unexpected end of JSON array")
+            fill(chunk_size)
+            continue
+
+        char = buffer[position]
+        if state == 'start':
+            if char != '[':
+                raise ValueError("Expected a JSON array")
+            position += 1
+            state = 'first_value'
+        elif state == 'separator':
+            if char == ']':
+                at_end()
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' in JSON array, got '{char}'")
+            position += 1
+            state = 'value'
+        elif char == ']' and state == 'first_value':
+            at_end()
+            return
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+                # the element continues past the buffer
+                fill(max(chunk_size, len(buffer) - position))
+                continue
+            if (not exhausted and not isinstance(item, (dict, list, str))
+                    and (end == len(buffer) or buffer[end] not in DELIMITERS)):
+                # a number or literal cut off by the end of the buffer, e.g. "2." of
+                # "2.5", decodes short, so only trust it once a delimiter follows
+                fill(max(chunk_size, len(buffer) - position))
+                continue
+            yield item
+            position = end
+            state = 'separator'
+
+def iter_json_file(path, use_mmap=False, chunk_size=65536):
+    """
+    Parse the elements of a JSON array stored in a file one at a time
+
+    Args:
+        path: path of the JSON file
+        use_mmap: read through a memory map instead of buffered file reads
+        chunk_size: number of characters to read at a time
+
+    Returns:
+        generator of the decoded array elements
+    """
+    with open(path, "rb" if use_mmap else "r", encoding=None if use_mmap else "utf-8") as f:
+        if not use_mmap:
+            yield from iter_json_array(f.read, chunk_size)
+            return
+
+        if f.seek(0, 2) == 0:
+            raise ValueError("Unexpected end of JSON array")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            utf8 = codecs.getincrementaldecoder("utf-8")()
+            offset = 0
+
+            def read(size):
+                nonlocal offset
+                text = ""
+                # keep reading while the bytes only hold part of a character
+                while not text:
+                    data = mapped[offset:offset + size]
+                    offset += len(data)
+                    text = utf8.decode(data, final=not data)
+                    if not data:
+                        break
+                return text
+
+            yield from iter_json_array(read, chunk_size)
@@ -1,9 +1,65 @@
+import time
+# taken before the other imports so --startup-timing includes them
+STARTED = time.perf_counter()
+import argparse
+import os
+import sys
 from cli import HabitTrackerCLI
+from storage import create_storage
+import instrument
 
-def main():
+def main(argv=None):
     """Main entry point for the app"""
-    cli = HabitTrackerCLI()
-    cli.run()
+    parser = argparse.ArgumentParser(
+        description="Track your daily and weekly habits",
+        epilog="run 'main.py list', 'main.py complete NAME', 'main.py stats' ... for a single operation "
+               "or 'main.py batch' to read operations from stdin, see batch.py"
+    )
+    parser.add_argument("--profile", action="store_true",
+                        help="time storage, streak and analytics calls and print a report on exit")
+    parser.add_argument("--startup-timing", action="store_true",
+                        help="print how long imports and loading took before the menu is shown")
+    parser.add_argument("operation", nargs=argparse.REMAINDER, help="operation to run instead of the menu")
+    args = parser.parse_args(argv)
+    if args.profile:
+        instrument.enable()
+
+    backend = os.environ.get("HABIT_STORAGE", "json")
+
+    if args.operation:
+        import batch
+        # every change of the batch is written together when it ends
+        storage = create_storage(
+            backend, lazy=True, write_behind=True, flush_interval=None, flush_batch=None, persist_rollups=True
+        )
+        try:
+            status = batch.run_command(storage, args.operation)
+        finally:
+            if args.profile:
+                instrument.print_report(instrument.get_report(), sys.stderr)
+        sys.exit(status)
+
+    # the storage backend can be chosen with the HABIT_STORAGE environment variable,
+    # completion histories are only parsed once a habit's details are needed and
+    # bursts of changes are written together (pending changes are flushed on exit),
+    # saved rollups let the analytics run without parsing completion histories
+    # and a pre-parsed copy of habits.json saves parsing the JSON on startup
+    imported = time.perf_counter()
+    storage = create_storage(backend, lazy=True, write_behind=True, persist_rollups=True, state_cache=True)
+    cli = HabitTrackerCLI(storage)
+    if args.startup_timing:
+        loaded = time.perf_counter()
+        print(
+            f"startup: imports {(imported - STARTED) * 1000:.1f} ms, load {(loaded - imported) * 1000:.1f} ms, "
+            f"first prompt after {(loaded - STARTED) * 1000:.1f} ms",
+            file=sys.stderr
+        )
+    try:
+        cli.run()
+    finally:
+        if args.profile:
+            storage.flush()
+            instrument.print_report(instrument.get_report())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
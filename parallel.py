@@ -0,0 +1,141 @@
+from datetime import datetime
+from itertools import chain
+from habit import get_period_runs, get_run_length_at, period_ordinal, timestamp_ordinal
+from rollup import PeriodCounts
+
+# habits are split into at most this many chunks by default, enough to keep
+# every core busy while each chunk is large enough to pay for its pickling
+MAX_CHUNKS = 64
+
+def _pack(habits):
+    """
+    reduce habits to what the workers need
+
+    the completion arrays pickle as raw int64 bytes, which is far cheaper to
+    send to another process than habit objects
+
+    Args:
+        habits: list of habits
+
+    Returns:
+        list of (periodicity, archived period ordinals, completion timestamps)
+        tuples, the timestamps exclude archived completions
+    """
+    packed = []
+    for habit in habits:
+        archive = habit.archive
+        archived = archive.rollup.periods(habit.periodicity).ordinals if archive is not None else ()
+        packed.append((habit.periodicity, archived, habit.get_unarchived_stamps()))
+    return packed
+
+def _period_ordinals(periodicity, archived, stamps):
+    """period ordinals of a packed habit, archived periods first"""
+    return chain(archived, (timestamp_ordinal(stamp, periodicity) for stamp in stamps))
+
+def _map_chunks(executor, func, habits, chunk_size, *args):
+    """
+    run a function over chunks of habits in an executor
+
+    Args:
+        executor: a concurrent.futures executor, e.g. a ProcessPoolExecutor
+        func: module level function that takes a packed chunk and the extra
+            arguments and returns one result per habit
+        habits: list of habits
+        chunk_size: number of habits sent to a worker at once, None to split
+            the habits into at most MAX_CHUNKS chunks
+        args: extra arguments for the function
+
+    Returns:
+        list of results in the order of the habits
+    """
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(habits) // MAX_CHUNKS))
+    futures = [
+        executor.submit(func, _pack(habits[i:i + chunk_size]), *args)
+        for i in range(0, len(habits), chunk_size)
+    ]
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    return results
+
+def _chunk_streaks(chunk, today):
+    """current and longest streak of every packed habit"""
+    results = []
+    for periodicity, archived, stamps in chunk:
+        runs = get_period_runs(_period_ordinals(periodicity, archived, stamps))
+        current = get_run_length_at(runs, period_ordinal(today, periodicity))
+        results.append((current, max((length for _, length in runs), default=0)))
+    return results
+
+def _chunk_completed_periods(chunk, days, today):
+    """number of completed periods in the last days of every packed habit"""
+    results = []
+    for periodicity, archived, stamps in chunk:
+        total = days if periodicity == 'daily' else days // 7
+        current = period_ordinal(today, periodicity)
+        periods = PeriodCounts.from_ordinals(_period_ordinals(periodicity, archived, stamps))
+        results.append(periods.completed_between(current - total + 1, current + 1))
+    return results
+
+def streaks(habits, executor, chunk_size=None, today=None):
+    """
+    Calculate the current and longest streak of all habits in an executor
+
+    Args:
+        habits: list of habits
+        executor: a concurrent.futures executor
+        chunk_size: number of habits sent to a worker at once, None for an even split
+        today: the current date, now by default
+
+    Returns:
+        Dictionary that maps habit names to (current streak, longest streak)
+    """
+    if today is None:
+        today = datetime.now()
+    results = _map_chunks(executor, _chunk_streaks, habits, chunk_size, today)
+    return {habit.name: result for habit, result in zip(habits, results)}
+
+def longest_streak_habit(habits, executor, chunk_size=None):
+    """
+    Find the habit with the longest streak ever recorded in an executor
+
+    Args:
+        habits: list of habits
+        executor: a concurrent.futures executor
+        chunk_size: number of habits sent to a worker at once, None for an even split
+
+    Returns:
+        tuple of (habit, streak), (None, 0) without habits
+    """
+    results = _map_chunks(executor, _chunk_streaks, habits, chunk_size, datetime.now())
+    best_habit, best_streak = None, 0
+    for habit, (_, longest) in zip(habits, results):
+        # later habits win ties, like analytics.get_longest_streak_habit
+        if best_habit is None or longest >= best_streak:
+            best_habit, best_streak = habit, longest
+    return best_habit, best_streak
+
+def completion_rates(habits, days, executor, chunk_size=None, today=None):
+    """
+    Calculate completion rates for all habits in an executor, see analytics.get_completion_rate
+
+    Args:
+        habits: list of habits
+        days: number of days to look back
+        executor: a concurrent.futures executor
+        chunk_size: number of habits sent to a worker at once, None for an even split
+        today: the current date, now by default
+
+    Returns:
+        Dictionary that maps habit names to completion rates (0-100%)
+    """
+    if today is None:
+        today = datetime.now()
+    results = _map_chunks(executor, _chunk_completed_periods, habits, chunk_size, days, today)
+
+    rates = {}
+    for habit, completed in zip(habits, results):
+        total = days if habit.periodicity == 'daily' else days // 7
+        rates[habit.name] = completed / total * 100 if total > 0 else 0
+    return rates
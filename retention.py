@@ -0,0 +1,187 @@
+import json
+from atomic_file import atomic_write
+from bisect import bisect_left
+from datetime import datetime
+from habit import Completions, get_period_runs, timestamp_ordinal, to_timestamp
+from rollup import HabitRollup
+
+class HabitArchive:
+    """
+    aggregates of a habit's completions before a horizon
+
+    the raw completions are replaced by their per-day and per-week counts.
+    the runs of consecutive completed days and weeks follow from the counts,
+    so streaks, completion rates and window statistics over archived periods
+    are exactly what they were with the raw completions
+
+    attributes:
+        horizon: day ordinal of the monday before which completions are archived
+        horizon_stamp: the horizon as a completion timestamp, see to_timestamp
+        rollup: HabitRollup of the archived completions
+    """
+
+    __slots__ = ('horizon', 'horizon_stamp', 'rollup', '_runs')
+
+    def __init__(self, horizon, rollup=None):
+        """
+        Initialize the archive
+
+        Args:
+            horizon: day ordinal of a monday, completions before it are archived
+            rollup: HabitRollup of the archived completions, empty by default
+        """
+        self.horizon = horizon
+        self.horizon_stamp = to_timestamp(datetime.fromordinal(horizon))
+        self.rollup = rollup if rollup is not None else HabitRollup()
+        # runs are worked out from the counts on first use
+        self._runs = {}
+
+    @property
+    def completion_count(self):
+        """number of archived completions"""
+        return self.rollup.days.prefix[-1]
+
+    def get_runs(self, periodicity):
+        """
+        get the runs of consecutive completed periods before the horizon
+
+        Args:
+            periodicity: 'daily' or 'weekly'
+
+        Returns:
+            list of (first ordinal, length) tuples, oldest run first
+        """
+        runs = self._runs.get(periodicity)
+        if runs is None:
+            runs = self._runs[periodicity] = get_period_runs(self.rollup.periods(periodicity).ordinals)
+        return runs
+
+    def extended(self, days, horizon):
+        """
+        add completions from the current horizon up to a later one
+
+        Args:
+            days: ascending day ordinals of the completions, one per completion,
+                all on or after the current horizon and before the new one
+            horizon: the new horizon, a monday
+
+        Returns:
+            HabitArchive: the new archive
+        """
+        return HabitArchive(horizon, HabitRollup.concat(self.rollup, HabitRollup.from_days(days)))
+
+    def to_dict(self):
+        """
+        convert the archive to a dictionary for storage
+
+        Returns:
+            dictionary with the horizon and the day and week counts
+        """
+        data = self.rollup.to_dict()
+        data['horizon'] = self.horizon
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        create an archive from a dictionary
+
+        Args:
+            data: dictionary representation of the archive
+
+        Returns:
+            HabitArchive: the archive
+        """
+        return cls(data['horizon'], HabitRollup.from_dict(data))
+
+def get_horizon(retention_days, now=None):
+    """
+    Find the retention horizon for a number of days
+
+    the horizon is moved back to a monday, so no day or week is split between
+    the archive and the raw completions
+
+    Args:
+        retention_days: number of days of raw completions to keep
+        now: the current date, now by default
+
+    Returns:
+        int: day ordinal of the horizon
+    """
+    if now is None:
+        now = datetime.now()
+    day = now.toordinal() - retention_days
+    # day 1 of the ordinal calendar is a monday, see period_ordinal
+    return day - (day - 1) % 7
+
+def archive_completions(habit, horizon):
+    """
+    Move the completions of a habit before a horizon into its archive
+
+    completions that were already archived are dropped without being counted
+    again, so archiving the same completions twice is harmless
+
+    Args:
+        habit: the habit
+        horizon: day ordinal of a monday, see get_horizon
+
+    Returns:
+        int: number of completions archived
+    """
+    archive = habit.archive
+    if archive is not None and horizon <= archive.horizon:
+        return 0
+
+    stamps = habit.completions.stamps
+    end = bisect_left(stamps, to_timestamp(datetime.fromordinal(horizon)))
+    start = 0 if archive is None else bisect_left(stamps, archive.horizon_stamp, 0, end)
+    if start == end:
+        return 0
+
+    days = (timestamp_ordinal(stamp, 'daily') for stamp in stamps[start:end])
+    if archive is None:
+        archive = HabitArchive(horizon, HabitRollup.from_days(days))
+    else:
+        archive = archive.extended(days, horizon)
+
+    # the remaining timestamps are still sorted and unique
+    completions = Completions()
+    completions.stamps = stamps[end:]
+    habit.completions = completions
+    habit.archive = archive
+    return end - start
+
+def write_archives(path, habits):
+    """
+    Write the archives of all habits that have one
+
+    Args:
+        path: path of the archive file
+        habits: list of habits
+    """
+    data = {'habits': {habit.id: habit.archive.to_dict() for habit in habits if habit.archive is not None}}
+    with atomic_write(path) as f:
+        json.dump(data, f)
+
+def read_archives(path):
+    """
+    Read the archives written by write_archives
+
+    unlike rollups, archives cannot be rebuilt from the snapshot, so a damaged
+    file raises an error instead of being ignored
+
+    Args:
+        path: path of the archive file
+
+    Returns:
+        dictionary mapping habit IDs to archives, empty if there is no file
+    """
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    try:
+        return {habit_id: HabitArchive.from_dict(archive) for habit_id, archive in data['habits'].items()}
+    except (KeyError, TypeError) as error:
+        raise ValueError(f"Damaged archive file {path}") from error
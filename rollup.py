@@ -0,0 +1,319 @@
+import json
+from array import array
+from atomic_file import atomic_write, file_signature
+from bisect import bisect_left
+
+class PeriodCounts:
+    """
+    completion counts per period with prefix sums for range queries
+
+    only periods with at least one completion are stored, so the ordinals work
+    like a sparse bitmap of completed periods. prefix[i] is the number of
+    completions in the first i stored periods, which turns any range count into
+    two binary searches and a subtraction
+
+    attributes:
+        ordinals: ascending array of completed period ordinals
+        prefix: array of running completion totals, one longer than ordinals
+    """
+
+    __slots__ = ('ordinals', 'prefix')
+
+    def __init__(self):
+        """Initialize empty counts"""
+        self.ordinals = array('q')
+        self.prefix = array('q', [0])
+
+    @classmethod
+    def from_ordinals(cls, ordinals):
+        """
+        count period ordinals
+
+        Args:
+            ordinals: period ordinals in ascending order, repeats allowed
+
+        Returns:
+            PeriodCounts: the counts
+        """
+        counts = cls()
+        for ordinal in ordinals:
+            if counts.ordinals and counts.ordinals[-1] == ordinal:
+                counts.prefix[-1] += 1
+            else:
+                counts.ordinals.append(ordinal)
+                counts.prefix.append(counts.prefix[-1] + 1)
+        return counts
+
+    @classmethod
+    def from_prefix(cls, ordinals, prefix):
+        """
+        create the counts from saved ordinals and prefix sums
+
+        Args:
+            ordinals: ascending period ordinals
+            prefix: running completion totals starting with 0
+
+        Returns:
+            PeriodCounts: the counts
+        """
+        if len(prefix) != len(ordinals) + 1:
+            raise ValueError("Prefix sums do not match the ordinals")
+        counts = cls()
+        counts.ordinals = array('q', ordinals)
+        counts.prefix = array('q', prefix)
+        return counts
+
+    @classmethod
+    def concat(cls, older, newer):
+        """
+        join the counts of two ranges of periods, e.g. archived and recent ones
+
+        Args:
+            older: PeriodCounts whose periods all come before those of newer
+            newer: PeriodCounts of the later periods
+
+        Returns:
+            PeriodCounts: the joined counts
+        """
+        total = older.prefix[-1]
+        counts = cls()
+        counts.ordinals = older.ordinals + newer.ordinals
+        counts.prefix = older.prefix + array('q', (total + value for value in newer.prefix[1:]))
+        return counts
+
+    def add(self, ordinal, count=1):
+        """
+        add completions to a period
+
+        completions in the latest period or after it are added in constant time
+
+        Args:
+            ordinal: the period ordinal
+            count: number of completions to add
+        """
+        ordinals = self.ordinals
+        if not ordinals or ordinal > ordinals[-1]:
+            ordinals.append(ordinal)
+            self.prefix.append(self.prefix[-1] + count)
+            return
+        if ordinal == ordinals[-1]:
+            self.prefix[-1] += count
+            return
+
+        index = bisect_left(ordinals, ordinal)
+        if ordinals[index] != ordinal:
+            ordinals.insert(index, ordinal)
+            self.prefix.insert(index + 1, self.prefix[index])
+        for i in range(index + 1, len(self.prefix)):
+            self.prefix[i] += count
+
+    def get_counts(self):
+        """
+        get the number of completions of every completed period
+
+        Returns:
+            list of counts in the order of the ordinals
+        """
+        prefix = self.prefix
+        return [prefix[i + 1] - prefix[i] for i in range(len(self.ordinals))]
+
+    def completed_between(self, start, end):
+        """
+        count the completed periods in a range of ordinals
+
+        Args:
+            start: first ordinal of the range (inclusive)
+            end: last ordinal of the range (exclusive)
+
+        Returns:
+            int: number of periods with at least one completion
+        """
+        return bisect_left(self.ordinals, end) - bisect_left(self.ordinals, start)
+
+    def completions_between(self, start, end):
+        """
+        count the completions in a range of ordinals
+
+        Args:
+            start: first ordinal of the range (inclusive)
+            end: last ordinal of the range (exclusive)
+
+        Returns:
+            int: number of completions
+        """
+        return self.prefix[bisect_left(self.ordinals, end)] - self.prefix[bisect_left(self.ordinals, start)]
+
+    def __contains__(self, ordinal):
+        """check if a period has at least one completion"""
+        ordinals = self.ordinals
+        # the latest period is by far the most common question
+        if ordinals and ordinals[-1] == ordinal:
+            return True
+        index = bisect_left(ordinals, ordinal)
+        return index < len(ordinals) and ordinals[index] == ordinal
+
+class HabitRollup:
+    """
+    per-day and per-week completion counts of a habit
+
+    attributes:
+        days: PeriodCounts by day ordinal
+        weeks: PeriodCounts by week ordinal
+        version: Completions.version the rollup was built for
+    """
+
+    __slots__ = ('days', 'weeks', 'version')
+
+    def __init__(self, days=None, weeks=None, version=0):
+        """
+        Initialize the rollup
+
+        Args:
+            days: PeriodCounts by day ordinal
+            weeks: PeriodCounts by week ordinal
+            version: Completions.version the rollup was built for
+        """
+        self.days = days if days is not None else PeriodCounts()
+        self.weeks = weeks if weeks is not None else PeriodCounts()
+        self.version = version
+
+    @classmethod
+    def from_days(cls, days, version=0):
+        """
+        build the rollup from the day ordinals of the completions
+
+        Args:
+            days: ascending day ordinals, one per completion
+            version: Completions.version of the completions
+
+        Returns:
+            HabitRollup: the rollup
+        """
+        days = PeriodCounts.from_ordinals(days)
+        return cls(days, cls._weeks_from_days(days), version)
+
+    @classmethod
+    def concat(cls, older, newer, version=0):
+        """
+        join the rollups of two ranges of completions, e.g. archived and recent ones
+
+        Args:
+            older: HabitRollup of completions before a monday
+            newer: HabitRollup of the completions from that monday on
+            version: Completions.version of the newer completions
+
+        Returns:
+            HabitRollup: the joined rollup
+        """
+        return cls(
+            PeriodCounts.concat(older.days, newer.days),
+            PeriodCounts.concat(older.weeks, newer.weeks),
+            version,
+        )
+
+    @staticmethod
+    def _weeks_from_days(days):
+        """fold day counts into week counts"""
+        weeks = PeriodCounts()
+        for ordinal, count in zip(days.ordinals, days.get_counts()):
+            # day 1 of the ordinal calendar is a monday, see period_ordinal
+            weeks.add((ordinal - 1) // 7, count)
+        return weeks
+
+    def add(self, day):
+        """
+        add a single completion
+
+        Args:
+            day: day ordinal of the completion
+        """
+        self.days.add(day)
+        self.weeks.add((day - 1) // 7)
+
+    def periods(self, periodicity):
+        """
+        get the counts for a periodicity
+
+        Args:
+            periodicity: 'daily' or 'weekly'
+
+        Returns:
+            PeriodCounts: the day or week counts
+        """
+        return self.days if periodicity == 'daily' else self.weeks
+
+    def to_dict(self):
+        """
+        convert the rollup to a dictionary for storage
+
+        Returns:
+            dictionary with the completed days and weeks and their prefix sums
+        """
+        return {
+            'days': self.days.ordinals.tolist(),
+            'day_prefix': self.days.prefix.tolist(),
+            'weeks': self.weeks.ordinals.tolist(),
+            'week_prefix': self.weeks.prefix.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        create a rollup from a dictionary
+
+        Args:
+            data: dictionary representation of the rollup
+
+        Returns:
+            HabitRollup: the rollup, for the completions as they were saved
+        """
+        return cls(
+            PeriodCounts.from_prefix(data['days'], data['day_prefix']),
+            PeriodCounts.from_prefix(data['weeks'], data['week_prefix']),
+        )
+
+def _snapshot_signature(snapshot_path):
+    """size and modification time of a snapshot file, as saved in rollups.json"""
+    size, mtime_ns = file_signature(snapshot_path)
+    return {'size': size, 'mtime_ns': mtime_ns}
+
+def write_rollups(path, habits, snapshot_path):
+    """
+    Write the rollups of all habits next to their snapshot
+
+    the rollups are tied to the snapshot file by its size and modification time,
+    so they are only used together with the snapshot they were written for
+
+    Args:
+        path: path of the rollup file
+        habits: list of habits
+        snapshot_path: path of the snapshot that holds the habits
+    """
+    data = {
+        'snapshot': _snapshot_signature(snapshot_path),
+        'habits': {habit.id: habit.get_rollup().to_dict() for habit in habits},
+    }
+    with atomic_write(path) as f:
+        json.dump(data, f)
+
+def read_rollups(path, snapshot_path):
+    """
+    Read the rollups written for a snapshot
+
+    Args:
+        path: path of the rollup file
+        snapshot_path: path of the snapshot the rollups belong to
+
+    Returns:
+        dictionary mapping habit IDs to rollups, empty if the file is missing,
+        damaged or was written for a different snapshot
+    """
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        if data['snapshot'] != _snapshot_signature(snapshot_path):
+            return {}
+        return {habit_id: HabitRollup.from_dict(rollup) for habit_id, rollup in data['habits'].items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        # rebuilt from the completions when needed
+        return {}
@@ -0,0 +1,398 @@
+import argparse
+import asyncio
+import json
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from habit import Habit, habit_summary
+from storage import create_storage
+import analytics
+
+REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+class HTTPError(Exception):
+    """An error that is sent back to the client with an HTTP status code"""
+
+    def __init__(self, status, message):
+        """
+        Initialize the error
+
+        Args:
+            status: HTTP status code
+            message: error message for the client
+        """
+        super().__init__(message)
+        self.status = status
+
+def _int_param(params, name, default):
+    """read an integer query parameter"""
+    try:
+        return int(params.get(name, default))
+    except ValueError:
+        raise HTTPError(400, f"'{name}' must be an integer")
+
+def _date_param(params, name):
+    """read an ISO 8601 date query parameter, as a naive local time like the completions"""
+    try:
+        date = datetime.fromisoformat(params[name])
+    except KeyError:
+        raise HTTPError(400, f"Missing parameter '{name}'")
+    except ValueError:
+        raise HTTPError(400, f"'{name}' must be an ISO 8601 date")
+    if date.tzinfo is not None:
+        # same conversion as bulk.validate_records
+        date = date.astimezone().replace(tzinfo=None)
+    return date
+
+def run_analytics(storage, name, params):
+    """
+    Run one of the analytics functions and convert its result to JSON friendly data
+
+    Args:
+        storage: the storage instance
+        name: name of the analytics function without the 'get_' prefix
+        params: query parameters
+
+    Returns:
+        the result of the analytics function
+    """
+    def habit_param():
+        habit = storage.get_habit(params.get('habit_id', ''))
+        if habit is None:
+            raise HTTPError(404, "Habit not found")
+        return habit
+
+    if name == 'all_habits':
+        return [habit_summary(habit) for habit in analytics.get_all_habits(storage)]
+    if name == 'habits_by_periodicity':
+        periodicity = params.get('periodicity', '')
+        if periodicity not in ['daily', 'weekly']:
+            raise HTTPError(400, "'periodicity' must be 'daily' or 'weekly'")
+        return [habit_summary(habit) for habit in analytics.get_habits_by_periodicity(storage, periodicity)]
+    if name == 'longest_streak_habit':
+        habit, streak = analytics.get_longest_streak_habit(storage)
+        return {'habit': habit_summary(habit) if habit else None, 'streak': streak}
+    if name == 'streak_for_habit':
+        return analytics.get_streak_for_habit(habit_param())
+    if name == 'longest_streak_for_habit':
+        return analytics.get_longest_streak_for_habit(habit_param())
+    if name == 'streak_runs_for_habit':
+        return analytics.get_streak_runs_for_habit(habit_param())
+    if name == 'completion_rate':
+        return analytics.get_completion_rate(storage, _int_param(params, 'days', 30))
+    if name == 'all_streaks':
+        return {
+            habit_name: {'current_streak': current, 'longest_streak': longest}
+            for habit_name, (current, longest) in analytics.get_all_streaks(storage).items()
+        }
+    if name == 'completion_histogram':
+        return analytics.get_completion_histogram(storage, _int_param(params, 'periods', 4))
+    if name == 'window_stats':
+        try:
+            return analytics.get_window_stats(
+                storage, _date_param(params, 'start'), _date_param(params, 'end'), params.get('group_by', 'habit')
+            )
+        except ValueError as error:
+            raise HTTPError(400, str(error))
+    if name == 'habits_completed_today':
+        return [habit_summary(habit) for habit in analytics.get_habits_completed_today(storage)]
+    if name == 'habits_to_complete_today':
+        return [habit_summary(habit) for habit in analytics.get_habits_to_complete_today(storage)]
+    raise HTTPError(404, f"Unknown analytics '{name}'")
+
+class HabitServer:
+    """
+    An asyncio HTTP server that exposes a storage and the analytics as JSON endpoints.
+
+    requests are parsed on the event loop, while storage operations and analytics
+    run in a thread pool so file and database I/O never blocks other clients.
+    every operation holds one lock, so the storage itself need not be thread
+    safe (a storage with a write-behind flush timer always is, see Storage).
+    writes are queued and applied in batches, one pool job per batch.
+
+    Endpoints:
+        GET    /habits                    list all habits
+        POST   /habits                    add a habit from {"name", "description", "periodicity"}
+        GET    /habits/<id>               get a habit with its recent completions
+        DELETE /habits/<id>               delete a habit
+        POST   /habits/<id>/complete      complete a habit
+        GET    /analytics/<name>          run analytics.get_<name>, e.g. /analytics/completion_rate?days=30
+                                          or /analytics/window_stats?start=2024-01-01&end=2024-04-01&group_by=month
+
+    Attributes:
+        storage: the storage instance
+        max_batch: maximum number of writes applied in one batch
+    """
+
+    def __init__(self, storage, max_workers=4, max_batch=100):
+        """
+        Initialize the server
+
+        Args:
+            storage: the loaded storage instance
+            max_workers: number of threads for storage operations
+            max_batch: maximum number of writes applied in one batch
+        """
+        self.storage = storage
+        self.max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._writes = None
+        self._writer = None
+
+    async def _run(self, func, *args):
+        """run a storage operation in the thread pool while holding the storage lock"""
+        def locked():
+            with self._lock:
+                return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, locked)
+
+    async def _write(self, func, *args):
+        """
+        queue a write for the batch writer and wait for its result
+
+        Args:
+            func: function that performs the write on the storage
+            args: arguments for the function
+
+        Returns:
+            the result of the function
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._writes.put((func, args, future))
+        return await future
+
+    async def _write_batches(self):
+        """apply queued writes in batches, one thread pool job per batch"""
+        while True:
+            batch = [await self._writes.get()]
+            while len(batch) < self.max_batch and not self._writes.empty():
+                batch.append(self._writes.get_nowait())
+
+            def apply_batch():
+                results = []
+                for func, args, _ in batch:
+                    try:
+                        results.append((func(*args), None))
+                    except Exception as error:
+                        results.append((None, error))
+                return results
+
+            results = await self._run(apply_batch)
+            for (_, _, future), (result, error) in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    async def route(self, method, path, params, body):
+        """
+        Dispatch a request to the matching endpoint
+
+        Args:
+            method: HTTP method
+            path: request path
+            params: query parameters
+            body: decoded JSON body, or None
+
+        Returns:
+            tuple of (status code, JSON friendly response)
+        """
+        parts = [part for part in path.split("/") if part]
+
+        if parts == ['habits']:
+            if method == 'GET':
+                return 200, await self._run(lambda: [habit_summary(habit) for habit in self.storage.get_all_habits()])
+            if method == 'POST':
+                if not isinstance(body, dict):
+                    raise HTTPError(400, "Expected a JSON object")
+                try:
+                    habit = Habit(str(body['name']), str(body.get('description', '')), str(body['periodicity']))
+                except KeyError as error:
+                    raise HTTPError(400, f"Missing field {error}")
+                except ValueError as error:
+                    raise HTTPError(400, str(error))
+                await self._write(self.storage.add_habit, habit)
+                return 201, await self._run(habit_summary, habit)
+            raise HTTPError(405, "Method not allowed")
+
+        if len(parts) in [2, 3] and parts[0] == 'habits':
+            habit_id = parts[1]
+
+            if len(parts) == 3:
+                if parts[2] != 'complete':
+                    raise HTTPError(404, "Not found")
+                if method != 'POST':
+                    raise HTTPError(405, "Method not allowed")
+
+                def complete():
+                    habit = self.storage.get_habit(habit_id)
+                    if habit is None:
+                        raise HTTPError(404, "Habit not found")
+                    return self.storage.complete_habit(habit)
+
+                timestamp = await self._write(complete)
+                return 200, {'id': habit_id, 'completed_at': timestamp.isoformat()}
+
+            if method == 'GET':
+                def details():
+                    habit = self.storage.get_habit(habit_id)
+                    if habit is None:
+                        raise HTTPError(404, "Habit not found")
+                    summary = habit_summary(habit)
+                    summary['completions'] = habit.get_completion_counts()[0]
+                    summary['recent_completions'] = [
+                        completion.isoformat() for completion in reversed(habit.completions[-5:])
+                    ]
+                    return summary
+                return 200, await self._run(details)
+            if method == 'DELETE':
+                if not await self._write(self.storage.remove_habit, habit_id):
+                    raise HTTPError(404, "Habit not found")
+                return 200, {'id': habit_id, 'deleted': True}
+            raise HTTPError(405, "Method not allowed")
+
+        if len(parts) == 2 and parts[0] == 'analytics':
+            if method != 'GET':
+                raise HTTPError(405, "Method not allowed")
+            return 200, await self._run(run_analytics, self.storage, parts[1], params)
+
+        raise HTTPError(404, "Not found")
+
+    async def handle_client(self, reader, writer):
+        """
+        Serve HTTP requests from one connection until it is closed
+
+        Args:
+            reader: stream reader of the connection
+            writer: stream writer of the connection
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in [b"\r\n", b"\n", b""]:
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    break
+                raw_body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                try:
+                    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                    url = urlsplit(target)
+                    params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                    try:
+                        body = json.loads(raw_body) if raw_body else None
+                    except ValueError:
+                        raise HTTPError(400, "Invalid JSON body")
+                    status, payload = await self.route(method.upper(), url.path, params, body)
+                except HTTPError as error:
+                    status, payload = error.status, {'error': str(error)}
+                except ValueError:
+                    status, payload = 400, {'error': "Malformed request"}
+                except Exception:
+                    # a bug must not drop the connection without a reply
+                    traceback.print_exc()
+                    status, payload = 500, {'error': "Internal server error"}
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8080):
+        """
+        Start listening for connections
+
+        Args:
+            host: address to listen on
+            port: port to listen on
+
+        Returns:
+            the asyncio server
+        """
+        self._writes = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_batches())
+        return await asyncio.start_server(self.handle_client, host, port)
+
+    async def stop(self, server):
+        """
+        Stop the server and release its resources
+
+        Args:
+            server: the asyncio server returned by start
+        """
+        server.close()
+        await server.wait_closed()
+        if self._writer is not None:
+            self._writer.cancel()
+        self._executor.shutdown(wait=True)
+
+    async def serve_forever(self, host="127.0.0.1", port=8080):
+        """
+        Serve until the task is cancelled
+
+        Args:
+            host: address to listen on
+            port: port to listen on
+        """
+        server = await self.start(host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop(server)
+
+def main(argv=None):
+    """run the server from the command line"""
+    parser = argparse.ArgumentParser(description="Serve the habit tracker as a JSON API")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--data-dir", default="data", help="directory where habit data is stored")
+    parser.add_argument("--backend", default="json", help="storage backend: json, journal or sqlite")
+    parser.add_argument("--workers", type=int, default=4, help="threads for storage operations")
+    args = parser.parse_args(argv)
+
+    # writes from a batch are coalesced into as few disk writes as possible
+    storage = create_storage(args.backend, args.data_dir, write_behind=True)
+    storage.load()
+
+    print(f"Serving habits on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(HabitServer(storage, args.workers).serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        storage.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import contextlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from storage import create_storage
+
+USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$")
+
+class ShardedStorage:
+    """
+    A storage layer that keeps each user's habits in a separate shard.
+
+    every user gets their own directory under data_dir/users with a storage of
+    the chosen backend. only the requested user's shard is loaded, and at most
+    max_open shards are kept in memory, the least recently used one is closed
+    first. shards are loaded outside the lock that guards the open shards, so
+    loading one user's shard never delays other users.
+
+    Attributes:
+        data_dir: Directory where the user shards are stored
+        backend: storage backend used for every shard (see create_storage)
+        max_open: maximum number of shards kept open
+        options: extra keyword arguments for the backend
+        shards: open shards by user ID, least recently used first
+    """
+
+    def __init__(self, data_dir="data", backend="json", max_open=64, **options):
+        """
+        Intitialize the sharded storage.
+
+        Args:
+            data_dir: directory where the user shards are stored
+            backend: storage backend used for every shard
+            max_open: maximum number of shards kept open
+            options: extra keyword arguments for the backend
+        """
+        self.data_dir = data_dir
+        self.backend = backend
+        self.max_open = max_open
+        self.options = options
+        self.shards = OrderedDict()
+        self._lock = threading.Lock()
+        # user ID -> Event set once a shard being loaded is ready, so concurrent requests load it once
+        self._loading = {}
+        # shard -> number of user_storage() blocks using it, and evicted shards
+        # that are closed once the last of them ends
+        self._users = {}
+        self._evicted = set()
+
+        users_dir = os.path.join(data_dir, "users")
+        if not os.path.exists(users_dir):
+            os.makedirs(users_dir)
+
+    def _shard_dir(self, user_id):
+        """
+        get the directory of a user's shard
+
+        Args:
+            user_id: ID of the user
+
+        Returns:
+            str: path of the shard directory
+        """
+        if not USER_ID_PATTERN.match(user_id):
+            raise ValueError(f"Invalid user ID '{user_id}'")
+        return os.path.join(self.data_dir, "users", user_id)
+
+    def get_user_storage(self, user_id):
+        """
+        Get the storage of a user, loading the shard if it is not open yet
+
+        the shard may be closed once max_open other users were requested, so
+        callers that may run while other threads request shards should use
+        user_storage() instead of keeping the returned storage
+
+        Args:
+            user_id: ID of the user
+
+        Returns:
+            Storage: the user's storage
+        """
+        return self._open(user_id, use=False)
+
+    @contextlib.contextmanager
+    def user_storage(self, user_id):
+        """
+        Use the storage of a user, which is not closed before the block ends
+
+        Args:
+            user_id: ID of the user
+
+        Returns:
+            context manager that gives the user's storage
+        """
+        storage = self._open(user_id, use=True)
+        try:
+            yield storage
+        finally:
+            self._release(storage)
+
+    def _release(self, storage):
+        """
+        End a use of a shard and close it if it was evicted in the meantime
+
+        Args:
+            storage: the shard
+        """
+        with self._lock:
+            self._users[storage] -= 1
+            if self._users[storage]:
+                return
+            del self._users[storage]
+            if storage not in self._evicted:
+                return
+            self._evicted.discard(storage)
+        storage.close()
+
+    def _open(self, user_id, use):
+        """
+        Get the storage of a user, loading it outside the lock if needed
+
+        Args:
+            user_id: ID of the user
+            use: count the caller as a user of the shard until _release
+
+        Returns:
+            Storage: the user's storage
+        """
+        shard_dir = self._shard_dir(user_id)
+        while True:
+            with self._lock:
+                storage = self.shards.get(user_id)
+                if storage is not None:
+                    self.shards.move_to_end(user_id)
+                    if use:
+                        self._users[storage] = self._users.get(storage, 0) + 1
+                    return storage
+                loading = self._loading.get(user_id)
+                if loading is None:
+                    loading = self._loading[user_id] = threading.Event()
+                    break
+            # another thread is loading the shard, look again once it is done,
+            # as it may have failed or been evicted in between
+            loading.wait()
+
+        try:
+            storage = create_storage(self.backend, shard_dir, **self.options)
+            storage.load()
+        except BaseException:
+            with self._lock:
+                del self._loading[user_id]
+            loading.set()
+            raise
+
+        evicted = []
+        with self._lock:
+            del self._loading[user_id]
+            self.shards[user_id] = storage
+            if use:
+                self._users[storage] = self._users.get(storage, 0) + 1
+
+            # close the least recently used shards, or once their last user is done
+            while len(self.shards) > self.max_open:
+                _, shard = self.shards.popitem(last=False)
+                if shard in self._users:
+                    self._evicted.add(shard)
+                else:
+                    evicted.append(shard)
+        loading.set()
+
+        for shard in evicted:
+            shard.close()
+        return storage
+
+    def get_user_ids(self):
+        """
+        Get the IDs of all users with a shard
+
+        Returns:
+            list: sorted user IDs
+        """
+        return sorted(os.listdir(os.path.join(self.data_dir, "users")))
+
+    def close(self):
+        """Close every open shard"""
+        with self._lock:
+            while self.shards:
+                _, storage = self.shards.popitem(last=False)
+                storage.close()
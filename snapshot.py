@@ -0,0 +1,278 @@
+import argparse
+import json
+import struct
+import sys
+from array import array
+from atomic_file import atomic_write, file_signature
+from habit import Habit, Completions, from_timestamp, to_timestamp
+from json_stream import iter_json_file
+
+# file header: magic, format version, number of habits
+HEADER = struct.Struct("<4sHI")
+MAGIC = b"HABT"
+VERSION = 1
+# every habit record starts with its length so readers can skip whole records
+RECORD_LENGTH = struct.Struct("<I")
+# created_at timestamp and number of completions
+RECORD_FIELDS = struct.Struct("<qI")
+STRING_LENGTH = struct.Struct("<I")
+STAMP_SIZE = 8
+# state cache header: magic, size and modification time of the source snapshot
+CACHE_HEADER = struct.Struct("<4sqq")
+CACHE_MAGIC = b"HCCH"
+
+SNAPSHOT_FILES = {'json': "habits.json", 'binary': "habits.bin"}
+
+def detect_snapshot_format(path, fmt=None):
+    """
+    Work out the snapshot format from an explicit choice or the file extension
+
+    Args:
+        path: path of the snapshot file
+        fmt: 'json' or 'binary', or None to use the extension
+
+    Returns:
+        str: 'json' or 'binary'
+    """
+    if fmt is None:
+        fmt = "binary" if path.lower().endswith(".bin") else "json"
+    if fmt not in SNAPSHOT_FILES:
+        raise ValueError(f"Unknown snapshot format '{fmt}', expected 'json' or 'binary'")
+    return fmt
+
+def _pack_string(text):
+    """encode a string with its length in front"""
+    data = text.encode("utf-8")
+    return STRING_LENGTH.pack(len(data)) + data
+
+def _unpack_string(view, offset):
+    """decode a length prefixed string, returns the string and the offset after it"""
+    (length,) = STRING_LENGTH.unpack_from(view, offset)
+    offset += STRING_LENGTH.size
+    return str(view[offset:offset + length], "utf-8"), offset + length
+
+def _stamps_from_bytes(data):
+    """
+    turn little endian int64 bytes into an array of timestamps
+
+    Args:
+        data: bytes-like object with the timestamps
+
+    Returns:
+        array: the timestamps
+    """
+    stamps = array('q')
+    stamps.frombytes(data)
+    if sys.byteorder == "big":
+        stamps.byteswap()
+    return stamps
+
+def _completions_from_bytes(data):
+    """build a Completions collection from stored timestamps without re-sorting them"""
+    completions = Completions()
+    # snapshots are always written from a sorted and deduplicated collection
+    completions.stamps = _stamps_from_bytes(data)
+    return completions
+
+def write_binary(f, habits):
+    """
+    Write habits to a binary file object in the compact snapshot format
+
+    every habit is one length prefixed record of its created_at timestamp,
+    completion count, id, name, description, periodicity and then the completion
+    timestamps as little endian int64 values
+
+    Args:
+        f: file object opened for binary writing
+        habits: list of habits
+    """
+    f.write(HEADER.pack(MAGIC, VERSION, len(habits)))
+    for habit in habits:
+        stamps = habit.completions.stamps
+        if sys.byteorder == "big":
+            stamps = array('q', stamps)
+            stamps.byteswap()
+
+        record = b"".join([
+            RECORD_FIELDS.pack(to_timestamp(habit.created_at), len(stamps)),
+            _pack_string(habit.id),
+            _pack_string(habit.name),
+            _pack_string(habit.description),
+            _pack_string(habit.periodicity),
+            stamps.tobytes(),
+        ])
+        f.write(RECORD_LENGTH.pack(len(record)))
+        f.write(record)
+
+def iter_binary(data, lazy=False):
+    """
+    Create habits from a binary snapshot
+
+    fields are unpacked straight from a memoryview, only the strings are decoded
+
+    Args:
+        data: bytes-like object with the snapshot
+        lazy: if true, completion timestamps are only copied on first access
+
+    Returns:
+        generator of habits
+    """
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise ValueError("Not a binary habit snapshot")
+    magic, version, count = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a binary habit snapshot")
+    if version != VERSION:
+        raise ValueError(f"Unsupported binary snapshot version {version}")
+
+    offset = HEADER.size
+    for _ in range(count):
+        if offset + RECORD_LENGTH.size > len(view):
+            raise ValueError("Truncated binary snapshot")
+        (length,) = RECORD_LENGTH.unpack_from(view, offset)
+        offset += RECORD_LENGTH.size
+        end = offset + length
+        if end > len(view):
+            raise ValueError("Truncated binary snapshot")
+
+        created_at, stamp_count = RECORD_FIELDS.unpack_from(view, offset)
+        position = offset + RECORD_FIELDS.size
+        habit_id, position = _unpack_string(view, position)
+        name, position = _unpack_string(view, position)
+        description, position = _unpack_string(view, position)
+        periodicity, position = _unpack_string(view, position)
+        if position + stamp_count * STAMP_SIZE != end:
+            raise ValueError("Corrupt binary snapshot record")
+
+        habit = Habit(name, description, periodicity)
+        habit.id = habit_id
+        habit.created_at = from_timestamp(created_at)
+        raw_stamps = view[position:end]
+        if lazy:
+            habit.defer_completions(lambda raw_stamps=raw_stamps: _completions_from_bytes(raw_stamps))
+        else:
+            habit.completions = _completions_from_bytes(raw_stamps)
+        yield habit
+        offset = end
+
+def read_habits(path, fmt=None, lazy=False, use_mmap=False):
+    """
+    Read the habits of a snapshot file in either format
+
+    Args:
+        path: path of the snapshot file
+        fmt: 'json' or 'binary', or None to use the file extension
+        lazy: if true, completion histories are only parsed on first access
+        use_mmap: read JSON snapshots through a memory map, binary snapshots
+            are always read in one go since they are compact
+
+    Returns:
+        generator of habits
+    """
+    if detect_snapshot_format(path, fmt) == "binary":
+        with open(path, "rb") as f:
+            data = f.read()
+        yield from iter_binary(data, lazy)
+    else:
+        for data in iter_json_file(path, use_mmap):
+            yield Habit.from_dict(data, lazy=lazy)
+
+def write_habits(path, habits, fmt=None):
+    """
+    Write habits to a snapshot file in either format
+
+    the file is written to a temporary file first and then moved into place, so
+    a crash never leaves a half written snapshot
+
+    Args:
+        path: path of the snapshot file
+        habits: list of habits
+        fmt: 'json' or 'binary', or None to use the file extension
+    """
+    fmt = detect_snapshot_format(path, fmt)
+    if fmt == "binary":
+        with atomic_write(path, "wb") as f:
+            write_binary(f, habits)
+    else:
+        habits_data = [habit.to_dict() for habit in habits]
+        with atomic_write(path) as f:
+            json.dump(habits_data, f, indent=2)
+
+def write_state_cache(path, habits, source_path, signature=None):
+    """
+    Write a pre-parsed binary copy of a JSON snapshot
+
+    Args:
+        path: path of the cache file
+        habits: the habits of the snapshot
+        source_path: path of the JSON snapshot the cache stands in for
+        signature: file_signature of the snapshot when the habits were read
+            from it, taken now by default. a snapshot replaced since then
+            then does not match the cache
+    """
+    size, mtime_ns = signature if signature is not None else file_signature(source_path)
+    # rebuilt from the snapshot if it is lost, so not synced to disk
+    with atomic_write(path, "wb", sync=False) as f:
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, size, mtime_ns))
+        write_binary(f, habits)
+
+def read_state_cache(path, source_path, lazy=False):
+    """
+    Read the habits from a state cache if it still matches its JSON snapshot
+
+    Args:
+        path: path of the cache file
+        source_path: path of the JSON snapshot the cache stands in for
+        lazy: if true, completion timestamps are only copied on first access
+
+    Returns:
+        generator of habits, or None if the cache is missing or the snapshot
+        changed since the cache was written
+    """
+    signature = file_signature(source_path)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if len(data) < CACHE_HEADER.size:
+        return None
+    magic, size, mtime_ns = CACHE_HEADER.unpack_from(data, 0)
+    if magic != CACHE_MAGIC or (size, mtime_ns) != signature:
+        return None
+    return iter_binary(memoryview(data)[CACHE_HEADER.size:], lazy)
+
+def convert(source, target, source_format=None, target_format=None):
+    """
+    Convert a snapshot between the JSON and binary formats
+
+    Args:
+        source: path of the snapshot to read
+        target: path of the snapshot to write
+        source_format: format of the source, None to use the file extension
+        target_format: format of the target, None to use the file extension
+
+    Returns:
+        int: number of habits converted
+    """
+    habits = list(read_habits(source, source_format))
+    write_habits(target, habits, target_format)
+    return len(habits)
+
+def main(argv=None):
+    """convert snapshots from the command line"""
+    parser = argparse.ArgumentParser(description="Convert habit snapshots between JSON and binary formats")
+    parser.add_argument("source", help="snapshot to read, e.g. data/habits.json")
+    parser.add_argument("target", help="snapshot to write, e.g. data/habits.bin")
+    parser.add_argument("--from", dest="source_format", choices=["json", "binary"],
+                        help="format of the source, taken from the extension by default")
+    parser.add_argument("--to", dest="target_format", choices=["json", "binary"],
+                        help="format of the target, taken from the extension by default")
+    args = parser.parse_args(argv)
+
+    count = convert(args.source, args.target, args.source_format, args.target_format)
+    print(f"Converted {count} habits from {args.source} to {args.target}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import os
+import sqlite3
+from datetime import datetime
+from habit import Habit, Completions, get_period_bounds, to_timestamp
+from storage import Storage, synchronized
+import instrument
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS habits (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    periodicity TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS completions (
+    habit_id TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    PRIMARY KEY (habit_id, timestamp)
+) WITHOUT ROWID;
+"""
+
+class SQLiteStorage(Storage):
+    """
+    A storage that keeps habits and completions in an SQLite database.
+
+    completions are stored one row each as integer timestamps, keyed on
+    (habit_id, timestamp), so range and status queries run on the index
+    instead of over the habits in memory. SQLite locks the database between
+    processes itself, so every change is written in a transaction instead of
+    merging snapshots under habits.lock.
+
+    Attributes:
+        data_dir: Directory where habit data is stored
+        habits: dictionary mapping habit IDs to habit objects
+        connection: the open database connection
+    """
+
+    writes_imported_dates = True
+
+    def __init__(self, data_dir="data", filename="habits.db", **options):
+        """
+        Intitialize the SQLite storage.
+
+        Args:
+            data_dir: directory where habit data is stored
+            filename: name of the database file inside data_dir
+            options: further Storage options, e.g. lazy (a habit's completions
+                are only queried on first access) or write_behind. the indexed
+                completions table does not need retention_days
+        """
+        if options.get('retention_days') is not None:
+            raise ValueError("The SQLite storage does not support retention_days")
+        super().__init__(data_dir, **options)
+        # storages shared between threads are serialized by thread_safe mode or by their callers (e.g. the server)
+        self.connection = sqlite3.connect(os.path.join(data_dir, filename), check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def apply_retention(self, retention_days=None, now=None):
+        """Archiving is not supported, completions are never deleted from the database"""
+        raise ValueError("The SQLite storage does not support retention")
+
+    def close(self):
+        """Write pending changes and close the database connection"""
+        super().close()
+        self.connection.close()
+
+    def _insert_habit(self, habit):
+        """insert or update a habit row and its completions"""
+        self.connection.execute(
+            "INSERT INTO habits (id, name, description, periodicity, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET name = excluded.name, description = excluded.description, "
+            "periodicity = excluded.periodicity, created_at = excluded.created_at",
+            (habit.id, habit.name, habit.description, habit.periodicity, habit.created_at.isoformat())
+        )
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO completions (habit_id, timestamp) VALUES (?, ?)",
+            ((habit.id, stamp) for stamp in habit.completions.stamps)
+        )
+
+    @instrument.timed("sqlite_storage.write")
+    def _write_changes(self, changes):
+        """
+        Apply a batch of changes to the database in one transaction
+
+        Args:
+            changes: list of (kind, habit, timestamp) tuples, oldest first
+        """
+        instrument.count("storage.changes_written", len(changes))
+        with self.connection:
+            # a full save rewrites every habit, which covers all other changes
+            if any(kind == 'all' for kind, _, _ in changes):
+                self._write_all()
+                return
+
+            for kind, habit, timestamp in changes:
+                if kind == 'added':
+                    self._insert_habit(habit)
+                elif kind == 'removed':
+                    self.connection.execute("DELETE FROM completions WHERE habit_id = ?", (habit.id,))
+                    self.connection.execute("DELETE FROM habits WHERE id = ?", (habit.id,))
+                elif kind == 'completed':
+                    self.connection.execute(
+                        "INSERT OR IGNORE INTO completions (habit_id, timestamp) VALUES (?, ?)",
+                        (habit.id, to_timestamp(timestamp))
+                    )
+                elif kind == 'imported':
+                    self.connection.executemany(
+                        "INSERT OR IGNORE INTO completions (habit_id, timestamp) VALUES (?, ?)",
+                        ((habit.id, to_timestamp(date)) for date in timestamp)
+                    )
+
+            for kind, habit, _ in changes:
+                if kind != 'removed':
+                    habit.mark_clean()
+
+    def _write_all(self):
+        """
+        Write the habits that changed in memory to the database
+
+        habits other connections added since the last load are kept and habits
+        they deleted are not written back, see Storage._merge
+        """
+        on_disk = {habit_id for (habit_id,) in self.connection.execute("SELECT id FROM habits")}
+        removed = [(habit_id,) for habit_id in self._synced_ids.difference(self.habits)]
+
+        # drop habits that were removed in memory
+        self.connection.executemany("DELETE FROM completions WHERE habit_id = ?", removed)
+        self.connection.executemany("DELETE FROM habits WHERE id = ?", removed)
+
+        for habit in list(self.habits.values()):
+            if habit.id in self._synced_ids and habit.id not in on_disk:
+                # deleted by another connection
+                self._unindex_habit(habit)
+            elif habit.dirty:
+                self._insert_habit(habit)
+        self._mark_synced(self.generation)
+
+    @synchronized
+    @instrument.timed("sqlite_storage.load")
+    def load(self):
+        """Load all habits and their completions from the database"""
+        habits = {}
+        rows = self.connection.execute(
+            "SELECT id, name, description, periodicity, created_at FROM habits ORDER BY rowid"
+        )
+        for habit_id, name, description, periodicity, created_at in rows:
+            habit = Habit(name, description, periodicity)
+            habit.id = habit_id
+            habit.created_at = datetime.fromisoformat(created_at)
+            habits[habit_id] = habit
+
+        if self.lazy:
+            for habit_id, habit in habits.items():
+                habit.defer_completions(lambda habit_id=habit_id: self._query_completions(habit_id))
+            self._set_habits(habits.values())
+            self._mark_synced(self.generation)
+            return
+
+        # group the completion rows by habit with a single scan of the index
+        completions = {habit_id: [] for habit_id in habits}
+        rows = self.connection.execute("SELECT habit_id, timestamp FROM completions ORDER BY habit_id, timestamp")
+        for habit_id, timestamp in rows:
+            if habit_id in completions:
+                completions[habit_id].append(timestamp)
+
+        for habit_id, habit in habits.items():
+            habit.completions = Completions.from_timestamps(completions[habit_id])
+        self._set_habits(habits.values())
+        self._mark_synced(self.generation)
+
+    def _query_completions(self, habit_id):
+        """
+        Read the completions of one habit from the index
+
+        Args:
+            habit_id: ID of the habit
+
+        Returns:
+            Completions: the habit's completions
+        """
+        rows = self.connection.execute(
+            "SELECT timestamp FROM completions WHERE habit_id = ? ORDER BY timestamp", (habit_id,)
+        )
+        return Completions.from_timestamps(timestamp for timestamp, in rows)
+
+    @synchronized
+    def count_completions(self, habit_id, start, end):
+        """
+        Count the completions of a habit within a time range using the index
+
+        Args:
+            habit_id: ID of the habit
+            start: start of the range (inclusive)
+            end: end of the range (exclusive)
+
+        Returns:
+            int: number of completions, 0 if the habit does not exist
+        """
+        # queries must see changes still waiting in write-behind mode
+        self.flush()
+        row = self.connection.execute(
+            "SELECT COUNT(*) FROM completions WHERE habit_id = ? AND timestamp >= ? AND timestamp < ?",
+            (habit_id, to_timestamp(start), to_timestamp(end))
+        ).fetchone()
+        return row[0]
+
+    @synchronized
+    def get_completed_habit_ids(self, date=None):
+        """
+        Get the IDs of the habits that are complete for the period containing a date
+
+        Args:
+            date: the date to check, now by default
+
+        Returns:
+            set: IDs of the completed habits
+        """
+        if date is None:
+            date = datetime.now()
+        self.flush()
+
+        completed = set()
+        for periodicity in ['daily', 'weekly']:
+            period_start, period_end = get_period_bounds(date, periodicity)
+            rows = self.connection.execute(
+                "SELECT id FROM habits WHERE periodicity = ? AND EXISTS ("
+                "SELECT 1 FROM completions WHERE habit_id = habits.id AND timestamp >= ? AND timestamp < ?)",
+                (periodicity, to_timestamp(period_start), to_timestamp(period_end))
+            )
+            completed.update(habit_id for habit_id, in rows)
+        return completed
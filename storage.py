@@ -1,7 +1,45 @@
-import json
+import atexit
+import contextlib
 import os
+import threading
 from datetime import datetime, timedelta 
-from habit import Habit
+from functools import wraps
+from atomic_file import file_signature
+from file_lock import FileLock
+from habit import Habit, from_timestamp
+from retention import archive_completions, get_horizon, read_archives, write_archives
+from rollup import read_rollups, write_rollups
+from snapshot import SNAPSHOT_FILES, read_habits, read_state_cache, write_habits, write_state_cache
+import instrument
+
+def normalize_name(name):
+    """
+    Normalize a habit name for lookups
+
+    Args:
+        name: the habit name
+
+    Returns:
+        str: the name without surrounding whitespace, in case-insensitive form
+    """
+    return name.strip().casefold()
+
+def synchronized(method):
+    """
+    Decorator that runs a storage method while holding the storage's mutex,
+    which is only a real lock in thread-safe mode
+
+    Args:
+        method: the method to wrap
+
+    Returns:
+        the wrapped method
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._mutex:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class Storage:
     """
@@ -9,23 +47,105 @@ class Storage:
 
     Attributes:
         data_dir: Directory where habit data is stored
-        habits: list of habit objects
+        habits: dictionary mapping habit IDs to habit objects, in insertion order
+        lazy: whether completion histories are only parsed on first access
+        write_behind: whether changes are persisted later in batches
+        flush_interval: seconds between a change and its write in write-behind mode
+        flush_batch: number of pending changes that forces a write in write-behind mode
+        use_mmap: whether habits.json is read through a memory map
+        snapshot_format: 'json' for habits.json or 'binary' for the compact habits.bin
+        persist_rollups: whether per-day completion counts are saved in rollups.json
+        state_cache: whether a pre-parsed binary copy of habits.json is kept in habits.cache
+        locking: whether writes lock the data directory and merge changes of other processes
+        retention_days: days of raw completions kept before older ones are archived, None to keep all
+        thread_safe: whether storage methods may be called from several threads
+        generation: number of snapshot writes in the data directory when this
+            storage last loaded or wrote it, see habits.generation
     """
 
-    def __init__(self, data_dir="data"):
+    # whether _write_changes reads the dates of imported completions. snapshots
+    # write the habits as they are, so pending imports only need to name the habit
+    writes_imported_dates = False
+
+    def __init__(self, data_dir="data", lazy=False, write_behind=False, flush_interval=1.0, flush_batch=100,
+                 use_mmap=False, snapshot_format="json", persist_rollups=False,
+                 state_cache=False, locking=True, lock_timeout=10.0, thread_safe=False, retention_days=None):
         """
         Intitialize the storage.
 
         Args:
             data_dir: directory where habit data is stored
+            lazy: if true, load habits with metadata only and parse their
+                completion histories on first access
+            write_behind: if true, changes only mark the storage dirty and are
+                written by a background flush, call flush() to write them now
+            flush_interval: seconds between a change and its write in write-behind mode,
+                None to only write on flush() or a full batch
+            flush_batch: number of pending changes that forces a write in write-behind mode,
+                None for no limit
+            use_mmap: read habits.json through a memory map when loading
+            snapshot_format: 'json' to store habits in habits.json or 'binary' to
+                store them in the compact habits.bin, see snapshot.py
+            persist_rollups: save the per-day completion counts of every habit in
+                rollups.json with each snapshot, so analytics on a lazily loaded
+                storage do not need to parse any completions
+            state_cache: keep a binary copy of habits.json in habits.cache and load
+                from it while habits.json has the same size and modification time,
+                so startup does not parse JSON unless the file changed elsewhere
+            locking: hold habits.lock while writing, and if another process wrote
+                since this storage last loaded or wrote (its generation changed),
+                merge its habits and completions in before writing
+            lock_timeout: seconds to wait for habits.lock before raising TimeoutError,
+                None to wait forever
+            thread_safe: serialize every storage method with a lock, including
+                background flushes in write-behind mode. always on in write-behind
+                mode with a flush_interval, whose flushes run on a timer thread
+            retention_days: when writing the snapshot, move completions older
+                than this many days (back to a monday) into per-day and per-week
+                counts in archive.json, see retention.py. streaks and completion
+                rates still cover the whole history. None keeps every completion
         """
+        if snapshot_format not in SNAPSHOT_FILES:
+            raise ValueError(f"Unknown snapshot format '{snapshot_format}', expected 'json' or 'binary'")
         self.data_dir = data_dir
-        self.habits = []
+        self.use_mmap = use_mmap
+        self.snapshot_format = snapshot_format
+        self.persist_rollups = persist_rollups
+        self.state_cache = state_cache and snapshot_format == "json"
+        self.lazy = lazy
+        self.retention_days = retention_days
+        # set when an archive changed and archive.json has to be rewritten
+        self._archives_changed = False
+        self.habits = {}
+        # normalized name -> {habit id: habit}, names need not be unique
+        self._names = {}
+
+        self.locking = locking
+        self.generation = 0
+        # IDs of the habits on disk at the last load or write, to tell habits
+        # deleted by another process from habits added by this one
+        self._synced_ids = set()
+        self._file_lock = FileLock(os.path.join(data_dir, "habits.lock"), lock_timeout) if locking else None
+        # a flush from the timer thread would otherwise race the caller's changes
+        self.thread_safe = thread_safe or (write_behind and flush_interval is not None)
+        self._mutex = threading.RLock() if thread_safe else contextlib.nullcontext()
+
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_timer = None
+        if write_behind:
+            # never lose pending changes when the program exits
+            atexit.register(self.flush)
 
         # create data directory if it doesn't exist
         if not os.path.exists(data_dir):
             os.makedirs(data_dir)
 
+    @synchronized
     def add_habit(self, habit):
         """
         Add a habit to storage
@@ -33,9 +153,36 @@ class Storage:
         Args:
             habit: the habit to add
         """
-        self.habits.append(habit)
-        self.save()
+        self._index_habit(habit)
+        self._record_change('added', habit)
+
+    def _index_habit(self, habit):
+        """add a habit to the ID and name indexes"""
+        self.habits[habit.id] = habit
+        self._names.setdefault(normalize_name(habit.name), {})[habit.id] = habit
+
+    def _unindex_habit(self, habit):
+        """remove a habit from the ID and name indexes"""
+        del self.habits[habit.id]
+        key = normalize_name(habit.name)
+        same_name = self._names.get(key, {})
+        same_name.pop(habit.id, None)
+        if not same_name:
+            self._names.pop(key, None)
+
+    def _set_habits(self, habits):
+        """
+        Replace all habits and rebuild the indexes
+
+        Args:
+            habits: iterable of habit objects
+        """
+        self.habits = {}
+        self._names = {}
+        for habit in habits:
+            self._index_habit(habit)
 
+    @synchronized
     def remove_habit(self,habit_id):
         """
         Remove a habit from storage
@@ -46,13 +193,236 @@ class Storage:
         Returns:
             bool: true if the habit was remove, false otherwise
         """
-        for i, habit in enumerate(self.habits):
-            if habit.id == habit_id:
-                del self.habits[i]
-                self.save()
-                return True
-        return False 
+        habit = self.habits.get(habit_id)
+        if habit is None:
+            return False
+        self._unindex_habit(habit)
+        self._record_change('removed', habit)
+        return True
+    
+    @synchronized
+    def complete_habit(self, habit):
+        """
+        Mark a habit as complete and persist the completion
+
+        Args:
+            habit: the habit to complete
+
+        Returns:
+            datetime: the recorded completion date
+        """
+        timestamp = habit.complete()
+        self._record_change('completed', habit, timestamp)
+        return timestamp
+
+    @synchronized
+    def add_completions(self, completions_by_habit, new_habits=()):
+        """
+        Add many completions, and optionally new habits, with a single write
+
+        Args:
+            completions_by_habit: dictionary mapping habits to lists of completion dates
+            new_habits: habits to add before the completions
+
+        Returns:
+            int: number of completions that were not recorded before
+        """
+        changes = []
+        new_ids = set()
+        for habit in new_habits:
+            self._index_habit(habit)
+            new_ids.add(habit.id)
+            changes.append(('added', habit, None))
+
+        added = 0
+        for habit, timestamps in completions_by_habit.items():
+            before = len(habit.completions)
+            habit.completions.extend(timestamps)
+            added += len(habit.completions) - before
+            # new habits are written together with their completions
+            if habit.id not in new_ids:
+                changes.append(('imported', habit, list(timestamps) if self.writes_imported_dates else None))
+
+        if changes:
+            self._record_changes(changes)
+        return added
+
+    def _record_change(self, kind, habit=None, timestamp=None):
+        """
+        Persist a change now, or queue it for the next flush in write-behind mode
+
+        Args:
+            kind: 'added', 'removed', 'completed', 'imported' or 'all' for a full save
+            habit: the habit that changed
+            timestamp: the completion date for 'completed' changes, a list of
+                dates for 'imported' changes, None if the backend does not
+                write them, see writes_imported_dates
+        """
+        self._record_changes([(kind, habit, timestamp)])
+
+    def _record_changes(self, changes):
+        """
+        Persist changes together now, or queue them for the next flush in write-behind mode
+
+        Args:
+            changes: list of (kind, habit, timestamp) tuples, see _record_change
+        """
+        if not self.write_behind:
+            self._write_changes(changes)
+            return
+
+        with self._pending_lock:
+            self._pending.extend(changes)
+            batch_full = self.flush_batch is not None and len(self._pending) >= self.flush_batch
+            if not batch_full and self._flush_timer is None and self.flush_interval is not None:
+                self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+        if batch_full:
+            self.flush()
+
+    @synchronized
+    def flush(self):
+        """Write all pending changes now"""
+        with self._flush_lock:
+            with self._pending_lock:
+                changes, self._pending = self._pending, []
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+            if changes:
+                self._write_changes(changes)
+
+    @property
+    def dirty(self):
+        """true while there are changes that have not been written yet"""
+        return bool(self._pending)
+
+    @instrument.timed("storage.write")
+    def _write_changes(self, changes):
+        """
+        Persist a batch of changes
+
+        the JSON file is always rewritten as a whole, so any number of
+        changes costs a single write. changes other processes wrote in the
+        meantime are merged in first, so they are not overwritten
+
+        Args:
+            changes: list of (kind, habit, timestamp) tuples, oldest first
+        """
+        instrument.count("storage.changes_written", len(changes))
+        with self._locked():
+            self._sync()
+            self._write_snapshot()
+
+    def _locked(self):
+        """context manager that holds habits.lock, or does nothing without locking"""
+        return self._file_lock if self._file_lock is not None else contextlib.nullcontext()
+
+    def _generation_path(self):
+        """path of the file with the generation counter"""
+        return os.path.join(self.data_dir, "habits.generation")
+
+    def _read_generation(self):
+        """
+        Read the generation counter of the data directory
+
+        Returns:
+            int: number of snapshot writes so far, 0 before the first one
+        """
+        try:
+            with open(self._generation_path(), "r") as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_generation(self, generation):
+        """
+        Replace the generation counter of the data directory
+
+        Args:
+            generation: the new counter value
+        """
+        # written in place, a torn read only looks like a change and causes a needless merge
+        with open(self._generation_path(), "w") as f:
+            f.write(str(generation))
+
+    def _next_generation(self):
+        """
+        Bump the generation counter before writing
+
+        Returns:
+            int: the new generation
+        """
+        # the counter is bumped first, so a crash in between can only cause a needless merge
+        generation = max(self.generation, self._read_generation()) + 1
+        self._write_generation(generation)
+        return generation
+
+    def _mark_synced(self, generation):
+        """
+        Remember that the habits in memory match the data directory at a generation
+
+        Args:
+            generation: the generation of the data directory
+        """
+        self.generation = generation
+        self._synced_ids = set(self.habits)
+        for habit in self.habits.values():
+            habit.mark_clean()
+
+    def _sync(self):
+        """
+        Merge in what other processes wrote since this storage last loaded or wrote
+
+        must be called while holding habits.lock, otherwise another process
+        could write between the check and our own write
+
+        Returns:
+            bool: true if there was anything to merge
+        """
+        if not self.locking or self._read_generation() == self.generation:
+            return False
+        # a second storage without locking reads the data directory as it is now
+        other = type(self)(self.data_dir, snapshot_format=self.snapshot_format, state_cache=self.state_cache,
+                           locking=False)
+        other.load()
+        self._merge(other)
+        return True
+
+    def _merge(self, other):
+        """
+        Merge the habits of another storage of the same data directory into this one
+
+        completions are only ever added, so the union of both sides is kept,
+        and of two archives the one with the later horizon. a habit missing on
+        one side was either added by that side or deleted by the other, which
+        the IDs seen at the last sync tell apart
+
+        Args:
+            other: storage loaded from the data directory
+        """
+        for habit in list(self.habits.values()):
+            if habit.id not in other.habits and habit.id in self._synced_ids:
+                # deleted by another process
+                self._unindex_habit(habit)
+
+        for habit in other.habits.values():
+            ours = self.habits.get(habit.id)
+            if ours is not None:
+                ours.completions.merge(habit.completions)
+                # completions before the horizon are ignored, so the later archive covers both sides
+                if habit.archive is not None and (ours.archive is None or habit.archive.horizon > ours.archive.horizon):
+                    ours.archive = habit.archive
+            elif habit.id not in self._synced_ids:
+                # added by another process
+                self._index_habit(habit)
+
+        self.generation = other.generation
+        self._synced_ids = set(other.habits)
     
+    @synchronized
     def get_habit(self, habit_id):
         """
         get a habit by ID 
@@ -63,11 +433,70 @@ class Storage:
         Returns:
             habit: the habit with the given ID, or None if not found
         """
-        for habit in self.habits:
-            if habit.id == habit_id:
-                return habit
-        return None
+        return self.habits.get(habit_id)
+
+    @synchronized
+    def get_habit_by_name(self, name):
+        """
+        get a habit by name, ignoring case and surrounding whitespace
+
+        Args:
+            name: name of habit to get
+
+        Returns:
+            habit: the first habit added with the given name, or None if not found
+        """
+        same_name = self._names.get(normalize_name(name))
+        if not same_name:
+            return None
+        return next(iter(same_name.values()))
+    
+    @synchronized
+    def count_completions(self, habit_id, start, end):
+        """
+        Count the completions of a habit within a time range
+
+        Args:
+            habit_id: ID of the habit
+            start: start of the range (inclusive)
+            end: end of the range (exclusive)
+
+        Returns:
+            int: number of completions, 0 if the habit does not exist.
+                archived completions are only known per day and counted
+                from the day of start up to the day before end
+        """
+        habit = self.get_habit(habit_id)
+        if habit is None:
+            return 0
+        archive = habit.archive
+        if archive is None:
+            return habit.completions.count_between(start, end)
+
+        horizon = from_timestamp(archive.horizon_stamp)
+        count = 0
+        if start < horizon:
+            count += archive.rollup.days.completions_between(start.toordinal(), min(end, horizon).toordinal())
+        if end > horizon:
+            count += habit.completions.count_between(max(start, horizon), end)
+        return count
+
+    @synchronized
+    def get_completed_habit_ids(self, date=None):
+        """
+        Get the IDs of the habits that are complete for the period containing a date
+
+        Args:
+            date: the date to check, now by default
+
+        Returns:
+            set: IDs of the completed habits
+        """
+        if date is None:
+            date = datetime.now()
+        return {habit.id for habit in self.habits.values() if habit.is_complete_for_period(date)}
     
+    @synchronized
     def get_all_habits(self):
         """
         Get all habits
@@ -75,23 +504,170 @@ class Storage:
         Returns:
             list: list of all habits
         """
-        return self.habits
+        return list(self.habits.values())
     
+    def close(self):
+        """Write pending changes and release any resources held by the storage"""
+        self.flush()
+        if self.write_behind:
+            atexit.unregister(self.flush)
+
+    @synchronized
+    @instrument.timed("storage.save")
     def save(self):
         """Save all habits to the data directory"""
-        habits_data = [habit.to_dict() for habit in self.habits]
-        with open(os.path.join(self.data_dir, "habits.json"), "w") as f:
-            json.dump(habits_data, f, indent=2)
+        self._record_change('all')
+
+    def _snapshot_path(self):
+        """path of the snapshot file for the chosen format"""
+        return os.path.join(self.data_dir, SNAPSHOT_FILES[self.snapshot_format])
+
+    def _rollup_path(self):
+        """path of the rollup file"""
+        return os.path.join(self.data_dir, "rollups.json")
+
+    def _state_cache_path(self):
+        """path of the pre-parsed copy of habits.json"""
+        return os.path.join(self.data_dir, "habits.cache")
 
+    def _archive_path(self):
+        """path of the archive file"""
+        return os.path.join(self.data_dir, "archive.json")
+
+    def _archive_old_completions(self, habits, horizon):
+        """
+        Archive the completions of habits before a horizon
+
+        Args:
+            habits: list of habits
+            horizon: day ordinal of a monday, see retention.get_horizon
+
+        Returns:
+            int: number of completions archived
+        """
+        archived = sum(archive_completions(habit, horizon) for habit in habits)
+        if archived:
+            self._archives_changed = True
+            instrument.count("storage.completions_archived", archived)
+        return archived
+
+    def _write_archives(self, habits):
+        """
+        Apply the retention policy and rewrite archive.json if an archive changed
+
+        must be called before the habits are written, so after a crash the
+        archive has every completion that is missing from the snapshot
+
+        Args:
+            habits: the habits about to be written
+        """
+        if self.retention_days is not None:
+            self._archive_old_completions(habits, get_horizon(self.retention_days))
+        if self._archives_changed:
+            write_archives(self._archive_path(), self.habits.values())
+            self._archives_changed = False
+
+    def _attach_archives(self):
+        """Attach the archives in archive.json to the loaded habits"""
+        for habit_id, archive in read_archives(self._archive_path()).items():
+            habit = self.habits.get(habit_id)
+            if habit is not None:
+                habit.archive = archive
+
+    @synchronized
+    def apply_retention(self, retention_days=None, now=None):
+        """
+        Archive the completions older than a number of days and write the result
+
+        Args:
+            retention_days: days of raw completions to keep, the storage's
+                retention_days by default
+            now: the current date, now by default
+
+        Returns:
+            int: number of completions archived
+        """
+        if retention_days is None:
+            retention_days = self.retention_days
+        if retention_days is None:
+            raise ValueError("No retention period given")
+        archived = self._archive_old_completions(list(self.habits.values()), get_horizon(retention_days, now))
+        if archived:
+            self._record_change('all')
+        return archived
+
+    def _write_snapshot(self):
+        """Write all habits to the snapshot file, followed by their state cache and rollups"""
+        habits = list(self.habits.values())
+        generation = self._next_generation()
+        self._write_archives(habits)
+        write_habits(self._snapshot_path(), habits, self.snapshot_format)
+        if self.state_cache:
+            write_state_cache(self._state_cache_path(), habits, self._snapshot_path())
+        if self.persist_rollups:
+            write_rollups(self._rollup_path(), habits, self._snapshot_path())
+        self._mark_synced(generation)
+
+    @synchronized
+    @instrument.timed("storage.load")
     def load(self):
-        """Load all habits from the data directory"""
-        try: 
-            with open(os.path.join(self.data_dir, "habits.json"), "r") as f:
-                habits_data = json.load(f)
-                self.habits = [Habit.from_dict(data) for data in habits_data]
-        except FileNotFoundError:
-            # no habits file yet, start with empty list
-            self.habits = []
+        """
+        Load all habits from the data directory
+
+        habits.json is parsed one habit at a time, so only a single habit's
+        decoded JSON is in memory next to the habit objects. habits.bin is
+        unpacked without parsing any timestamps. saved rollups that match the
+        snapshot are attached to the habits, missing ones are rebuilt when needed.
+        archived completions are attached from archive.json
+        """
+        # read before the snapshot, a write in between then only causes a needless merge
+        generation = self._read_generation()
+        # snapshots are only ever replaced, never removed, so one that exists can be read
+        if not os.path.exists(self._snapshot_path()):
+            # no habits file yet, start with no habits
+            self._set_habits([])
+            self._mark_synced(generation)
+            return
+        self._set_habits(self._read_snapshot())
+        self._attach_archives()
+        self._mark_synced(generation)
+
+        if self.persist_rollups:
+            rollups = read_rollups(self._rollup_path(), self._snapshot_path())
+            for habit_id, rollup in rollups.items():
+                habit = self.habits.get(habit_id)
+                if habit is not None:
+                    habit.set_rollup(rollup)
+
+    def _read_snapshot(self):
+        """
+        Read the habits of the snapshot, through the state cache when it is enabled
+
+        Returns:
+            iterable of habits
+        """
+        path = self._snapshot_path()
+        if not self.state_cache:
+            return read_habits(path, self.snapshot_format, self.lazy, self.use_mmap)
+
+        try:
+            cached = read_state_cache(self._state_cache_path(), path, self.lazy)
+            if cached is not None:
+                return list(cached)
+        except ValueError:
+            # a damaged cache is rebuilt below
+            pass
+
+        # the cache needs every completion, so the JSON is parsed in full once.
+        # the signature is taken first, so a snapshot written meanwhile does not match the cache
+        signature = file_signature(path)
+        habits = list(read_habits(path, self.snapshot_format, use_mmap=self.use_mmap))
+        try:
+            write_state_cache(self._state_cache_path(), habits, path, signature)
+        except OSError:
+            # without a cache the next load parses the JSON again
+            instrument.count("storage.state_cache_write_errors")
+        return habits
 
     def create_predefined_habits(self):
         """Create predefined habits with example data."""
@@ -130,3 +706,29 @@ class Storage:
         for habit in habits:
             self.add_habit(habit)
 
+
+def create_storage(backend="json", data_dir="data", **options):
+    """
+    Create a storage instance for the chosen backend
+
+    Args:
+        backend: 'json' for a single JSON file, 'journal' for an append-only journal,
+            'sqlite' for an SQLite database or 'directory' for one file per habit
+        data_dir: directory where habit data is stored
+        options: extra keyword arguments for the backend
+
+    Returns:
+        Storage: the storage instance
+    """
+    if backend == "json":
+        return Storage(data_dir, **options)
+    if backend == "journal":
+        from journal_storage import JournalStorage
+        return JournalStorage(data_dir, **options)
+    if backend == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(data_dir, **options)
+    if backend == "directory":
+        from directory_storage import DirectoryStorage
+        return DirectoryStorage(data_dir, **options)
+    raise ValueError(f"Unknown storage backend '{backend}'")
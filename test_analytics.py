@@ -3,6 +3,8 @@ from datetime import datetime, timedelta
 from habit import Habit
 from storage import Storage
 import analytics
+import vectorized
+from concurrent.futures import ProcessPoolExecutor
 import os
 import shutil
 
@@ -82,6 +84,22 @@ class TestAnalytics(unittest.TestCase):
         self.assertEqual(habit.name, "Clean House")
         self.assertEqual(streak, 3)
     
+    def test_get_longest_streak_habit_uses_history(self):
+        """test that the longest streak includes streaks that have ended."""
+        today = datetime.now()
+        for days_ago in range(10, 15):
+            self.daily_habit.completions.append(today - timedelta(days=days_ago))
+        self.weekly_habit.completions.append(today)
+        
+        habit, streak = analytics.get_longest_streak_habit(self.storage)
+        self.assertEqual(habit.name, "Exercise")
+        self.assertEqual(streak, 5)
+        
+        # the old streak is over, so there is no current streak
+        self.assertEqual(analytics.get_streak_for_habit(self.daily_habit), 0)
+        self.assertEqual(analytics.get_longest_streak_for_habit(self.daily_habit), 5)
+        self.assertEqual(analytics.get_streak_runs_for_habit(self.daily_habit), [5])
+    
     def test_get_streak_for_habit(self):
         """test getting the streak for a specific habit."""
         # no streak initially
@@ -125,5 +143,113 @@ class TestAnalytics(unittest.TestCase):
         # weekly habit: 1 out of 1 week = 100%
         self.assertEqual(completion_rates[self.weekly_habit.name], 100.0)
 
+    def test_get_all_streaks_and_histogram(self):
+        """test the streak and histogram summaries."""
+        today = datetime.now()
+        for days_ago in [0, 1, 5, 6, 7]:
+            self.daily_habit.completions.append(today - timedelta(days=days_ago))
+        self.weekly_habit.completions.append(today - timedelta(days=7))
+        
+        streaks = analytics.get_all_streaks(self.storage, use_numpy=False)
+        self.assertEqual(streaks[self.daily_habit.name], (2, 3))
+        self.assertEqual(streaks[self.weekly_habit.name], (0, 1))
+        
+        histogram = analytics.get_completion_histogram(self.storage, periods=3, use_numpy=False)
+        self.assertEqual(histogram[self.daily_habit.name], [0, 1, 1])
+        self.assertEqual(histogram[self.weekly_habit.name], [0, 1, 0])
+    
+    def test_get_window_stats(self):
+        """test statistics over arbitrary windows and groupings."""
+        # 2024-01-01 is a monday
+        for day in [(1, 1), (1, 2), (1, 3), (1, 10), (1, 31), (2, 1), (2, 2)]:
+            self.daily_habit.completions.append(datetime(2024, *day, 9))
+        self.daily_habit.completions.append(datetime(2024, 1, 2, 18))
+        for day in [(1, 3), (1, 8), (1, 29)]:
+            self.weekly_habit.completions.append(datetime(2024, *day, 9))
+
+        stats = analytics.get_window_stats(self.storage, datetime(2024, 1, 1), datetime(2024, 2, 1))
+        self.assertEqual(stats[self.daily_habit.name], {
+            'completions': 6, 'completed_periods': 5, 'total_periods': 31,
+            'completion_rate': 5 / 31 * 100, 'longest_streak': 3,
+        })
+        # weeks that overlap the window count whole
+        self.assertEqual(stats[self.weekly_habit.name]['total_periods'], 5)
+        self.assertEqual(stats[self.weekly_habit.name]['completed_periods'], 3)
+        self.assertEqual(stats[self.weekly_habit.name]['longest_streak'], 2)
+
+        # a streak crossing the window edge is clipped
+        daily = analytics.get_window_stats_for_habit(self.daily_habit, datetime(2024, 1, 31), datetime(2024, 2, 2))
+        self.assertEqual((daily['completed_periods'], daily['longest_streak']), (2, 2))
+
+        by_periodicity = analytics.get_window_stats(
+            self.storage, datetime(2024, 1, 1), datetime(2024, 2, 1), group_by='periodicity'
+        )
+        self.assertEqual(by_periodicity['weekly']['completion_rate'], 60.0)
+
+        by_month = analytics.get_window_stats(
+            self.storage, datetime(2024, 1, 1), datetime(2024, 3, 1), group_by='month'
+        )
+        self.assertEqual(list(by_month), ['2024-01', '2024-02'])
+        self.assertEqual(by_month['2024-01']['completions'], 9)
+        self.assertEqual(by_month['2024-01']['total_periods'], 36)
+        self.assertEqual(by_month['2024-02'], {
+            'completions': 3, 'completed_periods': 3, 'total_periods': 34,
+            'completion_rate': 3 / 34 * 100, 'longest_streak': 2,
+        })
+
+        with self.assertRaises(ValueError):
+            analytics.get_window_stats(self.storage, datetime(2024, 2, 1), datetime(2024, 1, 1))
+        with self.assertRaises(ValueError):
+            analytics.get_window_stats(self.storage, datetime(2024, 1, 1), datetime(2024, 2, 1), group_by='year')
+
+    def test_process_pool_matches_serial(self):
+        """test that analytics in a process pool give the same results as in process."""
+        today = datetime.now()
+        for days_ago in [0, 1, 2, 9, 10, 30, 31, 32, 33, 90]:
+            self.daily_habit.completions.append(today - timedelta(days=days_ago))
+            self.weekly_habit.completions.append(today - timedelta(days=days_ago * 2))
+        for i in range(5):
+            habit = Habit(f"Habit {i}", "", "daily" if i % 2 else "weekly")
+            habit.completions = [today - timedelta(days=days_ago) for days_ago in range(0, i * 9, i + 1)]
+            self.storage.add_habit(habit)
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(
+                analytics.get_longest_streak_habit(self.storage, executor),
+                analytics.get_longest_streak_habit(self.storage)
+            )
+            for days in [0, 7, 30, 100]:
+                self.assertEqual(
+                    analytics.get_completion_rate(self.storage, days, executor=executor),
+                    analytics.get_completion_rate(self.storage, days)
+                )
+            self.assertEqual(
+                analytics.get_all_streaks(self.storage, executor=executor),
+                analytics.get_all_streaks(self.storage, use_numpy=False)
+            )
+
+    @unittest.skipUnless(vectorized.HAS_NUMPY, "numpy is not installed")
+    def test_numpy_engine_matches_python(self):
+        """test that the numpy engine gives the same results as pure python."""
+        today = datetime.now()
+        for days_ago in [0, 1, 2, 9, 10, 30, 31, 32, 33, 90]:
+            self.daily_habit.completions.append(today - timedelta(days=days_ago))
+            self.weekly_habit.completions.append(today - timedelta(days=days_ago * 2))
+        self.storage.add_habit(Habit("Meditate", "Meditate for 10 minutes", "daily"))
+        
+        for days in [0, 7, 30, 100]:
+            self.assertEqual(
+                analytics.get_completion_rate(self.storage, days, use_numpy=True),
+                analytics.get_completion_rate(self.storage, days, use_numpy=False)
+            )
+        self.assertEqual(
+            analytics.get_all_streaks(self.storage, use_numpy=True),
+            analytics.get_all_streaks(self.storage, use_numpy=False)
+        )
+        self.assertEqual(
+            analytics.get_completion_histogram(self.storage, 12, use_numpy=True),
+            analytics.get_completion_histogram(self.storage, 12, use_numpy=False)
+        )
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
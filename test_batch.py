@@ -0,0 +1,93 @@
+import unittest
+import io
+import json
+import os
+import shutil
+from storage import Storage
+import batch
+
+class CountingStorage(Storage):
+    """a JSON storage that counts its writes"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writes = 0
+
+    def _write_changes(self, changes):
+        self.writes += 1
+        super()._write_changes(changes)
+
+class TestBatch(unittest.TestCase):
+    """test cases for the batch command line mode."""
+
+    def setUp(self):
+        """set up test fixtures."""
+        self.test_data_dir = "test_batch_data"
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+        os.makedirs(self.test_data_dir)
+
+    def tearDown(self):
+        """tear down test fixtures."""
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+
+    def run_command(self, argv, stdin=""):
+        """run a command and return its exit status, results and storage"""
+        storage = CountingStorage(self.test_data_dir, write_behind=True, flush_interval=None, flush_batch=None)
+        output = io.StringIO()
+        status = batch.run_command(storage, argv, io.StringIO(stdin), output)
+        return status, [json.loads(line) for line in output.getvalue().splitlines()], storage
+
+    def test_batch_from_stdin(self):
+        """test that many operations run against one storage with a single write."""
+        operations = "\n".join([
+            'add "Read Book" --periodicity daily',
+            'add Walk --periodicity weekly --description "Long walk"',
+            '# comments and blank lines are skipped',
+            '',
+            'complete "read book"',
+            'complete Walk',
+            'show "Read Book"',
+            'list --periodicity weekly',
+            'stats --days 7',
+        ])
+        status, results, storage = self.run_command(["batch"], operations)
+
+        self.assertEqual(status, 0)
+        self.assertEqual([result['operation'] for result in results],
+                         ['add', 'add', 'complete', 'complete', 'show', 'list', 'stats'])
+        self.assertTrue(all(result['ok'] for result in results))
+        self.assertEqual(results[4]['result']['completions'], 1)
+        self.assertEqual([habit['name'] for habit in results[5]['result']], ["Walk"])
+        self.assertEqual(results[6]['result']['streaks']['Walk'], {'current_streak': 1, 'longest_streak': 1})
+        self.assertEqual(storage.writes, 1)
+
+        loaded = Storage(self.test_data_dir)
+        loaded.load()
+        self.assertEqual(len(loaded.get_habit_by_name("Walk").completions), 1)
+
+    def test_errors_do_not_stop_the_batch(self):
+        """test that failing operations are reported and the rest still run."""
+        status, results, _ = self.run_command(
+            ["batch", "-e", "add Meditate", "-e", "complete Nothing", "-e", "fly", "-e", "complete Meditate"]
+        )
+        self.assertEqual(status, 1)
+        self.assertEqual([result['ok'] for result in results], [True, False, False, True])
+        self.assertEqual(results[1]['error'], "Habit 'Nothing' not found")
+
+        # a single operation on the command line
+        status, results, storage = self.run_command(["delete", "Meditate"])
+        self.assertEqual(status, 0)
+        self.assertTrue(results[0]['result']['deleted'])
+        self.assertEqual(storage.get_all_habits(), [])
+
+        # a line with an unbalanced quote only fails itself
+        status, results, _ = self.run_command(["batch"], 'add "Read\nadd Walk\nlist\n')
+        self.assertEqual(status, 1)
+        self.assertEqual([result['operation'] for result in results], ['add', 'add', 'list'])
+        self.assertEqual([result['ok'] for result in results], [False, True, True])
+        self.assertIn("quotation", results[0]['error'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import contextlib
+import io
+import os
+import shutil
+from datetime import datetime, timedelta
+from habit import Habit
+from storage import Storage, create_storage
+import bulk
+import instrument
+
+class TestBulk(unittest.TestCase):
+    """test cases for bulk import and export."""
+
+    def setUp(self):
+        """set up test fixtures."""
+        self.test_data_dir = "test_bulk_data"
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+        os.makedirs(self.test_data_dir)
+
+        self.storage = Storage(self.test_data_dir)
+        self.habit = Habit("Exercise", "Do 30 minutes of exercise", "daily")
+        self.storage.add_habit(self.habit)
+
+    def tearDown(self):
+        """tear down test fixtures."""
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+
+    def test_import_records(self):
+        """test importing records into existing and new habits."""
+        today = datetime.now().replace(microsecond=0)
+        records = [
+            {'habit_name': 'exercise', 'timestamp': (today - timedelta(days=2)).isoformat()},
+            {'habit_id': self.habit.id, 'timestamp': (today - timedelta(days=1)).isoformat()},
+            {'habit_name': 'Clean House', 'periodicity': 'weekly', 'timestamp': today.isoformat()},
+            {'habit_name': 'clean house', 'periodicity': 'weekly', 'timestamp': (today - timedelta(days=7)).isoformat()},
+            {'habit_name': 'Broken', 'timestamp': 'yesterday'},
+        ]
+
+        stats = bulk.import_completions(self.storage, records, batch_size=2, skip_invalid=True)
+        self.assertEqual(stats, {'records': 4, 'imported': 4, 'habits_created': 1, 'skipped': 1})
+        self.assertEqual(len(self.habit.completions), 2)
+        self.assertEqual(self.storage.get_habit_by_name("Clean House").get_longest_streak(), 2)
+
+        with self.assertRaises(ValueError):
+            bulk.import_completions(self.storage, records[4:])
+
+        loaded = Storage(self.test_data_dir)
+        loaded.load()
+        self.assertEqual(len(loaded.get_all_habits()), 2)
+
+    def test_export_and_import_round_trip(self):
+        """test that an export can be imported into another storage."""
+        today = datetime.now()
+        self.habit.completions.extend([today, today - timedelta(days=1)])
+
+        for fmt in ["csv", "jsonl"]:
+            path = os.path.join(self.test_data_dir, f"export.{fmt}")
+            self.assertEqual(bulk.export_completions(self.storage, path), 2)
+
+            other = create_storage("journal", os.path.join(self.test_data_dir, fmt))
+            stats = bulk.import_completions(other, bulk.read_records(path))
+            self.assertEqual(stats['imported'], 2)
+            self.assertEqual(list(other.get_habit(self.habit.id).completions), list(self.habit.completions))
+
+    def test_command_line_import_writes_once(self):
+        """test that importing into a snapshot backend writes the snapshot once."""
+        path = os.path.join(self.test_data_dir, "history.jsonl")
+        self.habit.completions.extend(datetime(2024, 1, 1) + timedelta(days=day) for day in range(10))
+        bulk.export_completions(self.storage, path)
+        data_dir = os.path.join(self.test_data_dir, "imported")
+
+        instrument.enable()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                bulk.main(["import", path, "--data-dir", data_dir, "--batch-size", "3"])
+            writes = {operation['name']: operation['calls'] for operation in instrument.get_report()['operations']}
+        finally:
+            instrument.disable()
+            instrument.reset()
+        self.assertEqual(writes['storage.write'], 1)
+
+        loaded = Storage(data_dir)
+        loaded.load()
+        self.assertEqual(len(loaded.get_habit(self.habit.id).completions), 10)
+
+    def test_pending_imports_keep_no_dates(self):
+        """test that write-behind imports into a snapshot backend do not queue the imported dates."""
+        storage = Storage(os.path.join(self.test_data_dir, "pending"), write_behind=True,
+                          flush_interval=None, flush_batch=None)
+        storage.add_habit(Habit("Walk", "Long walk", "weekly"))
+        records = [{'habit_name': "Walk", 'timestamp': datetime(2024, 1, day).isoformat()} for day in range(1, 11)]
+        bulk.import_completions(storage, records, batch_size=2)
+        self.assertTrue(all(timestamp is None for kind, _, timestamp in storage._pending if kind == 'imported'))
+        storage.flush()
+
+        loaded = Storage(storage.data_dir)
+        loaded.load()
+        self.assertEqual(len(loaded.get_habit_by_name("Walk").completions), 10)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -70,6 +70,100 @@ class TestHabit(unittest.TestCase):
         # streak should be 2
         self.assertEqual(self.daily_habit.get_current_streak(), 2)
     
+    def test_get_longest_streak_and_runs(self):
+        """test calculating the longest streak and the run lengths"""
+        # no streaks initially
+        self.assertEqual(self.daily_habit.get_longest_streak(), 0)
+        self.assertEqual(self.daily_habit.get_streak_runs(), [])
+
+        # a three day run ten days ago and a one day run today
+        today = datetime.now()
+        for days_ago in [12, 11, 10, 10, 0]:
+            self.daily_habit.completions.append(today - timedelta(days=days_ago))
+
+        self.assertEqual(self.daily_habit.get_streak_runs(), [3, 1])
+        self.assertEqual(self.daily_habit.get_longest_streak(), 3)
+        self.assertEqual(self.daily_habit.get_current_streak(), 1)
+
+    def test_streak_cache_updated_by_complete(self):
+        """test that the streak cache follows completions without going stale"""
+        yesterday = datetime.now() - timedelta(days=1)
+        self.daily_habit.completions.append(yesterday - timedelta(days=1))
+        self.daily_habit.completions.append(yesterday)
+        self.assertEqual(self.daily_habit.get_current_streak(), 0)
+        self.assertEqual(self.daily_habit.get_completion_counts(), (2, 2))
+
+        # complete() extends the cached run in place
+        self.daily_habit.complete()
+        self.assertEqual(self.daily_habit.get_current_streak(), 3)
+        self.assertEqual(self.daily_habit.get_longest_streak(), 3)
+        self.assertEqual(self.daily_habit.get_completion_counts(), (3, 3))
+        self.assertEqual(self.daily_habit.get_last_completed_period(), datetime.now().toordinal())
+
+        # completing twice in one period only counts the completion
+        self.daily_habit.complete()
+        self.assertEqual(self.daily_habit.get_completion_counts(), (4, 3))
+        self.assertEqual(self.daily_habit.get_streak_runs(), [3])
+
+        # direct changes to the completions invalidate the cache
+        self.daily_habit.completions.append(yesterday - timedelta(days=5))
+        self.assertEqual(self.daily_habit.get_streak_runs(), [1, 3])
+        self.assertEqual(self.daily_habit.get_completion_counts(), (5, 4))
+
+    def test_rollup_updated_by_complete(self):
+        """test that the rollup counts days and weeks and follows completions"""
+        monday = datetime(2024, 1, 1, 8)
+        for days in [0, 0, 1, 3, 9]:
+            self.daily_habit.completions.append(monday + timedelta(days=days, minutes=days))
+        self.daily_habit.completions.append(monday + timedelta(hours=2))
+
+        rollup = self.daily_habit.get_rollup()
+        first_day = monday.toordinal()
+        self.assertEqual(rollup.days.completed_between(first_day, first_day + 7), 3)
+        self.assertEqual(rollup.days.completions_between(first_day, first_day + 7), 4)
+        self.assertEqual(rollup.weeks.get_counts(), [4, 1])
+        self.assertIn(first_day + 9, rollup.days)
+        self.assertNotIn(first_day + 2, rollup.days)
+
+        # complete() adds to the same rollup instead of rebuilding it
+        self.daily_habit.complete()
+        self.assertIs(self.daily_habit.get_rollup(), rollup)
+        self.assertTrue(self.daily_habit.is_complete_for_period())
+        self.assertEqual(rollup.days.completions_between(first_day, datetime.now().toordinal() + 1), 6)
+
+        # direct changes to the completions rebuild it
+        self.daily_habit.completions.append(monday + timedelta(days=2))
+        self.assertIsNot(self.daily_habit.get_rollup(), rollup)
+        self.assertTrue(self.daily_habit.is_complete_for_period(monday + timedelta(days=2)))
+
+    def test_completions_sorted_and_deduplicated(self):
+        """test that completions stay sorted and unique however they are added"""
+        today = datetime.now()
+        yesterday = today - timedelta(days=1)
+        last_week = today - timedelta(days=7)
+
+        self.daily_habit.completions.append(today)
+        self.daily_habit.completions.append(last_week)
+        self.daily_habit.completions.append(yesterday)
+        self.daily_habit.completions.append(today)
+
+        self.assertEqual(list(self.daily_habit.completions), [last_week, yesterday, today])
+
+        # plain lists are converted on assignment
+        self.weekly_habit.completions = [today, last_week, today]
+        self.assertEqual(list(self.weekly_habit.completions), [last_week, today])
+        self.assertTrue(self.weekly_habit.is_complete_for_period(last_week))
+
+    def test_compact_completions(self):
+        """test that completions are stored as integer timestamps"""
+        completion = datetime(2024, 2, 29, 23, 59, 59, 999999)
+        self.daily_habit.completions.append(completion)
+
+        self.assertEqual(self.daily_habit.completions.stamps.typecode, 'q')
+        self.assertEqual(self.daily_habit.completions[0], completion)
+        self.assertIn(completion, self.daily_habit.completions)
+        self.assertFalse(hasattr(self.daily_habit, '__dict__'))
+
     def test_to_dict_and_from_dict(self):
         """test converting a habit to and from a dictionary"""
         # complete the habit
@@ -88,5 +182,25 @@ class TestHabit(unittest.TestCase):
         self.assertEqual(new_habit.periodicity, self.daily_habit.periodicity)
         self.assertEqual(len(new_habit.completions), len(self.daily_habit.completions))
 
+    def test_dirty_tracking(self):
+        """test that completions and field edits mark a habit dirty"""
+        self.assertTrue(self.daily_habit.dirty)
+        self.daily_habit.mark_clean()
+        self.assertFalse(self.daily_habit.dirty)
+
+        self.daily_habit.complete()
+        self.assertTrue(self.daily_habit.dirty)
+        self.daily_habit.mark_clean()
+        self.daily_habit.description = "Run instead"
+        self.assertTrue(self.daily_habit.dirty)
+
+        # loading lazy completions is not a change
+        habit = Habit.from_dict(self.daily_habit.to_dict(), lazy=True)
+        habit.mark_clean()
+        self.assertEqual(len(habit.completions), 1)
+        self.assertFalse(habit.dirty)
+        habit.completions.append(datetime(2024, 1, 1))
+        self.assertTrue(habit.dirty)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,72 @@
+import unittest
+import io
+import os
+import shutil
+from habit import Habit
+from storage import Storage
+import analytics
+import instrument
+
+class TestInstrument(unittest.TestCase):
+    """test cases for the instrumentation layer."""
+
+    def setUp(self):
+        """set up test fixtures."""
+        self.test_data_dir = "test_instrument_data"
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+        os.makedirs(self.test_data_dir)
+        instrument.reset()
+
+    def tearDown(self):
+        """tear down test fixtures."""
+        instrument.disable()
+        instrument.reset()
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+
+    def test_report(self):
+        """test that timers and counters are recorded only while enabled."""
+        storage = Storage(self.test_data_dir)
+        habit = Habit("Exercise", "Do 30 minutes of exercise", "daily")
+        storage.add_habit(habit)
+        storage.load()
+        self.assertEqual(instrument.get_report(), {'operations': [], 'counters': {}})
+
+        instrument.enable()
+        storage.save()
+        storage.load()
+        for _ in range(3):
+            analytics.get_streak_for_habit(storage.get_all_habits()[0])
+        instrument.disable()
+        storage.load()
+
+        report = instrument.get_report()
+        calls = {operation['name']: operation['calls'] for operation in report['operations']}
+        self.assertEqual(calls['storage.load'], 1)
+        self.assertEqual(calls['storage.save'], 1)
+        self.assertEqual(calls['analytics.get_streak_for_habit'], 3)
+        self.assertEqual(calls['habit.get_current_streak'], 3)
+        self.assertEqual(report['counters']['habit.streak_cache_rebuilds'], 1)
+        self.assertEqual(report['counters']['storage.changes_written'], 1)
+
+        output = io.StringIO()
+        instrument.print_report(report, output)
+        self.assertIn("analytics.get_streak_for_habit", output.getvalue())
+
+    def test_percentiles(self):
+        """test latency percentiles and the bounded sample size."""
+        stats = instrument.OperationStats()
+        for i in range(1, 101):
+            stats.add(i / 1000)
+        self.assertEqual(stats.calls, 100)
+        self.assertAlmostEqual(stats.percentile(0.5), 0.051)
+        self.assertAlmostEqual(stats.percentile(0.99), 0.1)
+
+        for _ in range(instrument.MAX_SAMPLES):
+            stats.add(0.001)
+        self.assertEqual(len(stats.samples), instrument.MAX_SAMPLES)
+        self.assertEqual(stats.calls, instrument.MAX_SAMPLES + 100)
+
+if __name__ == "__main__":
+    unittest.main()
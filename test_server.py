@@ -0,0 +1,106 @@
+import unittest
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+from storage import Storage
+from server import HabitServer
+
+class TestServer(unittest.IsolatedAsyncioTestCase):
+    """test cases for the JSON API server."""
+
+    async def asyncSetUp(self):
+        """start a server on a free port."""
+        self.test_data_dir = "test_server_data"
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+
+        self.storage = Storage(self.test_data_dir)
+        self.habit_server = HabitServer(self.storage)
+        self.server = await self.habit_server.start("127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        """stop the server and remove the data directory."""
+        await self.habit_server.stop(self.server)
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+
+    async def request(self, method, path, body=None):
+        """send one request and return the status and decoded JSON response."""
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        data = json.dumps(body).encode() if body is not None else b""
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        response = await reader.read()
+        writer.close()
+
+        head, _, payload = response.partition(b"\r\n\r\n")
+        status = int(head.split(b" ")[1])
+        return status, json.loads(payload)
+
+    async def test_habit_endpoints(self):
+        """test adding, completing, viewing and deleting habits."""
+        status, habit = await self.request("POST", "/habits", {
+            "name": "Exercise", "description": "Do 30 minutes of exercise", "periodicity": "daily"
+        })
+        self.assertEqual(status, 201)
+        self.assertFalse(habit['completed'])
+
+        status, _ = await self.request("POST", f"/habits/{habit['id']}/complete")
+        self.assertEqual(status, 200)
+
+        status, details = await self.request("GET", f"/habits/{habit['id']}")
+        self.assertEqual(status, 200)
+        self.assertTrue(details['completed'])
+        self.assertEqual(details['current_streak'], 1)
+        self.assertEqual(len(self.storage.get_all_habits()), 1)
+
+        status, _ = await self.request("DELETE", f"/habits/{habit['id']}")
+        self.assertEqual(status, 200)
+        status, _ = await self.request("GET", f"/habits/{habit['id']}")
+        self.assertEqual(status, 404)
+
+    async def test_internal_error(self):
+        """test that an unexpected error is answered with a 500 response."""
+        async def broken_route(*args):
+            raise RuntimeError("bug")
+
+        self.habit_server.route = broken_route
+        with contextlib.redirect_stderr(io.StringIO()):
+            status, payload = await self.request("GET", "/habits")
+        self.assertEqual(status, 500)
+        self.assertEqual(payload, {'error': "Internal server error"})
+
+    async def test_concurrent_writes_and_analytics(self):
+        """test that concurrent clients are served and writes are all applied."""
+        status, _ = await self.request("POST", "/habits", {"name": "Read", "periodicity": "weekly"})
+        self.assertEqual(status, 201)
+
+        results = await asyncio.gather(*[
+            self.request("POST", "/habits", {"name": f"Habit {i}", "periodicity": "daily"})
+            for i in range(20)
+        ])
+        self.assertTrue(all(status == 201 for status, _ in results))
+
+        status, rates = await self.request("GET", "/analytics/completion_rate?days=7")
+        self.assertEqual(status, 200)
+        self.assertEqual(len(rates), 21)
+
+        # dates with a UTC offset are converted to local time like the completions
+        status, stats = await self.request(
+            "GET", "/analytics/window_stats?start=2024-01-01T00:00:00%2B00:00&end=2024-03-01T00:00:00%2B00:00&group_by=month"
+        )
+        self.assertEqual(status, 200)
+        self.assertGreaterEqual(len(stats), 2)
+
+        status, error = await self.request("GET", "/analytics/habits_by_periodicity?periodicity=monthly")
+        self.assertEqual(status, 400)
+        self.assertIn('error', error)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,578 @@
+import unittest
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from habit import Habit
+from storage import Storage, create_storage
+from sharded_storage import ShardedStorage
+from json_stream import iter_json_array
+from snapshot import convert
+import analytics
+import instrument
+import io
+import json
+import threading
+import sqlite3
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+def complete_in_process(data_dir, backend, habit_id, first_day, days):
+    """complete a habit on several days from another process, one write per completion"""
+    storage = create_storage(backend, data_dir)
+    storage.load()
+    habit = storage.get_habit(habit_id)
+    for day in range(first_day, first_day + days):
+        storage.add_completions({habit: [datetime(2024, 1, 1) + timedelta(days=day)]})
+
+class TestStorage(unittest.TestCase):
+    """test cases for the storage backends."""
+
+    def setUp(self):
+        """set up test fixtures."""
+        # create a temporary data directory for testing
+        self.test_data_dir = "test_storage_data"
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+        os.makedirs(self.test_data_dir)
+
+        self.daily_habit = Habit("Exercise", "Do 30 minutes of exercise", "daily")
+        self.weekly_habit = Habit("Clean House", "Clean the house thoroughly", "weekly")
+
+    def tearDown(self):
+        """tear down test fixtures."""
+        # remove the temporary data directory
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+
+    def test_save_and_load(self):
+        """test that habits survive a save and load."""
+        storage = Storage(self.test_data_dir)
+        storage.add_habit(self.daily_habit)
+        storage.complete_habit(self.daily_habit)
+
+        loaded = Storage(self.test_data_dir)
+        loaded.load()
+
+        habit = loaded.get_habit(self.daily_habit.id)
+        self.assertEqual(habit.name, "Exercise")
+        self.assertEqual(list(habit.completions), list(self.daily_habit.completions))
+        self.assertFalse([name for name in os.listdir(self.test_data_dir) if name.endswith(".tmp")])
+
+    def test_streaming_json_parser(self):
+        """test parsing a JSON array element by element with tiny reads."""
+        data = [{"name": "Läufe ✓", "values": [1, 2.5, None]}, [], "text", 12345, True, {}]
+        text = json.dumps(data, indent=2)
+
+        for chunk_size in [1, 3, 7, 1000]:
+            self.assertEqual(list(iter_json_array(io.StringIO(text).read, chunk_size)), data)
+        self.assertEqual(list(iter_json_array(io.StringIO(" [ ] ").read)), [])
+        # numbers cut off by a read, e.g. "1." of "1.5"
+        self.assertEqual(list(iter_json_array(io.StringIO("[1.5, 2, -3e2]").read, 3)), [1.5, 2, -300.0])
+
+        for broken in ["", "{}", "[{}", "[{} {}]", "[1,,2]", "[1]]", "[] x"]:
+            with self.assertRaises(ValueError):
+                list(iter_json_array(io.StringIO(broken).read, 2))
+
+    def test_load_with_mmap(self):
+        """test loading habits through a memory map."""
+        storage = Storage(self.test_data_dir)
+        self.daily_habit.name = "Übung ✓"
+        storage.add_habit(self.daily_habit)
+        storage.add_habit(self.weekly_habit)
+        storage.complete_habit(self.weekly_habit)
+
+        loaded = Storage(self.test_data_dir, use_mmap=True)
+        loaded.load()
+        self.assertEqual([habit.name for habit in loaded.get_all_habits()], ["Übung ✓", "Clean House"])
+        self.assertEqual(len(loaded.get_habit(self.weekly_habit.id).completions), 1)
+
+    def test_binary_snapshot(self):
+        """test saving, loading and converting the binary snapshot format."""
+        storage = Storage(self.test_data_dir, snapshot_format="binary")
+        self.daily_habit.name = "Übung ✓"
+        storage.add_habit(self.daily_habit)
+        storage.add_habit(self.weekly_habit)
+        storage.complete_habit(self.daily_habit)
+        self.daily_habit.completions.append(datetime(2020, 2, 29, 23, 59, 59, 999999))
+        storage.save()
+        self.assertFalse(os.path.exists(os.path.join(self.test_data_dir, "habits.json")))
+
+        for lazy in [False, True]:
+            loaded = Storage(self.test_data_dir, lazy=lazy, snapshot_format="binary")
+            loaded.load()
+            habit = loaded.get_habit(self.daily_habit.id)
+            self.assertEqual(habit.completions_loaded, not lazy)
+            self.assertEqual(habit.name, "Übung ✓")
+            self.assertEqual(habit.created_at, self.daily_habit.created_at)
+            self.assertEqual(list(habit.completions), list(self.daily_habit.completions))
+            self.assertEqual(len(loaded.get_habit(self.weekly_habit.id).completions), 0)
+
+        # convert to JSON and back
+        json_path = os.path.join(self.test_data_dir, "habits.json")
+        self.assertEqual(convert(os.path.join(self.test_data_dir, "habits.bin"), json_path), 2)
+        loaded = Storage(self.test_data_dir)
+        loaded.load()
+        self.assertEqual(list(loaded.get_habit(self.daily_habit.id).completions), list(self.daily_habit.completions))
+
+        with open(os.path.join(self.test_data_dir, "habits.bin"), "wb") as f:
+            f.write(b"not a snapshot")
+        with self.assertRaises(ValueError):
+            Storage(self.test_data_dir, snapshot_format="binary").load()
+        with self.assertRaises(ValueError):
+            Storage(self.test_data_dir, snapshot_format="xml")
+
+    def test_persisted_rollups(self):
+        """test that saved rollups answer queries without loading completions."""
+        storage = create_storage("journal", self.test_data_dir, persist_rollups=True)
+        storage.add_habit(self.daily_habit)
+        storage.add_habit(self.weekly_habit)
+        self.daily_habit.completions.append(datetime.now() - timedelta(days=1))
+        storage.complete_habit(self.daily_habit)
+        storage.save()
+
+        loaded = create_storage("journal", self.test_data_dir, lazy=True, persist_rollups=True)
+        loaded.load()
+        habit = loaded.get_habit(self.daily_habit.id)
+        self.assertEqual(analytics.get_completion_rate(loaded, 7)["Exercise"], 2 / 7 * 100)
+        self.assertTrue(habit.is_complete_for_period())
+        self.assertFalse(habit.completions_loaded)
+
+        # changes in the journal replace the saved rollup of that habit
+        storage.complete_habit(self.weekly_habit)
+        loaded = create_storage("journal", self.test_data_dir, lazy=True, persist_rollups=True)
+        loaded.load()
+        self.assertEqual(analytics.get_completion_rate(loaded, 7)["Clean House"], 100)
+        self.assertTrue(loaded.get_habit(self.weekly_habit.id).completions_loaded)
+        self.assertFalse(loaded.get_habit(self.daily_habit.id).completions_loaded)
+
+        # rollups written for another snapshot are ignored
+        with open(os.path.join(self.test_data_dir, "habits.json"), "a") as f:
+            f.write(" ")
+        loaded = create_storage("journal", self.test_data_dir, lazy=True, persist_rollups=True)
+        loaded.load()
+        self.assertTrue(loaded.get_habit(self.daily_habit.id).is_complete_for_period())
+        self.assertTrue(loaded.get_habit(self.daily_habit.id).completions_loaded)
+
+    def test_state_cache(self):
+        """test that the state cache is used while habits.json is unchanged."""
+        storage = Storage(self.test_data_dir, state_cache=True)
+        storage.add_habit(self.daily_habit)
+        storage.complete_habit(self.daily_habit)
+        json_path = os.path.join(self.test_data_dir, "habits.json")
+        cache_path = os.path.join(self.test_data_dir, "habits.cache")
+        self.assertTrue(os.path.exists(cache_path))
+
+        # an edit that keeps the size and modification time is not noticed
+        stat = os.stat(json_path)
+        with open(json_path, "r") as f:
+            text = f.read()
+        with open(json_path, "w") as f:
+            f.write(text.replace("Exercise", "Exorcise"))
+        os.utime(json_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        for lazy in [False, True]:
+            loaded = Storage(self.test_data_dir, lazy=lazy, state_cache=True)
+            loaded.load()
+            habit = loaded.get_habit(self.daily_habit.id)
+            self.assertEqual(habit.name, "Exercise")
+            self.assertEqual(list(habit.completions), list(self.daily_habit.completions))
+
+        # any other change of habits.json rebuilds the cache
+        os.utime(json_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        loaded = Storage(self.test_data_dir, state_cache=True)
+        loaded.load()
+        self.assertEqual(loaded.get_habit(self.daily_habit.id).name, "Exorcise")
+
+        # a damaged cache falls back to habits.json
+        with open(cache_path, "r+b") as f:
+            f.seek(24)
+            f.write(b"broken")
+        loaded = Storage(self.test_data_dir, state_cache=True)
+        loaded.load()
+        self.assertEqual(len(loaded.get_habit(self.daily_habit.id).completions), 1)
+
+        # a cache that cannot be written only means there is no cache, the habits still load
+        os.remove(cache_path)
+        with mock.patch("os.replace", side_effect=FileNotFoundError("gone")):
+            loaded = Storage(self.test_data_dir, state_cache=True)
+            loaded.load()
+        self.assertEqual(len(loaded.get_all_habits()), 1)
+        self.assertFalse(os.path.exists(cache_path))
+        self.assertFalse([name for name in os.listdir(self.test_data_dir) if name.endswith(".tmp")])
+
+    def test_lookup_by_id_and_name(self):
+        """test looking habits up by ID and by normalized name."""
+        storage = Storage(self.test_data_dir)
+        storage.add_habit(self.daily_habit)
+        storage.add_habit(self.weekly_habit)
+
+        self.assertIs(storage.get_habit(self.weekly_habit.id), self.weekly_habit)
+        self.assertIs(storage.get_habit_by_name("  clean HOUSE "), self.weekly_habit)
+        self.assertIsNone(storage.get_habit_by_name("Read Book"))
+
+        self.assertTrue(storage.remove_habit(self.weekly_habit.id))
+        self.assertFalse(storage.remove_habit(self.weekly_habit.id))
+        self.assertIsNone(storage.get_habit(self.weekly_habit.id))
+        self.assertIsNone(storage.get_habit_by_name("Clean House"))
+
+        # the indexes are rebuilt on load
+        loaded = Storage(self.test_data_dir)
+        loaded.load()
+        self.assertEqual(loaded.get_habit_by_name("exercise").id, self.daily_habit.id)
+        self.assertEqual([habit.name for habit in loaded.get_all_habits()], ["Exercise"])
+
+    def test_lazy_load(self):
+        """test that lazily loaded completions are parsed on first access."""
+        for backend in ["json", "sqlite"]:
+            storage = create_storage(backend, self.test_data_dir)
+            new_habit = Habit("Exercise", "Do 30 minutes of exercise", "daily")
+            storage.add_habit(new_habit)
+            timestamp = storage.complete_habit(new_habit)
+
+            loaded = create_storage(backend, self.test_data_dir, lazy=True)
+            loaded.load()
+            habit = loaded.get_habit(new_habit.id)
+            self.assertFalse(habit.completions_loaded)
+            self.assertEqual(habit.name, "Exercise")
+
+            self.assertTrue(habit.is_complete_for_period())
+            self.assertTrue(habit.completions_loaded)
+            self.assertEqual(list(habit.completions), [timestamp])
+
+    def test_write_behind(self):
+        """test that write-behind mode coalesces changes until a flush."""
+        storage = Storage(self.test_data_dir, write_behind=True, flush_interval=60, flush_batch=3)
+        path = os.path.join(self.test_data_dir, "habits.json")
+
+        storage.add_habit(self.daily_habit)
+        storage.complete_habit(self.daily_habit)
+        self.assertTrue(storage.dirty)
+        self.assertFalse(os.path.exists(path))
+
+        # the third change fills the batch
+        storage.add_habit(self.weekly_habit)
+        self.assertFalse(storage.dirty)
+        self.assertTrue(os.path.exists(path))
+
+        storage.complete_habit(self.weekly_habit)
+        storage.close()
+        loaded = Storage(self.test_data_dir)
+        loaded.load()
+        self.assertEqual(len(loaded.get_habit(self.weekly_habit.id).completions), 1)
+
+        # flushes from the timer thread are serialized with the other methods
+        self.assertTrue(storage.thread_safe)
+        self.assertFalse(Storage(self.test_data_dir, write_behind=True, flush_interval=None).thread_safe)
+
+    def test_write_behind_background_flush(self):
+        """test that pending changes are flushed after the interval."""
+        storage = create_storage("journal", self.test_data_dir, write_behind=True, flush_interval=0.01)
+        storage.add_habit(self.daily_habit)
+        storage.complete_habit(self.daily_habit)
+
+        for _ in range(100):
+            if not storage.dirty:
+                break
+            time.sleep(0.01)
+        self.assertFalse(storage.dirty)
+
+        # waits for a write that is still in progress
+        storage.flush()
+        self.assertEqual(storage.journal_events, 2)
+        storage.close()
+
+    def test_journal_appends_completions(self):
+        """test that the journal storage appends instead of rewriting the snapshot."""
+        storage = create_storage("journal", self.test_data_dir)
+        storage.add_habit(self.daily_habit)
+        storage.add_habit(self.weekly_habit)
+        storage.complete_habit(self.daily_habit)
+        storage.remove_habit(self.weekly_habit.id)
+
+        # nothing has been compacted into a snapshot yet
+        self.assertFalse(os.path.exists(os.path.join(self.test_data_dir, "habits.json")))
+        self.assertEqual(storage.journal_events, 4)
+
+        loaded = create_storage("journal", self.test_data_dir)
+        loaded.load()
+        self.assertEqual(len(loaded.get_all_habits()), 1)
+        self.assertEqual(len(loaded.get_habit(self.daily_habit.id).completions), 1)
+
+        # an append only marks the habits it wrote as synced
+        loaded.add_habit(self.weekly_habit)
+        with mock.patch.object(Habit, "mark_clean", autospec=True) as mark_clean:
+            loaded.complete_habit(self.weekly_habit)
+        mark_clean.assert_called_once_with(self.weekly_habit)
+        self.assertEqual(loaded._synced_ids, {self.daily_habit.id, self.weekly_habit.id})
+
+    def test_journal_compaction(self):
+        """test that the journal is folded into the snapshot."""
+        storage = create_storage("journal", self.test_data_dir, compact_every=3)
+        storage.add_habit(self.daily_habit)
+        storage.complete_habit(self.daily_habit)
+        storage.complete_habit(self.daily_habit)
+
+        self.assertEqual(storage.journal_events, 0)
+        self.assertEqual(os.path.getsize(os.path.join(self.test_data_dir, "habits.journal")), 0)
+
+        loaded = create_storage("journal", self.test_data_dir)
+        loaded.load()
+        self.assertEqual(len(loaded.get_habit(self.daily_habit.id).completions), 2)
+
+    def test_journal_ignores_partial_line(self):
+        """test that a partially written journal line is skipped on load."""
+        storage = create_storage("journal", self.test_data_dir)
+        storage.add_habit(self.daily_habit)
+        with open(os.path.join(self.test_data_dir, "habits.journal"), "a") as f:
+            f.write('{"event": "completed", "id"')
+
+        loaded = create_storage("journal", self.test_data_dir)
+        loaded.load()
+        self.assertEqual(len(loaded.get_all_habits()), 1)
+        self.assertEqual(len(loaded.get_habit(self.daily_habit.id).completions), 0)
+
+    def test_sqlite_storage(self):
+        """test the SQLite storage and its indexed queries."""
+        storage = create_storage("sqlite", self.test_data_dir)
+        storage.add_habit(self.daily_habit)
+        storage.add_habit(self.weekly_habit)
+        timestamp = storage.complete_habit(self.daily_habit)
+        self.weekly_habit.completions.append(timestamp - timedelta(days=14))
+        storage.save()
+
+        self.assertEqual(storage.get_completed_habit_ids(), {self.daily_habit.id})
+        self.assertEqual(storage.count_completions(self.daily_habit.id, timestamp, timestamp + timedelta(seconds=1)), 1)
+        self.assertEqual(storage.count_completions(self.weekly_habit.id, timestamp - timedelta(days=30), timestamp), 1)
+        storage.close()
+
+        loaded = create_storage("sqlite", self.test_data_dir)
+        loaded.load()
+        self.assertEqual([habit.name for habit in loaded.get_all_habits()], ["Exercise", "Clean House"])
+        self.assertEqual(list(loaded.get_habit(self.daily_habit.id).completions), [timestamp])
+
+        # removed habits are dropped together with their completions
+        loaded.remove_habit(self.daily_habit.id)
+        self.assertEqual(loaded.count_completions(self.daily_habit.id, timestamp, timestamp + timedelta(seconds=1)), 0)
+        self.assertEqual(len(loaded.get_all_habits()), 1)
+        loaded.close()
+
+    def test_completion_queries(self):
+        """test the in-memory completion queries."""
+        storage = Storage(self.test_data_dir)
+        storage.add_habit(self.daily_habit)
+        storage.add_habit(self.weekly_habit)
+        today = datetime.now()
+        self.weekly_habit.completions.append(today)
+
+        self.assertEqual(storage.get_completed_habit_ids(today), {self.weekly_habit.id})
+        self.assertEqual(storage.count_completions(self.weekly_habit.id, today - timedelta(days=1), today), 0)
+        self.assertEqual(storage.count_completions(self.weekly_habit.id, today, today + timedelta(days=1)), 1)
+
+    def test_sharded_storage(self):
+        """test that users get separate shards and old shards are evicted."""
+        storage = ShardedStorage(self.test_data_dir, max_open=1)
+        storage.get_user_storage("alice").add_habit(self.daily_habit)
+        storage.get_user_storage("bob").add_habit(self.weekly_habit)
+
+        # only the most recently used shard stays open
+        self.assertEqual(list(storage.shards), ["bob"])
+        self.assertEqual(storage.get_user_ids(), ["alice", "bob"])
+
+        alice = storage.get_user_storage("alice")
+        self.assertEqual([habit.name for habit in alice.get_all_habits()], ["Exercise"])
+        self.assertEqual(list(storage.shards), ["alice"])
+
+        with self.assertRaises(ValueError):
+            storage.get_user_storage("../alice")
+        storage.close()
+        self.assertEqual(len(storage.shards), 0)
+
+        # a shard in use is only closed when its block ends
+        storage = ShardedStorage(os.path.join(self.test_data_dir, "sqlite"), backend="sqlite", max_open=1)
+        with storage.user_storage("alice") as alice:
+            storage.get_user_storage("bob")
+            self.assertEqual(list(storage.shards), ["bob"])
+            alice.add_habit(self.daily_habit)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            alice.connection.execute("SELECT 1")
+
+        # a slow shard load does not hold up other users
+        started, done = threading.Event(), threading.Event()
+
+        def slow_create_storage(backend, data_dir, **options):
+            if data_dir.endswith("slow"):
+                started.set()
+                done.wait(5)
+            return create_storage(backend, data_dir, **options)
+
+        with mock.patch("sharded_storage.create_storage", slow_create_storage):
+            thread = threading.Thread(target=storage.get_user_storage, args=("slow",))
+            thread.start()
+            started.wait(5)
+            self.assertEqual(len(storage.get_user_storage("alice").get_all_habits()), 1)
+            self.assertTrue(thread.is_alive())
+            done.set()
+            thread.join()
+        self.assertEqual(list(storage.shards), ["slow"])
+        storage.close()
+
+    def test_directory_storage_writes_changed_habits(self):
+        """test that the directory backend only rewrites the habits that changed."""
+        storage = create_storage("directory", self.test_data_dir)
+        storage.add_habit(self.daily_habit)
+        storage.add_habit(self.weekly_habit)
+
+        instrument.enable()
+        try:
+            storage.complete_habit(self.weekly_habit)
+            storage.save()
+            self.daily_habit.name = "Run"
+            storage.save()
+            storage.remove_habit(self.weekly_habit.id)
+            counters = instrument.get_report()['counters']
+        finally:
+            instrument.disable()
+            instrument.reset()
+        self.assertEqual(counters['directory_storage.habits_written'], 2)
+        self.assertEqual(os.listdir(os.path.join(self.test_data_dir, "habits")), [self.daily_habit.id + ".json"])
+
+        loaded = create_storage("directory", self.test_data_dir, lazy=True)
+        loaded.load()
+        self.assertEqual([habit.name for habit in loaded.get_all_habits()], ["Run"])
+        self.assertFalse(loaded.get_all_habits()[0].dirty)
+
+        # IDs that are no safe file names, e.g. from an import, are hashed
+        for habit_id in ["a b", "../escape", ".hidden"]:
+            habit = Habit(habit_id, "", "daily")
+            habit.id = habit_id
+            storage.add_habit(habit)
+        storage.complete_habit(self.daily_habit)
+        self.assertEqual(len(os.listdir(os.path.join(self.test_data_dir, "habits"))), 4)
+        loaded = create_storage("directory", self.test_data_dir)
+        loaded.load()
+        self.assertEqual([habit.id for habit in loaded.get_all_habits()][1:], ["a b", "../escape", ".hidden"])
+        self.assertEqual(len(loaded.get_habit(self.daily_habit.id).completions), 1)
+
+    def test_retention(self):
+        """test that archiving old completions keeps streaks and long-range analytics."""
+        today = datetime.now()
+        # a daily run crossing the horizon, a gap, older days with two completions and weekly ones
+        self.daily_habit.completions = (
+            [today - timedelta(days=days_ago) for days_ago in range(150)]
+            + [today - timedelta(days=days_ago, hours=hours) for days_ago in range(160, 400) for hours in [0, 1]]
+        )
+        self.weekly_habit.completions = [today - timedelta(weeks=weeks_ago) for weeks_ago in range(0, 60, 2)]
+        habits = [self.daily_habit, self.weekly_habit]
+        start, end = today - timedelta(days=500), today + timedelta(days=1)
+
+        def summarize(storage):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                return [
+                    [storage.get_habit(habit.id).get_streaks() for habit in habits],
+                    [storage.get_habit(habit.id).get_completion_counts() for habit in habits],
+                    [storage.count_completions(habit.id, start, end) for habit in habits],
+                    analytics.get_completion_rate(storage, 365),
+                    analytics.get_completion_rate(storage, 365, use_numpy=True),
+                    analytics.get_completion_rate(storage, 365, executor=executor),
+                    analytics.get_all_streaks(storage),
+                    analytics.get_all_streaks(storage, use_numpy=True),
+                    analytics.get_all_streaks(storage, executor=executor),
+                    analytics.get_completion_histogram(storage, 60),
+                    analytics.get_window_stats(storage, start, end, 'month'),
+                ]
+
+        for backend in ["json", "directory"]:
+            data_dir = os.path.join(self.test_data_dir, backend)
+            storage = create_storage(backend, data_dir)
+            storage._set_habits(Habit.from_dict(habit.to_dict()) for habit in habits)
+            storage.save()
+            expected = summarize(storage)
+
+            total = sum(len(habit.completions) for habit in habits)
+            archived = storage.apply_retention(90)
+            self.assertEqual(archived, total - sum(len(habit.completions) for habit in storage.get_all_habits()))
+            self.assertGreater(archived, 2 * 240)
+            self.assertEqual(storage.apply_retention(90), 0)
+            self.assertLess(len(storage.get_habit(self.daily_habit.id).completions), 100)
+            self.assertEqual(summarize(storage), expected)
+
+            # archive.json is loaded back, and raw completions before the horizon are not counted twice
+            stale = create_storage(backend, data_dir, locking=False)
+            stale._set_habits(Habit.from_dict(habit.to_dict()) for habit in habits)
+            loaded = create_storage(backend, data_dir)
+            loaded.load()
+            loaded._merge(stale)
+            self.assertEqual(summarize(loaded), expected)
+
+        with self.assertRaises(ValueError):
+            create_storage("sqlite", self.test_data_dir, retention_days=90)
+
+    def test_concurrent_writers_merge(self):
+        """test that storages of one data directory keep each other's changes."""
+        for backend in ["json", "journal", "directory"]:
+            shutil.rmtree(self.test_data_dir)
+            first = create_storage(backend, self.test_data_dir)
+            first.add_habit(Habit("Exercise", "", "daily"))
+            first.add_habit(Habit("Clean House", "", "weekly"))
+            second = create_storage(backend, self.test_data_dir)
+            second.load()
+
+            exercise = first.get_habit_by_name("Exercise")
+            first.add_completions({exercise: [datetime(2024, 1, 1)]})
+            first.add_habit(Habit("Read", "", "daily"))
+            second.remove_habit(second.get_habit_by_name("Clean House").id)
+            second.add_completions({second.get_habit_by_name("Exercise"): [datetime(2024, 1, 2)]})
+            # a full save neither brings back the deleted habit nor drops the new one
+            first.save()
+
+            loaded = create_storage(backend, self.test_data_dir)
+            loaded.load()
+            self.assertEqual(sorted(habit.name for habit in loaded.get_all_habits()), ["Exercise", "Read"])
+            self.assertEqual(len(loaded.get_habit_by_name("Exercise").completions), 2)
+            self.assertEqual(loaded.generation, first.generation)
+
+    def test_concurrent_processes(self):
+        """test that completions written by several processes at once are all kept."""
+        for backend in ["json", "journal", "directory"]:
+            shutil.rmtree(self.test_data_dir)
+            storage = create_storage(backend, self.test_data_dir)
+            habit = Habit("Exercise", "", "daily")
+            storage.add_habit(habit)
+
+            with ProcessPoolExecutor(max_workers=3) as executor:
+                futures = [
+                    executor.submit(complete_in_process, self.test_data_dir, backend, habit.id, worker * 10, 10)
+                    for worker in range(3)
+                ]
+                for future in futures:
+                    future.result()
+
+            loaded = create_storage(backend, self.test_data_dir)
+            loaded.load()
+            self.assertEqual(len(loaded.get_habit(habit.id).completions), 30)
+
+    def test_thread_safe_mode(self):
+        """test that threads can share a write-behind storage."""
+        storage = Storage(self.test_data_dir, write_behind=True, flush_interval=0.001, flush_batch=7,
+                          thread_safe=True)
+        storage.add_habit(self.daily_habit)
+
+        def complete(first_day):
+            for day in range(first_day, first_day + 50):
+                storage.add_completions({self.daily_habit: [datetime(2024, 1, 1) + timedelta(days=day)]})
+                storage.add_habit(Habit(f"Habit {first_day + day}", "", "daily"))
+
+        threads = [threading.Thread(target=complete, args=(first_day,)) for first_day in range(0, 200, 50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        storage.close()
+
+        loaded = Storage(self.test_data_dir)
+        loaded.load()
+        self.assertEqual(len(loaded.get_habit(self.daily_habit.id).completions), 200)
+        self.assertEqual(len(loaded.get_all_habits()), 201)
+
+if __name__ == "__main__":
+    unittest.main()
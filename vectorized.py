@@ -0,0 +1,194 @@
+from datetime import datetime
+from habit import EPOCH_ORDINAL, MICROSECONDS_PER_DAY, period_ordinal
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, analytics falls back to pure Python without it
+    np = None
+
+HAS_NUMPY = np is not None
+
+def _habit_days(habit):
+    """
+    get the day ordinal of every completion of a habit, archived ones included
+
+    Args:
+        habit: the habit
+
+    Returns:
+        numpy array of day ordinals in ascending order
+    """
+    days = EPOCH_ORDINAL + np.asarray(habit.get_unarchived_stamps(), dtype=np.int64) // MICROSECONDS_PER_DAY
+    if habit.archive is None:
+        return days
+    # an archived day is repeated once per completion on it
+    archived = habit.archive.rollup.days
+    counts = np.diff(np.asarray(archived.prefix, dtype=np.int64))
+    return np.concatenate([np.repeat(np.asarray(archived.ordinals, dtype=np.int64), counts), days])
+
+def _flatten(habits, today):
+    """
+    turn the completions of all habits into flat numpy arrays
+
+    Args:
+        habits: list of habits
+        today: the current date
+
+    Returns:
+        tuple of (habit index per completion, period ordinal per completion,
+        current period ordinal per habit)
+    """
+    weekly = np.array([habit.periodicity == 'weekly' for habit in habits], dtype=bool)
+    habit_days = [_habit_days(habit) for habit in habits]
+    lengths = np.array([len(days) for days in habit_days], dtype=np.int64)
+    days = np.concatenate(habit_days + [np.zeros(0, dtype=np.int64)])
+
+    index = np.repeat(np.arange(len(habits)), lengths)
+    ordinals = np.where(weekly[index], (days - 1) // 7, days)
+    current = np.where(weekly, period_ordinal(today, 'weekly'), period_ordinal(today, 'daily'))
+    return index, ordinals, current
+
+def _keys(index, ordinals, low, high):
+    """
+    combine habit index and ordinal into one sortable key per completion
+
+    Args:
+        index: habit index per completion
+        ordinals: period ordinal per completion
+        low: lowest ordinal any query will ask for
+        high: highest ordinal any query will ask for
+
+    Returns:
+        tuple of (keys, base ordinal, key span per habit). the keys are in
+        ascending order, as every habit's completions are sorted
+    """
+    if len(ordinals):
+        low = min(low, int(ordinals.min()))
+        high = max(high, int(ordinals.max()))
+    # the extra slot keeps runs of neighbouring habits from touching
+    span = high - low + 2
+    return index * span + (ordinals - low), low, span
+
+def _distinct(keys):
+    """
+    drop repeated keys
+
+    Args:
+        keys: keys in ascending order, as returned by _keys
+
+    Returns:
+        the distinct keys in ascending order
+    """
+    # cheaper than np.unique, which would sort again
+    if not len(keys):
+        return keys
+    return keys[np.r_[True, np.diff(keys) != 0]]
+
+def completion_rates(habits, days, today=None):
+    """
+    Calculate completion rates for all habits at once, see analytics.get_completion_rate
+
+    Args:
+        habits: list of habits
+        days: number of days to look back
+        today: the current date, now by default
+
+    Returns:
+        Dictionary that maps habit names to completion rates (0-100%)
+    """
+    if not habits:
+        return {}
+    if today is None:
+        today = datetime.now()
+
+    index, ordinals, current = _flatten(habits, today)
+    weekly = np.array([habit.periodicity == 'weekly' for habit in habits], dtype=bool)
+    total = np.where(weekly, days // 7, days)
+    first = current - total + 1
+
+    keys, base, span = _keys(index, ordinals, int(first.min()), int(current.max()))
+    completed_keys = _distinct(keys)
+
+    # count the distinct completed periods inside each habit's window
+    offsets = np.arange(len(habits)) * span
+    low = np.searchsorted(completed_keys, offsets + (first - base), side='left')
+    high = np.searchsorted(completed_keys, offsets + (current - base) + 1, side='left')
+    completed = high - low
+
+    rates = np.where(total > 0, completed / np.maximum(total, 1) * 100, 0.0)
+    return {habit.name: float(rate) for habit, rate in zip(habits, rates)}
+
+def streaks(habits, today=None):
+    """
+    Calculate the current and longest streak of all habits at once
+
+    Args:
+        habits: list of habits
+        today: the current date, now by default
+
+    Returns:
+        Dictionary that maps habit names to (current streak, longest streak)
+    """
+    if not habits:
+        return {}
+    if today is None:
+        today = datetime.now()
+
+    index, ordinals, current = _flatten(habits, today)
+    keys, base, span = _keys(index, ordinals, int(current.min()), int(current.max()))
+    completed_keys = _distinct(keys)
+
+    current_streak = np.zeros(len(habits), dtype=np.int64)
+    longest_streak = np.zeros(len(habits), dtype=np.int64)
+
+    if len(completed_keys):
+        habit_of_key = completed_keys // span
+        ordinal_of_key = completed_keys % span + base
+
+        # a run starts wherever the key does not follow on from the previous one
+        starts = np.ones(len(completed_keys), dtype=bool)
+        starts[1:] = np.diff(completed_keys) != 1
+        run_starts = np.flatnonzero(starts)
+        run_lengths = np.diff(np.append(run_starts, len(completed_keys)))
+        run_habits = habit_of_key[run_starts]
+        run_first = ordinal_of_key[run_starts]
+
+        np.maximum.at(longest_streak, run_habits, run_lengths)
+
+        # at most one run per habit covers the current period
+        run_current = current[run_habits]
+        covering = (run_first <= run_current) & (run_current < run_first + run_lengths)
+        current_streak[run_habits[covering]] = (run_current - run_first + 1)[covering]
+
+    return {
+        habit.name: (int(current_length), int(longest_length))
+        for habit, current_length, longest_length in zip(habits, current_streak, longest_streak)
+    }
+
+def completion_histograms(habits, periods, today=None):
+    """
+    Count the completions per period over the most recent periods for all habits at once
+
+    Args:
+        habits: list of habits
+        periods: number of periods to count, including the current one
+        today: the current date, now by default
+
+    Returns:
+        Dictionary that maps habit names to lists of counts, oldest period first
+    """
+    if not habits:
+        return {}
+    if today is None:
+        today = datetime.now()
+
+    index, ordinals, current = _flatten(habits, today)
+    offsets = ordinals - (current[index] - periods + 1)
+    inside = (offsets >= 0) & (offsets < periods)
+
+    counts = np.bincount(
+        index[inside] * periods + offsets[inside],
+        minlength=len(habits) * periods
+    ).reshape(len(habits), periods)
+    return {habit.name: row.tolist() for habit, row in zip(habits, counts)}